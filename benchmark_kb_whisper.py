@@ -0,0 +1,134 @@
+"""
+Benchmark för KB-Whisper på CPU/GPU
+Mäter real-time factor (RTF = bearbetningstid / ljudlängd) per modellstorlek,
+inferensmotor och batchstorlek. RTF under 1.0 betyder snabbare än realtid.
+Word error rate (WER) räknas mot en referenstext om en sådan anges, annars mot
+transformers-motorns utskrift för samma modell.
+
+Användning:
+    python benchmark_kb_whisper.py inspelning.wav
+    python benchmark_kb_whisper.py inspelning.wav --sizes tiny base small --batch-sizes 1 4 8
+    python benchmark_kb_whisper.py inspelning.wav --sizes medium --engines transformers int8 onnx --reference facit.txt
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from utils.transcript_stitching import normalize_word
+
+
+def word_error_rate(reference, hypothesis):
+    """WER = (ersättningar + borttagningar + tillägg) / antal ord i referensen"""
+    ref = [w for w in (normalize_word(w) for w in reference.split()) if w]
+    hyp = [w for w in (normalize_word(w) for w in hypothesis.split()) if w]
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    # Levenshtein-avstånd på ordnivå, en rad i taget
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            ))
+        previous = current
+    return previous[-1] / len(ref)
+
+def benchmark(audio_file_path, sizes, engines, batch_sizes, reference=None):
+    """Kör varje kombination av modell, motor och batchstorlek och returnerar resultaten"""
+    import librosa
+    import torch
+    from utils import kb_whisper
+
+    duration_seconds = librosa.get_duration(path=audio_file_path)
+    print(f"🎧 Ljudfil: {audio_file_path} ({duration_seconds:.1f} s)")
+    print(f"🖥️  Device: {'GPU' if torch.cuda.is_available() else 'CPU'}\n")
+
+    results = []
+    for size in sizes:
+        os.environ['KB_WHISPER_MODEL'] = size
+        size_reference = reference
+
+        for engine in engines:
+            os.environ['KB_WHISPER_ENGINE'] = engine
+            kb_whisper.unload_kb_whisper_model()
+
+            started_at = time.perf_counter()
+            model, processor, pipe = kb_whisper.load_kb_whisper_model()
+            load_seconds = time.perf_counter() - started_at
+            if pipe is None:
+                print(f"  ❌ Kunde inte ladda modell: {size} ({engine})")
+                continue
+
+            for batch_size in batch_sizes:
+                os.environ['KB_WHISPER_BATCH_SIZE'] = str(batch_size)
+
+                started_at = time.perf_counter()
+                text = kb_whisper._run_kb_whisper_pipeline(pipe, kb_whisper._pipeline_input(audio_file_path))
+                elapsed = time.perf_counter() - started_at
+
+                # Utan facit jämförs övriga motorer mot första körningen
+                if size_reference is None:
+                    size_reference = text
+
+                results.append({
+                    "size": size,
+                    "engine": engine,
+                    "batch_size": batch_size,
+                    "threads": torch.get_num_threads(),
+                    "load_seconds": load_seconds,
+                    "seconds": elapsed,
+                    "rtf": elapsed / duration_seconds,
+                    "wer": word_error_rate(size_reference, text),
+                    "words": len(text.split())
+                })
+                print(f"  ✅ {size:<7} {engine:<13} batch={batch_size:<3} {elapsed:7.1f} s  RTF={elapsed / duration_seconds:.3f}")
+
+    kb_whisper.unload_kb_whisper_model()
+    return results
+
+def print_table(results):
+    print("\n" + "=" * 89)
+    print("📊 RESULTAT")
+    print("=" * 89)
+    print(f"{'Modell':<8}{'Motor':<14}{'Batch':>6}{'Trådar':>8}{'Laddning':>10}{'Tid':>10}{'RTF':>8}{'WER':>8}{'Ord':>8}")
+    for r in results:
+        print(
+            f"{r['size']:<8}{r['engine']:<14}{r['batch_size']:>6}{r['threads']:>8}{r['load_seconds']:>9.1f}s"
+            f"{r['seconds']:>9.1f}s{r['rtf']:>8.3f}{r['wer']:>8.1%}{r['words']:>8}"
+        )
+    print("=" * 89)
+
+def main():
+    from utils.kb_whisper import KB_WHISPER_MODELS, KB_WHISPER_ENGINES
+
+    parser = argparse.ArgumentParser(description="Benchmark för KB-Whisper (real-time factor)")
+    parser.add_argument("audio", help="Ljudfil att transkribera")
+    parser.add_argument("--sizes", nargs="+", default=list(KB_WHISPER_MODELS), choices=list(KB_WHISPER_MODELS),
+                        help="Modellstorlekar att testa")
+    parser.add_argument("--engines", nargs="+", default=["transformers"], choices=KB_WHISPER_ENGINES,
+                        help="Inferensmotorer att jämföra (utan --reference blir den första motorn referens)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4],
+                        help="Batchstorlekar att testa")
+    parser.add_argument("--reference", help="Textfil med korrekt utskrift för WER")
+    args = parser.parse_args()
+
+    reference = None
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = f.read()
+
+    if not os.path.exists(args.audio):
+        print(f"❌ Filen finns inte: {args.audio}")
+        return 1
+
+    print_table(benchmark(args.audio, args.sizes, args.engines, args.batch_sizes, reference))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Anrop från startsidan hör inte till något steg (sidan Prestanda)
+from utils.telemetry import set_telemetry_step
+set_telemetry_step(None)
+
 # Ladda CSS
 def load_css():
     css_path = os.path.join(os.path.dirname(__file__), "assets", "style.css")
@@ -24,6 +28,17 @@ load_css()
 # Initialisera session
 init_session()
 
+# Rensa kvarvarande ljudlänkar i static/audio (en gång per process)
+from utils.audio_metadata import remove_static_audio_links
+remove_static_audio_links()
+
+# Värm upp KB-Whisper i bakgrunden så att första transkriberingen slipper ladda modellen
+from utils.audio_handler import get_transcription_backend
+from utils.transcription_worker import is_kb_whisper_preload_enabled
+if get_transcription_backend() in ('kb-whisper', 'auto') and is_kb_whisper_preload_enabled():
+    from utils.transcription_worker import preload_kb_whisper
+    preload_kb_whisper()
+
 # Hämta current session först (innan sidebar)
 current_session = get_current_session()
 
@@ -52,6 +67,21 @@ with st.sidebar:
         """)
         st.stop()
 
+    # KB-Whisper status
+    if get_transcription_backend() in ('kb-whisper', 'auto'):
+        from utils.kb_whisper import get_kb_whisper_health
+        health = get_kb_whisper_health()
+        if health['status'] == 'missing':
+            st.caption("⚠️ KB-Whisper är inte installerat")
+        elif health['status'] == 'ok':
+            st.caption(f"🟢 KB-Whisper redo ({health['model_id']}, uppvärmd på {health['warmup_seconds']:.0f} s)")
+        elif health['status'] == 'warming':
+            st.caption(f"🟡 KB-Whisper värms upp ({health['model_id']})...")
+        elif health['status'] == 'error':
+            st.caption(f"🔴 KB-Whisper kunde inte värmas upp: {health['error']}")
+        else:
+            st.caption("⚪ KB-Whisper laddas vid första transkribering")
+
     st.divider()
 
     # Aktuell samtal info
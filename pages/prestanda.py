@@ -0,0 +1,121 @@
+import streamlit as st
+from utils.telemetry import (
+    set_telemetry_step, load_call_metrics, summarize_call_metrics, is_telemetry_enabled,
+    get_admin_password, is_admin_password
+)
+from utils.llm_cache import get_llm_cache_stats
+
+# Konfigurera sida
+st.set_page_config(
+    page_title="Prestanda",
+    page_icon=None,
+    layout="wide"
+)
+
+set_telemetry_step(None)
+
+PERIODS = {
+    "Senaste 24 timmarna": 24 * 3600,
+    "Senaste 7 dagarna": 7 * 24 * 3600,
+    "Senaste 30 dagarna": 30 * 24 * 3600,
+}
+
+SERVICE_NAMES = {
+    "openai-chat": "GPT",
+    "openai-whisper": "Whisper-API",
+    "kb-whisper": "KB-Whisper",
+}
+
+# Header
+st.title("Prestanda")
+st.markdown("Latens och genomströmning för GPT- och Whisper-anrop per steg")
+
+if st.button("🏠 Start"):
+    st.switch_page("main.py")
+
+# Mätvärden och felmeddelanden gäller alla samtal - endast för administratörer
+if not get_admin_password():
+    st.info("ℹ️ Sidan är avstängd. Sätt ADMIN_PASSWORD i .env för att visa den.")
+    st.stop()
+
+if not st.session_state.get("prestanda_admin"):
+    password = st.text_input("Lösenord", type="password")
+    if password and is_admin_password(password):
+        st.session_state["prestanda_admin"] = True
+        st.rerun()
+    elif password:
+        st.error("❌ Fel lösenord")
+    st.stop()
+
+if not is_telemetry_enabled():
+    st.info("ℹ️ Mätningen är avstängd (TELEMETRY=false) - nya anrop loggas inte.")
+
+period = st.selectbox("Period", list(PERIODS.keys()))
+metrics = load_call_metrics(PERIODS[period])
+
+st.markdown("---")
+
+if metrics.empty:
+    st.info("ℹ️ Inga anrop loggade under perioden ännu.")
+    st.stop()
+
+# Översikt
+calls = metrics[~metrics["cache_hit"].astype(bool)]
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Anrop", len(metrics))
+with col2:
+    st.metric("p50-latens", f"{calls['latency_seconds'].quantile(0.5):.1f} s" if not calls.empty else "-")
+with col3:
+    st.metric("p95-latens", f"{calls['latency_seconds'].quantile(0.95):.1f} s" if not calls.empty else "-")
+with col4:
+    st.metric("Fel", f"{1.0 - metrics['success'].astype(bool).mean():.0%}")
+
+# Per steg och tjänst - cacheträffar räknas i anrop men inte i latensen
+st.subheader("📊 Per steg")
+summary = summarize_call_metrics(calls, by=("step", "service", "operation"))
+hits = metrics[metrics["cache_hit"].astype(bool)].assign(step=lambda m: m["step"].fillna(0).astype(int))
+hit_counts = hits.groupby(["step", "service", "operation"]).size()
+if not summary.empty:
+    summary["cacheträffar"] = [
+        hit_counts.get((row.step, row.service, row.operation), 0) for row in summary.itertuples()
+    ]
+    summary["step"] = summary["step"].map(lambda step: f"Steg {step}" if step else "-")
+    summary["service"] = summary["service"].map(lambda service: SERVICE_NAMES.get(service, service))
+    st.dataframe(
+        summary.rename(columns={"step": "steg", "service": "tjänst", "operation": "anrop_typ"}),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    st.subheader("⏱️ p95-latens per steg (s)")
+    by_step = summarize_call_metrics(calls, by=("step", "service"))
+    by_step["step"] = by_step["step"].map(lambda step: f"Steg {step}" if step else "-")
+    st.bar_chart(by_step.pivot(index="step", columns="service", values="p95_s"))
+else:
+    st.info("ℹ️ Alla anrop under perioden besvarades ur cachen.")
+
+# Cacheträffar
+st.subheader("⚡ Cache")
+col1, col2 = st.columns(2)
+with col1:
+    transcript_hits = hits[hits["service"] != "openai-chat"]
+    st.metric("Transkriberingar ur cachen", len(transcript_hits))
+with col2:
+    cache_stats = get_llm_cache_stats()
+    st.metric(
+        "GPT-svar ur cachen (sedan omstart)",
+        f"{cache_stats['hit_rate']:.0%}",
+        help=f"{cache_stats['entries']} sparade svar, {cache_stats['size_bytes'] / 1024 / 1024:.1f} MB"
+    )
+
+# Senaste fel
+errors = metrics[~metrics["success"].astype(bool)]
+if not errors.empty:
+    with st.expander(f"⚠️ Senaste fel ({len(errors)})"):
+        st.dataframe(
+            errors.sort_values("created_at", ascending=False)
+            .head(20)[["service", "operation", "step", "retries", "error"]],
+            use_container_width=True,
+            hide_index=True
+        )
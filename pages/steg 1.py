@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.session_manager import get_current_session, is_step_accessible
-from utils.ai_helper import get_ai_suggestion_steg1
+from utils.ai_helper import get_ai_suggestion_steg1, write_ai_stream
 from utils.database import update_session_step1
 from utils.audio_text_input import audio_text_input
 
@@ -11,6 +11,10 @@ st.set_page_config(
     layout="wide"
 )
 
+# Externa anrop härifrån loggas som steg 1 (sidan Prestanda)
+from utils.telemetry import set_telemetry_step
+set_telemetry_step(1)
+
 # Kontrollera åtkomst
 if not is_step_accessible(1):
     st.error("Du har inte åtkomst till detta steg ännu.")
@@ -105,44 +109,63 @@ with st.form("problem_form"):
     # Submit knapp
     submit_button = st.form_submit_button("Få förslag", type="primary")
 
+def create_ai_suggestion(pb, personal_grupp, kontext):
+    """Skapa AI-förslag för problembeskrivningen och visa dem när de är klara"""
+    st.session_state.current_problem = pb
+    st.session_state.current_personal_grupp = personal_grupp
+    st.session_state.current_kontext = kontext
+    with st.spinner("AI analyserar ditt problem och skapar förslag..."):
+        ai_suggestion = write_ai_stream(get_ai_suggestion_steg1(pb, personal_grupp, kontext, stream=True))
+        if ai_suggestion:
+            st.session_state.ai_suggestion_steg1 = ai_suggestion
+            st.rerun()
+        else:
+            st.error("Kunde inte hämta AI-förslag. Kontrollera din internetanslutning och API-nyckel.")
+
 # Hantera formulärinlämning
 if submit_button:
     pb = (problem_beskrivning or "").strip()
-    # Om ljudfil är uppladdad, transkribera den nu
+    # Om ljudfil är uppladdad transkriberas den i bakgrundskön - förslagen skapas när den är klar
     uploaded_audio = st.session_state.get('audio_upload_steg1_form')
     if uploaded_audio:
-        from utils.audio_handler import transcribe_uploaded_file, validate_audio_file
+        from utils.audio_handler import submit_uploaded_file, validate_audio_file
         is_valid, message = validate_audio_file(uploaded_audio)
-        if is_valid:
-            with st.spinner("Transkriberar ljudfil... Detta kan ta några minuter."):
-                transcript, audio_path = transcribe_uploaded_file(
-                    uploaded_audio, current_session['id'], 1
-                )
-                if transcript:
-                    pb = transcript.strip()
-                    st.session_state.transcript_steg1 = pb
-                else:
-                    st.error("Kunde inte transkribera filen. Kontrollera att det är en giltig ljudfil.")
-                    st.stop()
-        else:
+        if not is_valid:
             st.error(f"❌ {message}")
             st.stop()
-    # Om problembeskrivning är tom, men transkribering finns, använd transkriberingen
-    if not pb:
-        pb = st.session_state.get('transcript_steg1', '').strip()
-    if not pb:
-        st.error("Du måste antingen beskriva problemet eller ladda upp en transkribering innan du kan få AI-förslag.")
+        job_id, audio_path = submit_uploaded_file(uploaded_audio, current_session['id'], 1)
+        if not job_id:
+            st.stop()
+        st.session_state.transcription_job_steg1 = (job_id, personal_grupp, kontext)
+    else:
+        # Om problembeskrivning är tom, men transkribering finns, använd transkriberingen
+        if not pb:
+            pb = st.session_state.get('transcript_steg1', '').strip()
+        if not pb:
+            st.error("Du måste antingen beskriva problemet eller ladda upp en transkribering innan du kan få AI-förslag.")
+        else:
+            create_ai_suggestion(pb, personal_grupp, kontext)
+
+# Följ transkriberingen av den uppladdade filen
+if 'transcription_job_steg1' in st.session_state:
+    from utils.audio_handler import render_transcription_job_progress
+    from utils.transcription_worker import get_transcription_job
+
+    job_id, job_personal_grupp, job_kontext = st.session_state.transcription_job_steg1
+    job = get_transcription_job(job_id)
+    if job is None:
+        # Jobbet försvann (t.ex. omstart av servern) - användaren får skicka formuläret igen
+        del st.session_state.transcription_job_steg1
+        st.warning("Transkriberingen avbröts. Skicka formuläret igen för att fortsätta.")
+    elif job["status"] == "completed":
+        del st.session_state.transcription_job_steg1
+        st.session_state.transcript_steg1 = job["transcript"].strip()
+        create_ai_suggestion(st.session_state.transcript_steg1, job_personal_grupp, job_kontext)
+    elif job["status"] == "failed":
+        del st.session_state.transcription_job_steg1
+        st.error("Kunde inte transkribera filen. Kontrollera att det är en giltig ljudfil.")
     else:
-        st.session_state.current_problem = pb
-        st.session_state.current_personal_grupp = personal_grupp
-        st.session_state.current_kontext = kontext
-        with st.spinner("AI analyserar ditt problem och skapar förslag..."):
-            ai_suggestion = get_ai_suggestion_steg1(pb, personal_grupp, kontext)
-            if ai_suggestion:
-                st.session_state.ai_suggestion_steg1 = ai_suggestion
-                st.rerun()
-            else:
-                st.error("Kunde inte hämta AI-förslag. Kontrollera din internetanslutning och API-nyckel.")
+        render_transcription_job_progress(job_id)
 
 # Visa AI-förslag om de finns
 if 'ai_suggestion_steg1' in st.session_state:
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.session_manager import get_current_session, is_step_accessible
-from utils.ai_helper import analyze_perspectives_steg2
+from utils.ai_helper import analyze_perspectives_steg2, write_ai_stream
 from utils.database import update_session_step2
 from utils.audio_handler import validate_audio_file, display_audio_player, save_recorded_audio, transcribe_audio_openai
 from utils.audio_text_input import audio_text_input
@@ -12,6 +12,10 @@ st.set_page_config(
     layout="wide"
 )
 
+# Externa anrop härifrån loggas som steg 2 (sidan Prestanda)
+from utils.telemetry import set_telemetry_step
+set_telemetry_step(2)
+
 # Kontrollera åtkomst
 if not is_step_accessible(2):
     st.error("Du måste först slutföra Steg 1 innan du kan komma åt Steg 2.")
@@ -123,10 +127,12 @@ if 'transcript_steg2' in st.session_state or current_session.get('steg2_transcri
     # Analysera perspektiv
     if st.button("Analysera perspektiv", type="primary"):
         with st.spinner("AI analyserar de olika perspektiven i samtalet..."):
-            analysis = analyze_perspectives_steg2(
+            # Texten visas medan den skrivs och sparas bara om strömmen blev klar
+            analysis = write_ai_stream(analyze_perspectives_steg2(
                 current_session['problem_beskrivning'],
-                edited_transcript
-            )
+                edited_transcript,
+                stream=True
+            ))
             
             if analysis:
                 st.session_state.analysis_steg2 = analysis
@@ -1,9 +1,9 @@
 import streamlit as st
 import json
 from utils.session_manager import get_current_session, is_step_accessible
-from utils.ai_helper import analyze_discussion_steg3
+from utils.ai_helper import analyze_discussion_steg3, write_ai_stream
 from utils.database import update_session_step3
-from utils.audio_handler import transcribe_uploaded_file, validate_audio_file, save_recorded_audio, transcribe_audio_openai
+from utils.audio_handler import validate_audio_file, save_recorded_audio, transcribe_audio_openai
 from utils.audio_text_input import audio_text_input
 
 # Konfigurera sida
@@ -13,6 +13,10 @@ st.set_page_config(
     layout="wide"
 )
 
+# Externa anrop härifrån loggas som steg 3 (sidan Prestanda)
+from utils.telemetry import set_telemetry_step
+set_telemetry_step(3)
+
 # Kontrollera åtkomst
 if not is_step_accessible(3):
     st.error("Du måste först slutföra Steg 2 innan du kan komma åt Steg 3.")
@@ -162,11 +166,13 @@ if 'transcript_steg3' in st.session_state or current_session.get('steg3_transcri
     # Analysera diskussion
     if st.button("Analysera diskussion och dra slutsatser", type="primary"):
         with st.spinner("AI analyserar den fördjupade diskussionen och drar slutsatser..."):
-            analysis = analyze_discussion_steg3(
+            # Texten visas medan den skrivs och sparas bara om strömmen blev klar
+            analysis = write_ai_stream(analyze_discussion_steg3(
                 current_session['problem_beskrivning'],
                 selected_perspectives,
-                edited_transcript
-            )
+                edited_transcript,
+                stream=True
+            ))
             
             if analysis:
                 st.session_state.analysis_steg3 = analysis
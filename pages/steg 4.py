@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import datetime
 from utils.session_manager import get_current_session, is_step_accessible
-from utils.ai_helper import create_action_plan_steg4
+from utils.ai_helper import create_action_plan_steg4, write_ai_stream
 from utils.database import update_session_step4
 import io
 from utils.audio_text_input import audio_text_input
@@ -31,6 +31,10 @@ st.set_page_config(
     layout="wide"
 )
 
+# Externa anrop härifrån loggas som steg 4 (sidan Prestanda)
+from utils.telemetry import set_telemetry_step
+set_telemetry_step(4)
+
 # Kontrollera åtkomst
 if not is_step_accessible(4):
     st.error("Du måste först slutföra Steg 3 innan du kan komma åt Steg 4.")
@@ -219,11 +223,13 @@ if st.button("Skapa handlingsplan", type="primary"):
         st.error("Ingen transkribering eller slutsatser från Steg 3 hittades. Ladda upp/klistra in en transkribering eller gå tillbaka och slutför Steg 3 först.")
     else:
         with st.spinner("AI skapar en strukturerad handlingsplan baserat på era diskussioner..."):
-            handlingsplan = create_action_plan_steg4(
+            # Texten visas medan den skrivs och sparas bara om strömmen blev klar
+            handlingsplan = write_ai_stream(create_action_plan_steg4(
                 current_session['problem_beskrivning'],
                 slutsats_input,
-                additional_info
-            )
+                additional_info,
+                stream=True
+            ))
             
             if handlingsplan:
                 st.session_state.handlingsplan_steg4 = handlingsplan
@@ -6,10 +6,12 @@ st.title("Test av ljudinspelning med WebRTC")
 st.write("Testar den uppdaterade ljudinspelningsfunktionen:")
 
 # Testa ljudinspelning
-audio_bytes = record_audio_streamlit(session_id="test", step_number=1, key_prefix="test")
+audio_path = record_audio_streamlit(session_id="test", step_number=1, key_prefix="test")
+
+if audio_path:
+    import os
 
-if audio_bytes:
     st.success("✅ Ljudinspelning fungerar!")
-    st.write(f"Ljuddata storlek: {len(audio_bytes)} bytes")
+    st.write(f"Ljudfil: {audio_path} ({os.path.getsize(audio_path)} bytes)")
 else:
     st.info("Ingen ljuddata ännu. Prova att spela in något.")
\ No newline at end of file
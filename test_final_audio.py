@@ -7,34 +7,23 @@ st.write("Detta är en demonstration av den fixade ljudinspelningsfunktionen.")
 
 # Test ljudinspelning
 st.subheader("🎤 Testa ljudinspelning")
-audio_bytes = record_audio_streamlit(session_id="demo", step_number=1, key_prefix="demo")
+audio_path = record_audio_streamlit(session_id="demo", step_number=1, key_prefix="demo")
 
-if audio_bytes:
-    st.success(f"✅ Ljudinspelning lyckades! Storlek: {len(audio_bytes)} bytes")
+if audio_path:
+    import os
+
+    st.success(f"✅ Ljudinspelning lyckades! Storlek: {os.path.getsize(audio_path)} bytes")
     
     # Testa transkribering
     if st.button("🔊 Transkribera ljudet"):
-        # Spara ljudet temporärt
-        import tempfile
-        import os
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-            tmp_file.write(audio_bytes)
-            temp_path = tmp_file.name
+        with st.spinner("Transkriberar med OpenAI Whisper..."):
+            transcript = transcribe_audio_openai(audio_path)
         
-        try:
-            with st.spinner("Transkriberar med OpenAI Whisper..."):
-                transcript = transcribe_audio_openai(temp_path)
-            
-            if transcript:
-                st.success("✅ Transkribering lyckades!")
-                st.text_area("Transkribering:", value=transcript, height=100)
-            else:
-                st.error("❌ Transkribering misslyckades")
-        finally:
-            # Rensa upp temporär fil
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+        if transcript:
+            st.success("✅ Transkribering lyckades!")
+            st.text_area("Transkribering:", value=transcript, height=100)
+        else:
+            st.error("❌ Transkribering misslyckades")
 else:
     st.info("Klicka på mikrofon-ikonen för att spela in ljud")
 
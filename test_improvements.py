@@ -119,8 +119,7 @@ try:
         transcribe_audio_openai,
         transcribe_audio_openai_async,
         transcribe_segments_parallel,
-        transcribe_large_audio_file,
-        split_audio_file
+        transcribe_large_audio_file
     )
     print_success("Alla audio-funktioner importerade korrekt")
 
@@ -0,0 +1,208 @@
+import pytest
+
+from utils.audio_segmentation import (
+    add_segment_overlap, build_encode_command, build_stream_decode_command, merge_silences,
+    plan_fixed_segments, plan_next_segment, plan_segments, segment_time_to_original
+)
+
+
+def stream_plan(total, silences, target, step=7.0, **kwargs):
+    """Kör plan_next_segment som producenten gör, med tystnaderna som är kända vid varje avkodad tidpunkt"""
+    segments = []
+    cursor = 0.0
+    decoded = 0.0
+    while True:
+        decoded = min(total, decoded + step)
+        finished = decoded >= total
+        known = [(start, min(end, decoded)) for start, end in silences if start < decoded]
+        while True:
+            segment, cursor = plan_next_segment(cursor, decoded, known, target, finished, **kwargs)
+            if segment is None:
+                break
+            segments.append(segment)
+        if finished:
+            return segments
+
+
+def approx_spans(plan):
+    return [[pytest.approx(span) for span in segment["spans"]] for segment in plan]
+
+
+def test_boundary_is_placed_in_pause_before_target():
+    plan = plan_segments(100.0, [(48.0, 50.0)], target_seconds=60.0, drop_silence_seconds=0, search_seconds=15.0)
+
+    assert [(s["start"], s["end"]) for s in plan] == [(0.0, 49.0), (49.0, 100.0)]
+
+
+def test_longest_pause_in_search_window_wins():
+    silences = [(46.0, 46.6), (52.0, 54.0), (58.0, 58.5)]
+    plan = plan_segments(100.0, silences, target_seconds=60.0, drop_silence_seconds=0, search_seconds=15.0)
+
+    assert plan[0]["end"] == 53.0
+
+
+def test_pause_outside_search_window_is_ignored():
+    plan = plan_segments(100.0, [(10.0, 12.0)], target_seconds=60.0, drop_silence_seconds=0, search_seconds=15.0)
+
+    # Ingen paus nära gränsen - hård gräns vid target
+    assert plan[0]["end"] == 60.0
+
+
+def test_short_remainder_stays_in_last_segment():
+    plan = plan_segments(64.0, [], target_seconds=60.0, drop_silence_seconds=0)
+
+    assert len(plan) == 1
+    assert plan[0]["end"] == 64.0
+
+
+def test_long_silence_is_dropped():
+    plan = plan_segments(150.0, [(40.0, 100.0)], target_seconds=120.0, drop_silence_seconds=30.0, padding=0.5)
+
+    assert len(plan) == 1
+    assert plan[0]["spans"] == [(0.0, 40.5), (99.5, 150.0)]
+    assert plan[0]["audio_seconds"] == pytest.approx(91.0)
+
+
+def test_silence_shorter_than_drop_threshold_is_kept():
+    plan = plan_segments(150.0, [(40.0, 69.0)], target_seconds=200.0, drop_silence_seconds=30.0)
+
+    assert plan[0]["spans"] == [(0.0, 150.0)]
+
+
+def test_silence_exactly_at_drop_threshold_is_dropped():
+    plan = plan_segments(150.0, [(40.0, 70.0)], target_seconds=200.0, drop_silence_seconds=30.0, padding=0.5)
+
+    assert plan[0]["spans"] == [(0.0, 40.5), (69.5, 150.0)]
+
+
+def test_drop_threshold_zero_keeps_everything():
+    plan = plan_segments(150.0, [(40.0, 100.0)], target_seconds=200.0, drop_silence_seconds=0)
+
+    assert plan[0]["spans"] == [(0.0, 150.0)]
+
+
+def test_trailing_silence_is_dropped():
+    plan = plan_segments(100.0, [(60.0, 100.0)], target_seconds=200.0, drop_silence_seconds=30.0, padding=0.5)
+
+    assert plan[0]["spans"] == [(0.0, 60.5)]
+
+
+def test_segments_are_numbered_from_one():
+    plan = plan_fixed_segments(150.0, 60.0)
+
+    assert [s["number"] for s in plan] == [1, 2, 3]
+    assert [(s["start"], s["end"]) for s in plan] == [(0.0, 60.0), (60.0, 120.0), (120.0, 150.0)]
+
+
+def test_overlap_extends_all_but_last_segment():
+    plan = add_segment_overlap(plan_fixed_segments(150.0, 60.0), 5.0)
+
+    first, middle, last = plan
+    assert (first["start"], first["end"], first["overlap_seconds"]) == (0.0, 65.0, 5.0)
+    assert first["spans"] == [(0.0, 65.0)]
+    assert (middle["start"], middle["end"]) == (60.0, 125.0)
+    assert (last["start"], last["end"], last["overlap_seconds"]) == (120.0, 150.0, 0.0)
+    assert last["spans"] == [(120.0, 150.0)]
+
+
+def test_overlap_is_counted_in_kept_audio_across_dropped_silence():
+    plan = [
+        {"number": 1, "start": 0.0, "end": 40.5, "spans": [(0.0, 40.5)], "audio_seconds": 40.5},
+        {"number": 2, "start": 99.5, "end": 150.0, "spans": [(99.5, 150.0)], "audio_seconds": 50.5},
+    ]
+    first, last = add_segment_overlap(plan, 5.0)
+
+    assert first["spans"] == [(0.0, 40.5), (99.5, 104.5)]
+    assert first["audio_seconds"] == pytest.approx(45.5)
+    assert last["spans"] == [(99.5, 150.0)]
+
+
+def test_overlap_shorter_than_next_segment_spans_continues_into_later_span():
+    plan = [
+        {"number": 1, "start": 0.0, "end": 10.0, "spans": [(0.0, 10.0)], "audio_seconds": 10.0},
+        {"number": 2, "start": 10.0, "end": 50.0, "spans": [(10.0, 12.0), (40.0, 50.0)], "audio_seconds": 12.0},
+    ]
+    first, _ = add_segment_overlap(plan, 5.0)
+
+    assert first["spans"] == [(0.0, 12.0), (40.0, 43.0)]
+
+
+def test_zero_overlap_returns_plan_unchanged():
+    plan = plan_fixed_segments(150.0, 60.0)
+
+    assert add_segment_overlap(plan, 0) is plan
+
+
+def test_streamed_plan_matches_whole_file_plan():
+    silences = [(50.0, 52.0), (95.0, 140.0), (170.0, 171.0), (230.0, 231.5), (300.0, 300.8)]
+    streamed = stream_plan(360.0, silences, 60.0, drop_silence_seconds=30.0)
+
+    whole = plan_segments(360.0, silences, 60.0, drop_silence_seconds=30.0)
+
+    assert [s["spans"] for s in whole] == approx_spans(streamed)
+
+
+def test_streamed_plan_with_overlap_matches_whole_file_plan():
+    silences = [(50.0, 52.0), (95.0, 140.0), (170.0, 171.0), (230.0, 231.5)]
+    streamed = stream_plan(300.0, silences, 60.0, drop_silence_seconds=30.0, overlap_seconds=5.0)
+    whole = add_segment_overlap(plan_segments(300.0, silences, 60.0, drop_silence_seconds=30.0), 5.0)
+
+    assert [s["spans"] for s in whole] == approx_spans(streamed)
+
+
+def test_streamed_fixed_plan_matches_fixed_segments():
+    streamed = stream_plan(150.0, [], 60.0, silence_aware=False, overlap_seconds=5.0)
+    whole = add_segment_overlap(plan_fixed_segments(150.0, 60.0), 5.0)
+
+    assert [s["spans"] for s in whole] == approx_spans(streamed)
+
+
+def test_segment_waits_until_later_audio_cannot_move_it():
+    segment, cursor = plan_next_segment(0.0, 100.0, [(48.0, 50.0)], 60.0, finished=False, drop_silence_seconds=30.0)
+
+    assert segment is None
+    assert cursor == 0.0
+
+    segment, cursor = plan_next_segment(0.0, 100.0, [(48.0, 50.0)], 60.0, finished=True, drop_silence_seconds=30.0)
+
+    assert (segment["start"], segment["end"]) == (0.0, 49.0)
+    assert cursor == 49.0
+
+
+def test_cursor_skips_ahead_in_long_trailing_silence():
+    segment, cursor = plan_next_segment(100.0, 200.0, [(80.0, 200.0)], 60.0, finished=False,
+                                        drop_silence_seconds=30.0, padding=0.5)
+
+    assert segment is None
+    assert cursor == 199.5
+
+
+def test_merge_silences_joins_silence_across_block_boundary():
+    silences = merge_silences([(1.0, 2.0), (8.0, 10.0)], [(10.0, 11.5), (12.0, 13.0)])
+
+    assert silences == [(1.0, 2.0), (8.0, 11.5), (12.0, 13.0)]
+
+
+def test_stream_decode_command_writes_pcm_to_stdout():
+    cmd = build_stream_decode_command("in.pcm", input_args=["-f", "f32le", "-ar", "16000", "-ac", "1"])
+
+    assert cmd[1:3] == ["-f", "f32le"]
+    assert cmd.index("f32le") < cmd.index("-i")
+    assert cmd[cmd.index("-f", cmd.index("-i")) + 1] == "s16le"
+    assert cmd[-1] == "pipe:1"
+
+
+def test_encode_command_reads_pcm_from_stdin():
+    cmd = build_encode_command("out.ogg", codec_args=["-acodec", "libopus"])
+
+    assert cmd[cmd.index("-i") + 1] == "pipe:0"
+    assert cmd.index("s16le") < cmd.index("-i") < cmd.index("libopus")
+    assert cmd[-1] == "out.ogg"
+
+
+def test_segment_time_maps_back_across_dropped_silence():
+    segment = {"start": 0.0, "end": 150.0, "spans": [(0.0, 40.5), (99.5, 150.0)]}
+
+    assert segment_time_to_original(segment, 10.0) == 10.0
+    assert segment_time_to_original(segment, 45.5) == pytest.approx(104.5)
+    assert segment_time_to_original(segment, 1000.0) == 150.0
@@ -0,0 +1,133 @@
+import sys
+
+import pytest
+
+from utils import text_chunking
+from utils.text_chunking import chunk_text, count_tokens, get_chunk_token_budget
+
+
+@pytest.fixture(autouse=True)
+def no_tiktoken(monkeypatch):
+    # Utan tiktoken räknas tokens som tecken / 3 - deterministiskt i testerna
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    monkeypatch.setattr(text_chunking, "_encoders", {})
+    monkeypatch.delenv("CHUNK_MAX_TOKENS", raising=False)
+
+
+def test_count_tokens_falls_back_to_chars_per_token_without_tiktoken():
+    assert text_chunking._get_encoder("gpt-4") is None
+    assert count_tokens("") == 0
+    assert count_tokens("abc") == 1
+    # Avrundas uppåt - hellre för många tokens än för få
+    assert count_tokens("abcdefg") == 3
+
+
+def test_count_tokens_uses_encoder_when_available(monkeypatch):
+    class FakeEncoder:
+        def encode(self, text, disallowed_special=()):
+            return text.split()
+
+    monkeypatch.setattr(text_chunking, "_get_encoder", lambda model: FakeEncoder())
+
+    assert count_tokens("tre ord här") == 3
+
+
+def test_budget_is_context_minus_answer_template_and_overhead():
+    assert get_chunk_token_budget("gpt-4", max_tokens=4000) == 8192 - 4000 - text_chunking.PROMPT_OVERHEAD_TOKENS
+    assert get_chunk_token_budget("gpt-4o", max_tokens=4000) == 128000 - 4000 - text_chunking.PROMPT_OVERHEAD_TOKENS
+    # 30 tecken mall = 10 tokens
+    assert get_chunk_token_budget("gpt-4", max_tokens=4000, template="x" * 30) == (
+        8192 - 4000 - 10 - text_chunking.PROMPT_OVERHEAD_TOKENS
+    )
+
+
+def test_budget_unknown_model_uses_default_context():
+    assert get_chunk_token_budget("okänd-modell", max_tokens=1000) == (
+        text_chunking.DEFAULT_CONTEXT_TOKENS - 1000 - text_chunking.PROMPT_OVERHEAD_TOKENS
+    )
+
+
+def test_budget_is_capped_by_chunk_max_tokens(monkeypatch):
+    monkeypatch.setenv("CHUNK_MAX_TOKENS", "1000")
+
+    assert get_chunk_token_budget("gpt-4o", max_tokens=4000) == 1000
+
+
+def test_budget_never_goes_below_minimum():
+    assert get_chunk_token_budget("gpt-4", max_tokens=8192) == 200
+
+
+def test_empty_text_gives_no_chunks():
+    assert chunk_text("", 100) == []
+    assert chunk_text("   \n\n  ", 100) == []
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("  En kort transkribering.  ", 100) == ["En kort transkribering."]
+
+
+def test_paragraphs_are_packed_within_budget():
+    paragraphs = [f"Stycke {n} " + "ord " * 20 for n in range(10)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = chunk_text(text, 100)
+
+    assert 1 < len(chunks) < len(paragraphs)
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+    # Inget tappas och inga ord delas
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_segment_blocks_are_kept_whole():
+    blocks = [f"[Segment {n} · 00:0{n}:00]\n" + "talare säger något " * 5 for n in range(1, 5)]
+    text = "\n".join(blocks)
+    block_tokens = count_tokens(blocks[0].strip())
+
+    chunks = chunk_text(text, block_tokens + 5)
+
+    assert len(chunks) == len(blocks)
+    assert all(chunk.startswith("[Segment") for chunk in chunks)
+
+
+def test_oversized_paragraph_is_split_at_sentences():
+    sentences = [f"Mening nummer {n} handlar om skolan." for n in range(12)]
+    text = " ".join(sentences)
+
+    chunks = chunk_text(text, 40)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 40 for chunk in chunks)
+    # Varje del slutar vid en mening
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_oversized_sentence_is_split_at_words():
+    text = " ".join(f"ord{n}" for n in range(100))
+
+    chunks = chunk_text(text, 20)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 20 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_overlap_repeats_last_sentence_of_previous_chunk():
+    sentences = [f"Mening nummer {n} handlar om skolan." for n in range(12)]
+    text = " ".join(sentences)
+
+    chunks = chunk_text(text, 40, overlap_tokens=15)
+
+    assert len(chunks) > 1
+    for previous, following in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit(". ", 1)[-1]
+        assert following.startswith(last_sentence)
+    assert all(count_tokens(chunk) <= 40 for chunk in chunks)
+
+
+def test_overlap_larger_than_room_is_dropped():
+    sentences = [f"Mening nummer {n} handlar om skolan." for n in range(6)]
+    without_overlap = chunk_text(" ".join(sentences), 14)
+
+    # Varje mening fyller nästan hela delen - ingen plats för överlapp
+    assert chunk_text(" ".join(sentences), 14, overlap_tokens=100) == without_overlap
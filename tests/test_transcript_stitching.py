@@ -0,0 +1,62 @@
+from utils.transcript_stitching import stitch_pair, stitch_transcripts
+
+
+def test_exact_overlap_is_removed():
+    previous = "vi börjar med att gå igenom dagordningen för mötet"
+    following = "dagordningen för mötet och sedan pratar vi om budgeten"
+
+    assert stitch_pair(previous, following, overlap_seconds=2) == (
+        "vi börjar med att gå igenom dagordningen för mötet och sedan pratar vi om budgeten"
+    )
+
+
+def test_no_overlap_joins_texts_unchanged():
+    assert stitch_pair("första delen slutar här", "andra delen börjar nu", overlap_seconds=2) == (
+        "första delen slutar här andra delen börjar nu"
+    )
+
+
+def test_too_short_match_is_not_treated_as_overlap():
+    # Två gemensamma ord räcker inte (min_match_words=3)
+    assert stitch_pair("vi tycker att det är", "det är viktigt", overlap_seconds=2) == (
+        "vi tycker att det är det är viktigt"
+    )
+
+
+def test_punctuation_and_case_drift_still_match():
+    previous = "Vi pratade om skolan. Det var bra"
+    following = "skolan, det var bra att alla kom"
+
+    assert stitch_pair(previous, following, overlap_seconds=2) == "Vi pratade om skolan. Det var bra att alla kom"
+
+
+def test_seam_is_placed_in_middle_of_match():
+    # Första halvan av överlappet tas från föregående segment, resten från nästa
+    previous = "a b C D E F"
+    following = "c d e f g"
+
+    assert stitch_pair(previous, following, overlap_seconds=1) == "a b C D e f g"
+
+
+def test_empty_segment_is_skipped():
+    assert stitch_pair("", "bara nästa", overlap_seconds=2) == "bara nästa"
+    assert stitch_pair("bara föregående", "   ", overlap_seconds=2) == "bara föregående"
+    assert stitch_transcripts(["", "ett två tre fyra", "", "två tre fyra fem sex"], overlap_seconds=2) == (
+        "ett två tre fyra fem sex"
+    )
+
+
+def test_stitch_transcripts_chains_several_segments():
+    texts = [
+        "mötet öppnades och vi gick igenom protokollet",
+        "gick igenom protokollet från förra veckan och",
+        "från förra veckan och sedan avslutades mötet",
+    ]
+
+    assert stitch_transcripts(texts, overlap_seconds=3) == (
+        "mötet öppnades och vi gick igenom protokollet från förra veckan och sedan avslutades mötet"
+    )
+
+
+def test_all_empty_gives_empty_string():
+    assert stitch_transcripts(["", None, ""], overlap_seconds=2) == ""
@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+import utils.transcription_scheduler as scheduler_module
+from utils.transcription_scheduler import (
+    TokenBucket, TranscriptionScheduler, backoff_delay, is_retryable_error
+)
+
+
+class ApiError(Exception):
+    def __init__(self, status_code=None, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        if headers is not None:
+            self.response = type("Response", (), {"headers": headers})()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize("status_code", [408, 409, 429, 500, 502, 503])
+def test_transient_status_codes_are_retried(status_code):
+    assert is_retryable_error(ApiError(status_code))
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 403, 404, 413, 422])
+def test_client_errors_are_fatal(status_code):
+    assert not is_retryable_error(ApiError(status_code))
+
+
+def test_timeouts_and_connection_errors_are_retried():
+    assert is_retryable_error(asyncio.TimeoutError())
+    assert is_retryable_error(ConnectionError())
+
+
+def test_other_exceptions_are_fatal():
+    assert not is_retryable_error(ValueError("ogiltig fil"))
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_stays_within_exponential_bound(attempt):
+    bound = min(30.0, 2 ** attempt)
+    for _ in range(200):
+        assert 0.0 <= backoff_delay(attempt) <= bound
+
+
+def test_backoff_respects_retry_after_but_caps_it():
+    assert backoff_delay(0, ApiError(429, {"retry-after": "7"})) == 7.0
+    assert backoff_delay(0, ApiError(429, {"retry-after": "600"})) == 30.0
+
+
+def test_backoff_ignores_unparseable_retry_after():
+    assert 0.0 <= backoff_delay(1, ApiError(429, {"retry-after": "soon"})) <= 2.0
+
+
+def test_token_bucket_allows_burst_then_waits(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    bucket = TokenBucket(rate_per_second=2.0, capacity=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    # Tredje anropet får vänta på en halv token vid 2 tokens/s
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_up_to_capacity(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    bucket = TokenBucket(rate_per_second=1.0, capacity=2)
+
+    bucket.reserve()
+    bucket.reserve()
+    clock.now += 1.0
+    assert bucket.reserve() == 0.0
+
+    # Lång vila fyller aldrig på mer än kapaciteten
+    clock.now += 60.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def _scheduler(max_retries=3):
+    return TranscriptionScheduler(
+        max_concurrency=2, max_retries=max_retries,
+        rate_limiter=TokenBucket(rate_per_second=1000.0, capacity=1000)
+    )
+
+
+def test_scheduler_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "backoff_delay", lambda attempt, error=None: 0.0)
+    errors = [ApiError(429), ApiError(503)]
+
+    async def operation():
+        if errors:
+            raise errors.pop(0)
+        return "text"
+
+    async def main():
+        scheduler = _scheduler()
+        return await scheduler.run(1, operation), scheduler.stats[1]
+
+    result, stat = asyncio.run(main())
+    assert result == "text"
+    assert stat["attempts"] == 3
+    assert stat["error"] is None
+
+
+def test_scheduler_does_not_retry_fatal_errors(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "backoff_delay", lambda attempt, error=None: 0.0)
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise ApiError(400)
+
+    async def main():
+        scheduler = _scheduler()
+        with pytest.raises(ApiError):
+            await scheduler.run(1, operation)
+        return scheduler.stats[1]
+
+    stat = asyncio.run(main())
+    assert len(calls) == 1
+    assert stat["attempts"] == 1
+
+
+def test_scheduler_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "backoff_delay", lambda attempt, error=None: 0.0)
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        raise ApiError(500)
+
+    async def main():
+        with pytest.raises(ApiError):
+            await _scheduler(max_retries=2).run(1, operation)
+
+    asyncio.run(main())
+    assert len(calls) == 3
+
+
+def test_scheduler_separates_queue_time_from_call_latency(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+
+    def operation_taking(seconds):
+        async def operation():
+            await asyncio.sleep(0)
+            clock.now += seconds
+            return "text"
+        return operation
+
+    async def main():
+        scheduler = TranscriptionScheduler(
+            max_concurrency=1, max_retries=0,
+            rate_limiter=TokenBucket(rate_per_second=1000.0, capacity=1000)
+        )
+        await asyncio.gather(
+            scheduler.run(1, operation_taking(5.0)),
+            scheduler.run(2, operation_taking(2.0))
+        )
+        return scheduler.stats
+
+    stats = asyncio.run(main())
+    assert stats[1]["queue_seconds"] == 0.0
+    assert stats[1]["latency_seconds"] == 5.0
+    # Segment 2 väntar på platsen medan segment 1 körs - det räknas inte som latens
+    assert stats[2]["queue_seconds"] == 5.0
+    assert stats[2]["latency_seconds"] == 2.0
+    assert stats[2]["total_seconds"] == 7.0
+
+
+def test_scheduler_latency_excludes_failed_attempts(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    monkeypatch.setattr(scheduler_module, "backoff_delay", lambda attempt, error=None: 0.0)
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) == 1:
+            clock.now += 10.0
+            raise ApiError(503)
+        clock.now += 2.0
+        return "text"
+
+    async def main():
+        scheduler = _scheduler()
+        await scheduler.run(1, operation)
+        return scheduler.stats[1]
+
+    stat = asyncio.run(main())
+    assert stat["attempts"] == 2
+    assert stat["latency_seconds"] == 2.0
+    assert stat["total_seconds"] == 12.0
@@ -0,0 +1,130 @@
+import asyncio
+
+from utils.tree_reduce import plan_reduce_groups, tree_reduce
+
+
+def make_reducer(fail=()):
+    """Reducer som slår ihop texter med '+' och loggar anropen (grupp, nivå, final)"""
+    calls = []
+
+    async def reduce_group(group, level, final):
+        calls.append((list(group), level, final))
+        if any(item in fail for item in group):
+            raise RuntimeError("reduce failed")
+        return "(" + "+".join(group) + ")"
+
+    return reduce_group, calls
+
+
+def run(items, reducer, **kwargs):
+    return asyncio.run(tree_reduce(items, reducer, **kwargs))
+
+
+def test_plan_groups_by_fan_in_in_order():
+    assert plan_reduce_groups(list("abcdefg"), 3) == [["a", "b", "c"], ["d", "e", "f"], ["g"]]
+
+
+def test_plan_groups_respects_token_budget():
+    items = ["aaaa", "bb", "cc", "dddd", "e"]
+
+    groups = plan_reduce_groups(items, fan_in=10, max_tokens=5, count_tokens=len)
+
+    assert groups == [["aaaa"], ["bb", "cc"], ["dddd", "e"]]
+
+
+def test_plan_groups_oversized_item_gets_own_group():
+    groups = plan_reduce_groups(["a", "xxxxxxxx", "b"], fan_in=10, max_tokens=4, count_tokens=len)
+
+    assert groups == [["a"], ["xxxxxxxx"], ["b"]]
+
+
+def test_plan_groups_ignores_budget_without_counter():
+    assert plan_reduce_groups(list("abcd"), fan_in=2, max_tokens=1) == [["a", "b"], ["c", "d"]]
+
+
+def test_single_input_is_still_reduced_to_final_format():
+    reducer, calls = make_reducer()
+
+    result, levels = run(["a"], reducer, fan_in=4)
+
+    assert result == "(a)"
+    assert calls == [(["a"], 1, True)]
+    assert len(levels) == 1
+
+
+def test_empty_input_gives_none():
+    reducer, calls = make_reducer()
+
+    assert run([], reducer, fan_in=4) == (None, [])
+    assert calls == []
+
+
+def test_depth_grows_logarithmically_with_fan_in():
+    reducer, calls = make_reducer()
+
+    result, levels = run([str(n) for n in range(16)], reducer, fan_in=4)
+
+    # 16 -> 4 -> 1
+    assert [level["groups"] for level in levels] == [4, 1]
+    assert [level["inputs"] for level in levels] == [16, 4]
+    assert result == "((0+1+2+3)+(4+5+6+7)+(8+9+10+11)+(12+13+14+15))"
+    assert [final for _, _, final in calls] == [False] * 4 + [True]
+
+
+def test_lone_intermediate_result_is_carried_to_next_level():
+    reducer, calls = make_reducer()
+
+    result, levels = run([str(n) for n in range(5)], reducer, fan_in=2)
+
+    # Nivå 1: (0+1) (2+3) (4). Nivå 2: ((0+1)+(2+3)) och "(4)" följer med utan anrop
+    assert [level["groups"] for level in levels] == [3, 2, 1]
+    assert result == "(((0+1)+(2+3))+(4))"
+    assert not any(group == ["(4)"] for group, _, _ in calls)
+
+
+def test_reduce_final_false_returns_last_inputs_without_final_call():
+    reducer, calls = make_reducer()
+
+    result, levels = run([str(n) for n in range(8)], reducer, fan_in=4, reduce_final=False)
+
+    assert result == ["(0+1+2+3)", "(4+5+6+7)"]
+    assert len(levels) == 1
+    assert all(not final for _, _, final in calls)
+
+
+def test_reduce_final_false_with_few_inputs_makes_no_calls():
+    reducer, calls = make_reducer()
+
+    result, levels = run(["a", "b"], reducer, fan_in=4, reduce_final=False)
+
+    assert result == ["a", "b"]
+    assert levels == []
+    assert calls == []
+
+
+def test_failed_group_is_skipped_and_counted():
+    reducer, calls = make_reducer(fail={"2"})
+
+    result, levels = run([str(n) for n in range(6)], reducer, fan_in=2)
+
+    assert levels[0]["failed"] == 1
+    assert result == "((0+1)+(4+5))"
+
+
+def test_everything_failing_gives_none():
+    reducer, calls = make_reducer(fail={"a", "b"})
+
+    result, levels = run(["a", "b"], reducer, fan_in=4)
+
+    assert result is None
+    assert levels[0]["failed"] == 1
+
+
+def test_group_returning_none_counts_as_failed():
+    async def reducer(group, level, final):
+        return None if "b" in group else "+".join(group)
+
+    result, levels = run(["a", "b", "c", "d"], reducer, fan_in=2)
+
+    assert levels[0]["failed"] == 1
+    assert "c+d" in result
@@ -1,17 +1,14 @@
-from openai import OpenAI, AsyncOpenAI
 import streamlit as st
 import os
 from dotenv import load_dotenv
 import math
 import asyncio
 
+from utils.openai_clients import get_openai_client, get_async_openai_client, run_async
+
 # Ladda miljövariabler
 load_dotenv()
 
-# Konfigurera OpenAI clients
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
 # AI Prompts
 STEG1_PROMPT = """
 Du är en expert på att leda professionella samtal enligt LPGD-modellen (Leading Professional Group Discussions). Din expertis bygger på forskningsbaserade principer för hur rektorer effektivt kan leda samtal i svenska skolor.
@@ -269,99 +266,261 @@ Skapa en konkret och genomförbar handlingsplan baserad på gruppens diskussione
 Skriv handlingsplanen tydligt, konkret och strukturerat på svenska. Använd INTE emojis. Basera ditt svar på forskningsbaserade LPGD-principer för att avsluta och transformera samtal till handling.
 """
 
-MAX_CHUNK_SIZE = 2000  # sänkt till 2000 tecken per del
+AI_MODEL = "gpt-4"
+MAX_RESPONSE_TOKENS = 4000
+# Svarslängd för mellanliggande sammanfattningar i reduce-trädet
+REDUCE_RESPONSE_TOKENS = 1500
+
+SAMMANFATTNING_PROMPT = "Du är en samtalscoach för rektorer. Här är delanalyser av ett långt samtal. Sammanfatta och strukturera huvuddragen, viktiga perspektiv och slutsatser så att det blir en helhetsbild enligt LPGD-modellen.\n\nDELANALYSER:\n"
+SLUTSAMMANFATTNING_PROMPT = "Du är en samtalscoach för rektorer. Här är flera del-sammanfattningar av ett långt samtal. Slå ihop till en slutlig, övergripande sammanfattning enligt LPGD-modellen.\n\nSAMMANFATTNINGAR:\n"
 
 # Hjälpfunktion för att dela upp text i bitar
-def split_text(text, max_length=MAX_CHUNK_SIZE):
-    return [text[i:i+max_length] for i in range(0, len(text), max_length)]
+def split_text(text, template="", max_tokens=None):
+    """
+    Dela texten i delar som ryms i ett GPT-anrop tillsammans med mallen.
+    Delarna mäts i tokens och består av hela segment, stycken eller
+    meningar (se utils/text_chunking.py).
+    """
+    from utils.text_chunking import chunk_text, get_chunk_token_budget, get_chunk_overlap_tokens
+
+    if max_tokens is None:
+        max_tokens = get_chunk_token_budget(AI_MODEL, MAX_RESPONSE_TOKENS, template)
+    return chunk_text(text, max_tokens, model=AI_MODEL, overlap_tokens=get_chunk_overlap_tokens())
 
 # Ny hjälpfunktion för att analysera långa texter stegvis med parallellisering
-@st.cache_data(show_spinner=False, ttl=0)
-def analyze_long_text(prompt_template, **kwargs):
-    text = kwargs.get('transcript') or kwargs.get('conclusions')
+def analyze_long_text(prompt_template, stream=False, **kwargs):
+    """
+    Analysera en transkribering (eller slutsatser) med prompt_template.
+    Långa texter delas upp, analyseras parallellt och slås ihop i ett träd;
+    det sista anropet görs här så att det kan strömmas. Med stream=True
+    returneras en generator med texten i bitar (för st.write_stream).
+    """
+    final_prompt = _prepare_final_prompt(prompt_template, kwargs)
+    if not final_prompt:
+        return iter(()) if stream else None
+    if stream:
+        return stream_ai_response(final_prompt)
+    return get_ai_response(final_prompt)
+
+def _prepare_final_prompt(prompt_template, kwargs):
+    """Prompten för det sista anropet: hela mallen, eller sammanfattning av delanalyserna"""
+    from utils.text_chunking import count_tokens
+
+    text_key = 'transcript' if kwargs.get('transcript') else 'conclusions'
+    text = kwargs.get(text_key)
     if not text:
         return None
-    chunks = split_text(text)
+    # Mallen med övriga fält ifyllda - det som tar plats utöver texten
+    template = prompt_template.format(**{**kwargs, text_key: ""})
+    chunks = split_text(text, template)
     if len(chunks) == 1:
-        prompt = prompt_template.format(**kwargs)
-        return get_ai_response(prompt)
+        return prompt_template.format(**kwargs)
+
+    st.info(f"Transkriberingen är lång (~{count_tokens(text, AI_MODEL)} tokens). AI:n analyserar {len(chunks)} delar parallellt – detta går mycket snabbare!")
+
+    # Kör parallell analys av alla chunks och slå ihop dem nivå för nivå
+    delanalyser, sista_gruppen, levels = run_async(_map_reduce(chunks, prompt_template, kwargs, text_key))
+
+    if not delanalyser:
+        st.error("Ingen delanalys lyckades. Försök korta ner texten eller dela upp samtalet manuellt.")
+        return None
+
+    if levels:
+        nivåer = ", ".join(f"nivå {l['level']}: {l['groups']} anrop på {l['seconds']:.1f} s" for l in levels)
+        st.info(f"Delanalyserna sammanfattades i {len(levels) + 1} nivå(er) – {nivåer}, sista sammanfattningen skrivs nu")
+    if not sista_gruppen:
+        st.error("Sammanfattningen av delanalyserna misslyckades. Försök igen.")
+        return None
+
+    return (SLUTSAMMANFATTNING_PROMPT if levels else SAMMANFATTNING_PROMPT) + "\n\n".join(sista_gruppen)
+
+async def _map_reduce(chunks, prompt_template, kwargs, text_key):
+    """
+    Map: analysera alla delar parallellt. Reduce: slå ihop delanalyserna i
+    ett träd där varje nivå körs parallellt (se utils/tree_reduce.py), fram
+    till den sista gruppen som ryms i ett anrop.
+    Returnerar (delanalyser, sista gruppen, nivåer).
+    """
+    from utils.text_chunking import count_tokens, get_chunk_token_budget
+    from utils.tree_reduce import tree_reduce
+
+    delanalyser = await analyze_chunks_parallel(chunks, prompt_template, kwargs, text_key)
+    if not delanalyser:
+        return delanalyser, None, []
+
+    async def reduce_group(group, level, final):
+        prompt = (SAMMANFATTNING_PROMPT if level == 1 else SLUTSAMMANFATTNING_PROMPT) + "\n\n".join(group)
+        # Mellanled hålls korta så att minst två ryms i nästa anrop
+        return await get_ai_response_async(prompt, max_tokens=REDUCE_RESPONSE_TOKENS)
+
+    sista_gruppen, levels = await tree_reduce(
+        delanalyser,
+        reduce_group,
+        max_tokens=get_chunk_token_budget(AI_MODEL, MAX_RESPONSE_TOKENS, SLUTSAMMANFATTNING_PROMPT),
+        count_tokens=lambda text: count_tokens(text, AI_MODEL) + 1,
+        reduce_final=False
+    )
+    return delanalyser, sista_gruppen, levels
+
+SYSTEM_PROMPT = "Du är en expert på att leda professionella gruppdiskussioner (LPGD-modellen) och pedagogisk ledning i svenska skolor. Du baserar dina råd på forskningsbaserade principer. Använd aldrig emojis i dina svar - skriv endast ren text."
+TEMPERATURE = 0.7
+
+def _build_request(prompt, max_tokens):
+    """Meddelanden, parametrar och cachenyckel för ett GPT-anrop"""
+    from utils.llm_cache import make_llm_cache_key
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    params = {"max_tokens": max_tokens, "temperature": TEMPERATURE}
+    return messages, params, make_llm_cache_key(AI_MODEL, messages, **params)
+
+def _record_usage(call, response, prompt=None, text=None):
+    """Tokens för telemetrin: från svarets usage, annars räknade ur texten (strömmade svar)"""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        call['prompt_tokens'] = usage.prompt_tokens
+        call['completion_tokens'] = usage.completion_tokens
     else:
-        st.info(f"Transkriberingen är lång ({len(text)} tecken). AI:n analyserar {len(chunks)} delar parallellt – detta går mycket snabbare!")
-
-        # Kör parallell analys av alla chunks
-        delanalyser = asyncio.run(analyze_chunks_parallel(chunks, prompt_template, kwargs))
-
-        if not delanalyser:
-            st.error("Ingen delanalys lyckades. Försök korta ner texten eller dela upp samtalet manuellt.")
-            return None
-
-        # Slå ihop delanalyserna, men om det blir för långt, dela även dessa
-        sammanfattningsprompt = (
-            "Du är en samtalscoach för rektorer. Här är delanalyser av ett långt samtal. Sammanfatta och strukturera huvuddragen, viktiga perspektiv och slutsatser så att det blir en helhetsbild enligt LPGD-modellen.\n\nDELANALYSER:\n" + "\n\n".join(delanalyser)
-        )
-        # Om prompten är för lång, dela även delanalyserna i mindre grupper
-        if len(sammanfattningsprompt) > MAX_CHUNK_SIZE * 2:
-            st.info("Slutlig sammanfattning delas upp i flera steg...")
-            sammanfattningar = []
-            delgrupper = split_text("\n\n".join(delanalyser), MAX_CHUNK_SIZE)
-            for i, grupp in enumerate(delgrupper):
-                st.info(f"Sammanfattar delgrupp {i+1} av {len(delgrupper)}...")
-                prompt = (
-                    "Du är en samtalscoach för rektorer. Här är delanalyser av ett långt samtal. Sammanfatta och strukturera huvuddragen, viktiga perspektiv och slutsatser så att det blir en helhetsbild enligt LPGD-modellen.\n\nDELANALYSER:\n" + grupp
-                )
-                sammanfattning = get_ai_response(prompt)
-                if sammanfattning:
-                    sammanfattningar.append(sammanfattning)
-                else:
-                    st.warning(f"Sammanfattning av delgrupp {i+1} misslyckades.")
-            # Slutlig sammanfattning av alla delgruppssammanfattningar
-            slutprompt = (
-                "Du är en samtalscoach för rektorer. Här är flera del-sammanfattningar av ett långt samtal. Slå ihop till en slutlig, övergripande sammanfattning enligt LPGD-modellen.\n\nSAMMANFATTNINGAR:\n" + "\n\n".join(sammanfattningar)
-            )
-            return get_ai_response(slutprompt)
-        else:
-            return get_ai_response(sammanfattningsprompt)
+        from utils.text_chunking import count_tokens
+        call['prompt_tokens'] = count_tokens(SYSTEM_PROMPT + (prompt or ""), AI_MODEL)
+        call['completion_tokens'] = count_tokens(text or "", AI_MODEL)
+
+def _record_cache_hit(operation):
+    from utils.telemetry import record_call
+    record_call('openai-chat', operation, 0.0, model=AI_MODEL, cache_hit=True)
+
+def get_ai_response(prompt, max_tokens=MAX_RESPONSE_TOKENS):
+    """
+    Hämta AI-svar från OpenAI med ökat tokenlimit för bättre svar.
+    Svaret cachas på disk (utils/llm_cache.py) - samma prompt kostar bara ett anrop.
+    """
+    from utils.llm_cache import get_cached_response, store_response
+    from utils.telemetry import track_call
+
+    messages, params, cache_key = _build_request(prompt, max_tokens)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        _record_cache_hit('get_ai_response')
+        return cached
 
-@st.cache_data(show_spinner=False, ttl=0)
-def get_ai_response(prompt, max_tokens=4000):
-    """Hämta AI-svar från OpenAI med ökat tokenlimit för bättre svar"""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Du är en expert på att leda professionella gruppdiskussioner (LPGD-modellen) och pedagogisk ledning i svenska skolor. Du baserar dina råd på forskningsbaserade principer. Använd aldrig emojis i dina svar - skriv endast ren text."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        with track_call('openai-chat', 'get_ai_response', model=AI_MODEL) as call:
+            response = get_openai_client().chat.completions.create(model=AI_MODEL, messages=messages, **params)
+            _record_usage(call, response)
+        text = response.choices[0].message.content
+        store_response(cache_key, AI_MODEL, text, **params)
+        return text
     except Exception as e:
         st.error(f"Fel vid AI-anrop: {str(e)}")
         return None
 
-async def get_ai_response_async(prompt, max_tokens=4000):
-    """Async version av get_ai_response för parallell bearbetning"""
+async def get_ai_response_async(prompt, max_tokens=MAX_RESPONSE_TOKENS):
+    """Async version av get_ai_response för parallell bearbetning (samma cache)"""
+    from utils.llm_cache import get_cached_response, store_response
+    from utils.telemetry import track_call
+
+    messages, params, cache_key = _build_request(prompt, max_tokens)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        _record_cache_hit('get_ai_response_async')
+        return cached
+
     try:
-        response = await async_client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Du är en expert på att leda professionella gruppdiskussioner (LPGD-modellen) och pedagogisk ledning i svenska skolor. Du baserar dina råd på forskningsbaserade principer. Använd aldrig emojis i dina svar - skriv endast ren text."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        with track_call('openai-chat', 'get_ai_response_async', model=AI_MODEL) as call:
+            response = await get_async_openai_client().chat.completions.create(model=AI_MODEL, messages=messages, **params)
+            _record_usage(call, response)
+        text = response.choices[0].message.content
+        store_response(cache_key, AI_MODEL, text, **params)
+        return text
     except Exception as e:
         return None
 
-async def analyze_chunks_parallel(chunks, prompt_template, kwargs):
-    """Analysera flera chunks parallellt med asyncio.gather()"""
+def stream_ai_response(prompt, max_tokens=MAX_RESPONSE_TOKENS):
+    """
+    Som get_ai_response men som generator: texten lämnas i bitar allt
+    eftersom den kommer från OpenAI (för st.write_stream). Den färdiga
+    texten cachas som vanligt; ett cachat svar lämnas i en enda bit.
+    Avbryts strömmen kastas felet vidare efter de bitar som redan lämnats,
+    så att en avhuggen text inte kan tas för ett färdigt svar (se
+    write_ai_stream).
+    """
+    import time
+    from utils.llm_cache import get_cached_response, store_response
+    from utils.telemetry import track_call
+
+    messages, params, cache_key = _build_request(prompt, max_tokens)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        _record_cache_hit('stream_ai_response')
+        yield cached
+        return
+
+    parts = []
+    try:
+        with track_call('openai-chat', 'stream_ai_response', model=AI_MODEL) as call:
+            started = time.perf_counter()
+            response = get_openai_client().chat.completions.create(model=AI_MODEL, messages=messages, stream=True, **params)
+            for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        call['first_token_seconds'] = time.perf_counter() - started
+                    parts.append(delta)
+                    yield delta
+            _record_usage(call, None, prompt, "".join(parts))
+    except Exception as e:
+        st.error(f"Fel vid AI-anrop: {str(e)}")
+        raise
+
+    store_response(cache_key, AI_MODEL, "".join(parts), **params)
+
+def write_ai_stream(chunks):
+    """
+    Visa en strömmad AI-text med st.write_stream. Returnerar hela texten
+    om strömmen blev klar, annars None - sidan behåller då sitt tidigare
+    värde i stället för att spara en avhuggen text.
+    """
+    try:
+        return st.write_stream(chunks)
+    except Exception:
+        return None
+
+async def stream_ai_response_async(prompt, max_tokens=MAX_RESPONSE_TOKENS):
+    """Async version av stream_ai_response (async generator) - fel kastas vidare"""
+    import time
+    from utils.llm_cache import get_cached_response, store_response
+    from utils.telemetry import track_call
+
+    messages, params, cache_key = _build_request(prompt, max_tokens)
+    cached = get_cached_response(cache_key)
+    if cached is not None:
+        _record_cache_hit('stream_ai_response_async')
+        yield cached
+        return
+
+    parts = []
+    with track_call('openai-chat', 'stream_ai_response_async', model=AI_MODEL) as call:
+        started = time.perf_counter()
+        response = await get_async_openai_client().chat.completions.create(model=AI_MODEL, messages=messages, stream=True, **params)
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:
+                    call['first_token_seconds'] = time.perf_counter() - started
+                parts.append(delta)
+                yield delta
+        _record_usage(call, None, prompt, "".join(parts))
+
+    store_response(cache_key, AI_MODEL, "".join(parts), **params)
+
+async def analyze_chunks_parallel(chunks, prompt_template, kwargs, text_key='transcript'):
+    """Analysera flera chunks parallellt med asyncio.gather() - varje chunk ersätter fältet text_key"""
     tasks = []
     for chunk in chunks:
         local_kwargs = kwargs.copy()
-        local_kwargs['transcript'] = chunk
+        local_kwargs[text_key] = chunk
         prompt = prompt_template.format(**local_kwargs)
         tasks.append(get_ai_response_async(prompt))
 
@@ -380,36 +539,41 @@ async def analyze_chunks_parallel(chunks, prompt_template, kwargs):
 
     return delanalyser
 
-def get_ai_suggestion_steg1(problem_beskrivning, personal_grupp, kontext=""):
-    """Hämta AI-förslag för Steg 1"""
+def get_ai_suggestion_steg1(problem_beskrivning, personal_grupp, kontext="", stream=False):
+    """Hämta AI-förslag för Steg 1 (stream=True ger en generator för st.write_stream)"""
     prompt = STEG1_PROMPT.format(
         problem_beskrivning=problem_beskrivning,
         personal_grupp=personal_grupp,
         kontext=kontext
     )
+    if stream:
+        return stream_ai_response(prompt)
     return get_ai_response(prompt)
 
-def analyze_perspectives_steg2(problem_beskrivning, transcript):
+def analyze_perspectives_steg2(problem_beskrivning, transcript, stream=False):
     """Analysera perspektiv för Steg 2, stöd för långa transkriberingar"""
     return analyze_long_text(
         STEG2_PROMPT,
+        stream=stream,
         problem_beskrivning=problem_beskrivning,
         transcript=transcript
     )
 
-def analyze_discussion_steg3(problem_beskrivning, selected_perspectives, transcript):
+def analyze_discussion_steg3(problem_beskrivning, selected_perspectives, transcript, stream=False):
     """Analysera fördjupad diskussion för Steg 3, stöd för långa transkriberingar"""
     return analyze_long_text(
         STEG3_PROMPT,
+        stream=stream,
         problem_beskrivning=problem_beskrivning,
         selected_perspectives=selected_perspectives,
         transcript=transcript
     )
 
-def create_action_plan_steg4(problem_beskrivning, conclusions, action_suggestions=""):
+def create_action_plan_steg4(problem_beskrivning, conclusions, action_suggestions="", stream=False):
     """Skapa handlingsplan för Steg 4, stöd för långa slutsatser/transkriberingar"""
     return analyze_long_text(
         STEG4_PROMPT,
+        stream=stream,
         problem_beskrivning=problem_beskrivning,
         conclusions=conclusions,
         action_suggestions=action_suggestions
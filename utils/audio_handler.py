@@ -2,16 +2,39 @@ import streamlit as st
 import os
 from datetime import datetime
 import asyncio
+import threading
 from dotenv import load_dotenv
 
 # Ladda environment variabler
 load_dotenv()
 
+# Mottagare för statusmeddelanden när transkribering körs i en bakgrundstråd
+_progress = threading.local()
+
+def set_progress_reporter(reporter):
+    """
+    Skicka statusmeddelanden från transkriberingen i aktuell tråd till
+    reporter(level, message) i stället för till sidan. None återställer.
+    """
+    _progress.reporter = reporter
+
+def _notify(level, message):
+    """Visa ett statusmeddelande i sidan, eller rapportera det till bakgrundsjobbet"""
+    reporter = getattr(_progress, 'reporter', None)
+    if reporter is not None:
+        reporter(level, message)
+    else:
+        getattr(st, level)(message)
+
 def save_uploaded_audio(uploaded_file, session_id, step_number):
     """
     Spara uppladdad ljudfil (wav/mp3/m4a) på disk under data/audio.
     Använder streaming för stora filer för att undvika minnesöverbelastning.
+    SHA-256 räknas ut i samma loop och används som nyckel i transkriberingscachen.
     """
+    import hashlib
+    from utils.transcript_cache import register_audio_hash
+
     if not os.path.exists('data/audio'):
         os.makedirs('data/audio')
 
@@ -22,6 +45,7 @@ def save_uploaded_audio(uploaded_file, session_id, step_number):
 
     # Streama stora filer istället för att ladda allt i minnet
     chunk_size = 1024 * 1024  # 1 MB chunks
+    sha256 = hashlib.sha256()
     with open(filepath, 'wb') as f:
         uploaded_file.seek(0)
         while True:
@@ -29,6 +53,9 @@ def save_uploaded_audio(uploaded_file, session_id, step_number):
             if not chunk:
                 break
             f.write(chunk)
+            sha256.update(chunk)
+
+    register_audio_hash(filepath, sha256.hexdigest())
 
     return filepath
 
@@ -49,35 +76,62 @@ def save_recorded_audio(audio_bytes: bytes, session_id, step_number):
     
     with open(filepath, 'wb') as f:
         f.write(audio_bytes)
-    
+
+    import hashlib
+    from utils.transcript_cache import register_audio_hash
+    register_audio_hash(filepath, hashlib.sha256(audio_bytes).hexdigest())
+
     return filepath
 
-def transcribe_uploaded_file(uploaded_file, session_id, step_number):
+def save_recorded_upload(uploaded_file, session_id, step_number):
     """
-    Spara och transkribera en uppladdad ljudfil.
-    Returnerar tuple: (transcription_text, audio_file_path)
+    Spara en inspelning från st.audio_input utan att kopiera bufferten.
+    Den inspelade bufferten skrivs till disk i 1 MB-skivor av en memoryview,
+    och storlek och SHA-256 räknas ut på vägen.
+    Returnerar tuple: (sökväg, storlek i bytes)
     """
+    import hashlib
+    from utils.transcript_cache import register_audio_hash
+
+    if not os.path.exists('data/audio'):
+        os.makedirs('data/audio')
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"session_{session_id}_steg_{step_number}_recorded_{timestamp}.wav"
+    filepath = os.path.join('data/audio', filename)
+
+    chunk_size = 1024 * 1024  # 1 MB
+    sha256 = hashlib.sha256()
+    size = 0
+    # memoryview släpps när blocket är klart, så bufferten kan frigöras direkt
+    with uploaded_file.getbuffer() as view, open(filepath, 'wb') as f:
+        for start in range(0, len(view), chunk_size):
+            chunk = view[start:start + chunk_size]
+            f.write(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+
+    register_audio_hash(filepath, sha256.hexdigest())
+
+    return filepath, size
+
+def submit_uploaded_file(uploaded_file, session_id, step_number):
+    """
+    Spara en uppladdad ljudfil och lägg transkriberingen i bakgrundskön
+    (utils/transcription_worker.py). Sidan följer jobbet med
+    render_transcription_job_progress.
+    Returnerar tuple: (job_id, audio_file_path) eller (None, None) vid fel.
+    """
+    from utils.transcription_worker import submit_transcription_job
+
     try:
-        # Spara filen först
         audio_path = save_uploaded_audio(uploaded_file, session_id, step_number)
-        
-        if audio_path:
-            # Kontrollera filstorlek
-            file_size_mb = uploaded_file.size / (1024 * 1024)
-            st.info(f"📊 Filstorlek: {file_size_mb:.1f} MB")
-            
-            # Använd segmenterad transkribering för alla filer över 5 MB för maximal säkerhet
-            if file_size_mb > 5:  # Sänkt från 20 MB till 5 MB för extra säkerhet
-                st.info("🔄 Använder segmenterad transkribering för optimal säkerhet och resultat...")
-                transcription = transcribe_large_audio_file(audio_path)
-            else:
-                # Transkribera normalt endast för mycket små filer
-                transcription = transcribe_audio_file(audio_path)
-            
-            return transcription, audio_path
-        else:
+        if not audio_path:
             return None, None
-            
+
+        st.info(f"📊 Filstorlek: {uploaded_file.size / (1024 * 1024):.1f} MB")
+        return submit_transcription_job(audio_path), audio_path
+
     except Exception as e:
         st.error(f"Fel vid hantering av uppladdad fil: {e}")
         return None, None
@@ -85,264 +139,751 @@ def transcribe_uploaded_file(uploaded_file, session_id, step_number):
 def get_transcription_backend():
     """
     Hämta vald transkriberings-backend från environment
-    Returns: 'kb-whisper' eller 'openai' (default)
+    Returns: 'kb-whisper', 'openai' (default) eller 'auto' (val per jobb,
+    se utils/transcription_router.py)
     """
     return os.getenv('TRANSCRIPTION_BACKEND', 'openai').lower()
 
-def transcribe_audio_openai(audio_file_path):
+def transcribe_audio_openai(audio_file_path, duration_seconds=None, temporary=False):
     """
     Transkribera en sparad ljudfil med OpenAI Whisper-API.
     Använder whisper-1 (turbo) för 8x snabbare transkribering.
+    duration_seconds anger längden om den redan är känd. temporary=True
+    (t.ex. fönster under inspelning) läser inte in filen i metadataindexet.
     Returnerar transkribering som sträng eller None vid fel.
     """
+    from utils.transcription_scheduler import record_api_result
+    from utils.telemetry import track_call
+
     try:
-        from openai import OpenAI
+        from utils.openai_clients import get_openai_client
+        from utils.audio_metadata import get_audio_metadata
         import os
 
         # Kontrollera att API-nyckel finns
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
-            st.error("OPENAI_API_KEY saknas i miljövariabler")
+            _notify('error', "OPENAI_API_KEY saknas i miljövariabler")
             return None
 
-        client = OpenAI(api_key=api_key)
+        # Delad klient med öppna anslutningar (utils/openai_clients.py)
+        client = get_openai_client()
 
-        with open(audio_file_path, "rb") as audio_file:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",  # Whisper Turbo - 8x snabbare
-                file=audio_file,
-                language="sv"  # Optimera för svenska
-            )
+        audio_seconds = duration_seconds
+        if audio_seconds is None and not temporary:
+            audio_seconds = (get_audio_metadata(audio_file_path) or {}).get('duration_seconds')
+        with track_call('openai-whisper', 'transcribe_audio_openai', audio_file_path=audio_file_path,
+                        model="whisper-1", audio_seconds=audio_seconds):
+            with open(audio_file_path, "rb") as audio_file:
+                response = client.audio.transcriptions.create(
+                    model="whisper-1",  # Whisper Turbo - 8x snabbare
+                    file=audio_file,
+                    language="sv"  # Optimera för svenska
+                )
+        record_api_result(True)
         return response.text
     except Exception as e:
-        st.error(f"Fel vid transkribering: {e}")
+        record_api_result(False)
+        _notify('error', f"Fel vid transkribering: {e}")
         return None
 
-def transcribe_audio_file(audio_file_path):
+def get_transcription_cache_params(backend, model_size=None):
     """
-    Transkribera en ljudfil med vald backend (KB-Whisper eller OpenAI)
-    Automatiskt val baserat på TRANSCRIPTION_BACKEND environment variabel
-
-    Args:
-        audio_file_path: Sökväg till ljudfil
+    Returnerar (model_id, style) som ingår i transkriberingscachens nyckel
+    för given backend (och KB-Whisper-storlek om den avviker från standard).
+    """
+    if backend == 'kb-whisper':
+        from utils.kb_whisper import KB_WHISPER_MODELS, get_kb_whisper_model_id, get_transcription_style, get_inference_engine
+        engine = get_inference_engine()
+        style = get_transcription_style()
+        model_id = KB_WHISPER_MODELS.get(model_size) or get_kb_whisper_model_id()
+        # Kvantiserade motorer ger inte exakt samma text - egen cachepost
+        return model_id, style if engine == 'transformers' else f"{style}+{engine}"
+    return 'whisper-1', 'default'
 
-    Returns:
-        Transkribering som sträng eller None vid fel
+def get_cached_transcription(audio_file_path, backend, model_size=None):
+    """
+    Slå upp en tidigare transkribering av samma ljud (SHA-256) med samma
+    backend, modell och stil. Returnerar (transkribering, audio_hash).
     """
-    backend = get_transcription_backend()
+    try:
+        from utils.transcript_cache import get_audio_hash, get_cached_transcript
+
+        audio_hash = get_audio_hash(audio_file_path)
+        model_id, style = get_transcription_cache_params(backend, model_size)
+        cached = get_cached_transcript(audio_hash, backend, model_id, style)
+        if cached:
+            from utils.telemetry import record_call
+            record_call('kb-whisper' if backend == 'kb-whisper' else 'openai-whisper', 'transcript_cache', 0.0,
+                        audio_file_path=audio_file_path, model=model_id, cache_hit=True)
+        return cached, audio_hash
+    except Exception:
+        return None, None
+
+def cache_transcription(audio_hash, backend, transcription, model_size=None):
+    """Spara en lyckad transkribering i cachen"""
+    if not audio_hash or not transcription:
+        return
+    try:
+        from utils.transcript_cache import store_transcript
+
+        model_id, style = get_transcription_cache_params(backend, model_size)
+        store_transcript(audio_hash, backend, model_id, style, transcription)
+    except Exception:
+        pass
 
+def _transcribe_with_backend(audio_file_path, backend, model_size=None, temporary=False, duration_seconds=None):
+    """
+    Transkribera med angiven backend, med fallback till OpenAI.
+    model_size väljer KB-Whisper-storlek (None = KB_WHISPER_MODEL).
+    temporary=True för kortlivade filer (fönster under inspelning): varken
+    PCM-cache eller metadataindex används, längden ges i duration_seconds.
+    Returnerar tuple: (transcription_text, backend_som_användes)
+    """
     if backend == 'kb-whisper':
-        st.info("🇸🇪 Använder KB-Whisper (lokal svensk modell)")
+        _notify('info', "🇸🇪 Använder KB-Whisper (lokal svensk modell)")
         try:
-            from utils.kb_whisper import transcribe_with_kb_whisper, is_kb_whisper_available
+            from utils.kb_whisper import is_kb_whisper_available
+            from utils.transcription_worker import transcribe_with_kb_whisper_pool
 
             if not is_kb_whisper_available():
-                st.warning("⚠️ KB-Whisper dependencies saknas. Installera med: pip install transformers torch accelerate librosa soundfile")
-                st.info("🔄 Faller tillbaka till OpenAI Whisper...")
-                return transcribe_audio_openai(audio_file_path)
+                _notify('warning', "⚠️ KB-Whisper dependencies saknas. Installera med: pip install transformers torch accelerate librosa soundfile")
+                _notify('info', "🔄 Faller tillbaka till OpenAI Whisper...")
+                return transcribe_audio_openai(audio_file_path, duration_seconds, temporary), 'openai'
 
-            return transcribe_with_kb_whisper(audio_file_path)
+            from utils.telemetry import track_call
+            from utils.audio_metadata import get_audio_metadata
+
+            audio_seconds = duration_seconds
+            if audio_seconds is None and not temporary:
+                audio_seconds = (get_audio_metadata(audio_file_path) or {}).get('duration_seconds')
+            with track_call('kb-whisper', 'transcribe_with_kb_whisper', audio_file_path=audio_file_path,
+                            model=model_size or 'default', audio_seconds=audio_seconds) as call:
+                transcription = transcribe_with_kb_whisper_pool(audio_file_path, model_size=model_size, temporary=temporary)
+                call['success'] = transcription is not None
+            return transcription, 'kb-whisper'
         except Exception as e:
-            st.error(f"❌ Fel vid KB-Whisper transkribering: {e}")
-            st.info("🔄 Faller tillbaka till OpenAI Whisper...")
-            return transcribe_audio_openai(audio_file_path)
+            _notify('error', f"❌ Fel vid KB-Whisper transkribering: {e}")
+            _notify('info', "🔄 Faller tillbaka till OpenAI Whisper...")
+            return transcribe_audio_openai(audio_file_path, duration_seconds, temporary), 'openai'
     else:
-        st.info("🌐 Använder OpenAI Whisper API")
-        return transcribe_audio_openai(audio_file_path)
+        _notify('info', "🌐 Använder OpenAI Whisper API")
+        return transcribe_audio_openai(audio_file_path, duration_seconds, temporary), 'openai'
 
-def split_audio_file(audio_file_path, segment_duration_minutes=10):
+def transcribe_audio_file(audio_file_path, backend=None, model_size=None):
     """
-    Dela upp en ljudfil i segment för transkribering med ffmpeg.
-    Stöder wav, mp3, m4a och andra format som ffmpeg kan hantera.
-    Returnerar lista med sökvägar till segment-filer.
+    Transkribera en ljudfil med vald backend (KB-Whisper eller OpenAI)
+    Automatiskt val baserat på TRANSCRIPTION_BACKEND environment variabel.
+    Med TRANSCRIPTION_BACKEND=auto väljer routern backend per fil och
+    flyttar jobbet till den andra backenden om det misslyckas.
+    Samma ljud transkriberas bara en gång - tidigare resultat hämtas ur cachen.
+
+    Args:
+        audio_file_path: Sökväg till ljudfil
+        backend: Tvinga en backend ('kb-whisper' eller 'openai') i stället för valet ovan
+        model_size: KB-Whisper-storlek (None = KB_WHISPER_MODEL)
+
+    Returns:
+        Transkribering som sträng eller None vid fel
     """
+    failover = False
+    if backend is None:
+        from utils.transcription_router import route_transcription
+        from utils.transcription_worker import get_queue_depth
+        route = route_transcription(audio_file_path, local_queue_depth=get_queue_depth('kb-whisper'))
+        backend, model_size = route["backend"], route["model_size"]
+        failover = get_transcription_backend() == 'auto'
+
+    cached, audio_hash = get_cached_transcription(audio_file_path, backend, model_size)
+    if cached:
+        _notify('success', "⚡ Samma ljudfil har redan transkriberats - hämtar sparad transkribering")
+        return cached
+
     try:
-        import subprocess
-        import math
-        import json
-
-        st.info(f"🔍 Analyserar ljudfil: {os.path.basename(audio_file_path)}")
-
-        # Använd ffprobe för att få ljudfilens längd
-        probe_cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'json',
-            audio_file_path
-        ]
-
-        result = subprocess.run(probe_cmd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            st.error(f"Kunde inte analysera ljudfil: {result.stderr}")
-            return []
-
-        probe_data = json.loads(result.stdout)
-        total_duration_seconds = float(probe_data['format']['duration'])
-
-        # Visa info om filen
-        duration_minutes = int(total_duration_seconds / 60)
-        st.info(f"⏱️ Ljudfilens längd: {duration_minutes} minuter ({total_duration_seconds:.0f} sekunder)")
-
-        # Beräkna segment-längd i sekunder
-        segment_duration_seconds = segment_duration_minutes * 60
-
-        # Beräkna antal segment
-        num_segments = math.ceil(total_duration_seconds / segment_duration_seconds)
-
-        st.info(f"✂️ Delar upp i {num_segments} segment à {segment_duration_minutes} minuter")
-
-        segment_paths = []
-        base_path = audio_file_path.rsplit('.', 1)[0]
-
-        for i in range(num_segments):
-            start_time = i * segment_duration_seconds
-            segment_path = f"{base_path}_segment_{i+1}.wav"
-
-            # Använd ffmpeg för att extrahera segment och konvertera till WAV
-            # Detta säkerställer kompatibilitet med OpenAI Whisper oavsett källformat
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-i', audio_file_path,
-                '-ss', str(start_time),
-                '-t', str(segment_duration_seconds),
-                '-acodec', 'pcm_s16le',
-                '-ar', '16000',
-                '-ac', '1',
-                '-y',  # Overwrite output file if it exists
-                '-loglevel', 'error',  # Minska output
-                segment_path
-            ]
-
-            result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-
-            if result.returncode != 0:
-                st.warning(f"⚠️ Kunde inte skapa segment {i+1}: {result.stderr}")
-                continue
+        transcription, used_backend = _transcribe_with_backend(audio_file_path, backend, model_size)
 
-            segment_paths.append(segment_path)
-            st.success(f"✅ Segment {i+1}/{num_segments} skapat")
+        if not transcription and failover:
+            from utils.transcription_router import get_failover_backend, log_failover
+            next_backend = get_failover_backend(used_backend)
+            if next_backend:
+                log_failover(audio_file_path, used_backend, next_backend)
+                _notify('info', "🔄 Försöker igen med den andra transkriberingstjänsten...")
+                model_size = None
+                transcription, used_backend = _transcribe_with_backend(audio_file_path, next_backend)
+    finally:
+        _remove_decoded_audio(audio_file_path)
 
-        return segment_paths
+    cache_transcription(audio_hash, used_backend, transcription, model_size if used_backend == 'kb-whisper' else None)
+    return transcription
 
-    except FileNotFoundError:
-        st.error("❌ ffmpeg är inte installerat. Installera ffmpeg för att hantera stora ljudfiler.")
-        st.info("På Mac: brew install ffmpeg\nPå Linux: apt-get install ffmpeg")
-        return []
-    except Exception as e:
-        st.error(f"❌ Fel vid segmentering av ljudfil: {e}")
-        return []
+def _remove_decoded_audio(audio_file_path):
+    """Ta bort den delade PCM-filen när transkriberingen är klar - den behövs inte längre"""
+    try:
+        from utils.pcm_cache import remove_pcm
+        remove_pcm(audio_file_path)
+    except ImportError:
+        pass
 
-async def transcribe_audio_openai_async(audio_file_path, segment_number=None):
+def _probe_audio_duration(audio_file_path):
+    """
+    Hämta ljudfilens längd i sekunder ur metadataindexet (ffprobe läser
+    endast headern, en gång per fil).
+    Returnerar float eller kastar RuntimeError om ffprobe misslyckas.
+    """
+    from utils.audio_metadata import get_audio_metadata
+
+    metadata = get_audio_metadata(audio_file_path)
+    if not metadata or not metadata.get("duration_seconds"):
+        raise RuntimeError(f"Kunde inte läsa längden på {audio_file_path}")
+    return metadata["duration_seconds"]
+
+def _decoded_input(audio_file_path):
+    """
+    Indata för ffmpeg: den delade PCM-filen om uppladdningen redan är
+    avkodad (utils/pcm_cache.py), annars originalfilen.
+    Returnerar (sökväg, ffmpeg-flaggor som ska stå före -i).
+    """
+    from utils.pcm_cache import is_pcm_cache_enabled, get_existing_pcm, pcm_input_args
+
+    if is_pcm_cache_enabled():
+        pcm_path = get_existing_pcm(audio_file_path)
+        if pcm_path:
+            return pcm_path, pcm_input_args()
+    return audio_file_path, []
+
+async def _request_openai_transcription_async(client, audio_file_path):
+    """Ett enskilt Whisper-anrop. Kastar fel så att schemaläggaren kan göra om det."""
+    with open(audio_file_path, "rb") as audio_file:
+        response = await client.audio.transcriptions.create(
+            model="whisper-1",  # Whisper Turbo - 8x snabbare
+            file=audio_file,
+            language="sv"  # Optimera för svenska
+        )
+    return response.text
+
+async def transcribe_audio_openai_async(audio_file_path, segment_number=None, scheduler=None):
     """
     Asynkron transkribering av en ljudfil med OpenAI Whisper-API.
     Använder whisper-1 (turbo) med svenskoptimering för 8x snabbare transkribering.
+    Tillfälliga fel (429, timeout, 5xx) görs om med backoff via schemaläggaren.
     Returnerar tuple: (segment_number, transcription_text) eller (segment_number, None) vid fel.
     """
     try:
-        from openai import AsyncOpenAI
+        from utils.openai_clients import get_async_openai_client
+        from utils.transcription_scheduler import TranscriptionScheduler
         import os
 
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             return (segment_number, None)
 
-        client = AsyncOpenAI(api_key=api_key)
+        # Samma klient för alla segment i loopen - anslutningarna återanvänds.
+        # Schemaläggaren gör omförsöken (med token bucket), så klienten gör inga egna.
+        client = get_async_openai_client().with_options(max_retries=0)
+        scheduler = scheduler or TranscriptionScheduler()
 
-        with open(audio_file_path, "rb") as audio_file:
-            response = await client.audio.transcriptions.create(
-                model="whisper-1",  # Whisper Turbo - 8x snabbare
-                file=audio_file,
-                language="sv"  # Optimera för svenska
-            )
-        return (segment_number, response.text)
+        text = await scheduler.run(
+            segment_number,
+            lambda: _request_openai_transcription_async(client, audio_file_path)
+        )
+        return (segment_number, text)
     except Exception as e:
         return (segment_number, None)
 
-async def transcribe_segments_parallel(segment_paths):
+async def transcribe_segments_parallel(segment_paths, scheduler=None):
     """
     Transkribera flera segment parallellt med asyncio.
+    Antal samtidiga anrop begränsas av TranscriptionScheduler.
     Returnerar lista av tupler: [(segment_number, transcription), ...]
     """
+    from utils.transcription_scheduler import TranscriptionScheduler
+
+    scheduler = scheduler or TranscriptionScheduler()
+
     tasks = []
     for i, segment_path in enumerate(segment_paths):
-        task = transcribe_audio_openai_async(segment_path, segment_number=i+1)
+        task = transcribe_audio_openai_async(segment_path, segment_number=i+1, scheduler=scheduler)
         tasks.append(task)
 
-    # Kör alla transkriberingsjobb parallellt
+    # Kör alla transkriberingsjobb parallellt (inom schemaläggarens gräns)
     results = await asyncio.gather(*tasks)
     return results
 
-def transcribe_large_audio_file(audio_file_path):
+async def produce_planned_segments(audio_file_path, segment_queue, segment_duration_minutes=10, silence_aware=True,
+                                   overlap_seconds=0.0, skip_segments=None):
     """
-    Transkribera en stor ljudfil genom att dela upp den i segment och
+    Producent som avkodar källfilen EN gång: ffmpeg skriver 16 kHz mono PCM
+    till en pipe, tystnaderna letas upp i PCM-blocken medan de kommer och
+    varje segment kodas direkt från det avkodade ljudet så fort planen inte
+    längre kan flytta dess gränser (plan_next_segment). Med silence_aware
+    läggs gränserna i pauser och långa tystnader hoppas över; med
+    overlap_seconds överlappar varje segment nästa. Är kön full väntar
+    producenten, och därmed avkodningen, innan nästa segment läggs i kön.
+    Segment i skip_segments kodas inte alls.
+    Avslutas alltid med None i kön. Returnerar antal producerade segment.
+    """
+    try:
+        return await _stream_planned_segments(audio_file_path, segment_queue, segment_duration_minutes * 60,
+                                              silence_aware, overlap_seconds, skip_segments or set())
+    finally:
+        await segment_queue.put(None)
+
+async def _stream_planned_segments(audio_file_path, segment_queue, segment_seconds, silence_aware, overlap_seconds,
+                                   skip_segments, plan_step_seconds=30.0):
+    """Avkoda, planera och koda segmenten åt produce_planned_segments"""
+    from utils.audio_segmentation import (
+        plan_next_segment, merge_silences, build_stream_decode_command, build_encode_command,
+        get_segment_format, get_silence_threshold_db, get_min_pause_seconds
+    )
+    from utils.pcm_cache import SAMPLE_RATE, SILENCE_FRAME_SECONDS
+
+    base_path = audio_file_path.rsplit('.', 1)[0]
+    extension = get_segment_format()["extension"]
+    bytes_per_second = SAMPLE_RATE * 2
+    frame_bytes = int(SAMPLE_RATE * SILENCE_FRAME_SECONDS) * 2
+    noise_db = get_silence_threshold_db()
+    min_pause_seconds = get_min_pause_seconds()
+
+    buffer = bytearray()    # Avkodad PCM från buffer_offset och framåt
+    buffer_offset = 0       # Byteposition i hela ljudet där bufferten börjar
+    decoded = 0             # Antal avkodade byte hittills
+    analysed = 0            # Antal byte som tystnadsanalysen har gått igenom
+    planned_at = 0
+    silences = []
+    cursor = 0.0
+    number = 0
+    produced = 0
+    kept_seconds = 0.0
+
+    def analyse_new_audio():
+        nonlocal analysed
+        import numpy as np
+        from utils.pcm_cache import detect_silences_pcm
+
+        # Hela analysramar räknat från filens början, så blockgränserna inte påverkar resultatet
+        end = decoded - (decoded - analysed) % frame_bytes
+        if end <= analysed:
+            return
+        block = np.frombuffer(buffer[analysed - buffer_offset:end - buffer_offset], dtype='<i2')
+        block_start = analysed / bytes_per_second
+        # Alla tysta ramar tas med - min_pause_seconds gäller hela den sammanslagna tystnaden
+        merge_silences(silences, [
+            (block_start + start, block_start + end_seconds)
+            for start, end_seconds in detect_silences_pcm(block, noise_db, 0.0)
+        ])
+        analysed = end
+
+    def segment_pcm(segment):
+        return b"".join(
+            buffer[int(round(start * SAMPLE_RATE)) * 2 - buffer_offset:
+                   int(round(end * SAMPLE_RATE)) * 2 - buffer_offset]
+            for start, end in segment["spans"]
+        )
+
+    async def encode_segment(segment, segment_path):
+        encoder = await asyncio.create_subprocess_exec(
+            *build_encode_command(segment_path),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await encoder.communicate(input=segment_pcm(segment))
+        if encoder.returncode != 0:
+            _notify('warning', f"⚠️ Kunde inte skapa segment {segment['number']}: {stderr.decode(errors='ignore')}")
+            return False
+        return True
+
+    # Finns filen redan avkodad (t.ex. av KB-Whisper) läses den delade PCM-filen, annars originalet
+    input_path, input_args = _decoded_input(audio_file_path)
+    _notify('info',
+        "✂️ Delar upp ljudet" + (" vid pauser" if silence_aware else "") + " medan det avkodas"
+        + (f" - {overlap_seconds:.0f} s överlapp" if overlap_seconds > 0 else "")
+    )
+
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *build_stream_decode_command(input_path, input_args=input_args),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        finished = False
+        while not finished:
+            chunk = await process.stdout.read(64 * 1024)
+            if chunk:
+                buffer += chunk
+                decoded += len(chunk)
+                # Planera om var plan_step_seconds avkodat ljud, inte för varje block från pipen
+                if decoded - planned_at < plan_step_seconds * bytes_per_second:
+                    continue
+            else:
+                finished = True
+            planned_at = decoded
+
+            if silence_aware:
+                analyse_new_audio()
+            decoded_seconds = (decoded - decoded % 2) / bytes_per_second
+            candidates = [(start, end) for start, end in silences if end - start >= min_pause_seconds]
+
+            while True:
+                segment, cursor = plan_next_segment(
+                    cursor, decoded_seconds, candidates, segment_seconds, finished,
+                    silence_aware=silence_aware, overlap_seconds=overlap_seconds
+                )
+                if segment is None:
+                    break
+                number += 1
+                segment["number"] = number
+                kept_seconds += segment["audio_seconds"] - segment.get("overlap_seconds", 0.0)
+                if number in skip_segments:
+                    continue
+                segment_path = f"{base_path}_segment_{number}.{extension}"
+                if not await encode_segment(segment, segment_path):
+                    continue
+                produced += 1
+                await segment_queue.put((number, segment_path, segment))
+
+            # Ljud före cursor och tystnader som slutat behövs inte längre
+            keep_from = int(cursor * SAMPLE_RATE) * 2
+            if silence_aware:
+                keep_from = min(analysed, keep_from)
+            del buffer[:keep_from - buffer_offset]
+            buffer_offset = keep_from
+            silences[:] = [(start, end) for start, end in silences if end >= cursor]
+
+        await process.wait()
+        stderr = await stderr_task
+        if process.returncode != 0:
+            _notify('warning', f"⚠️ ffmpeg rapporterade fel vid avkodning: {stderr.decode(errors='ignore')}")
+
+        dropped_seconds = decoded_seconds - kept_seconds
+        if dropped_seconds >= 1:
+            _notify('info', f"✂️ {number} segment - hoppade över {dropped_seconds / 60:.1f} minuter tystnad")
+    finally:
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    return produced
+
+async def transcribe_audio_pipelined(audio_file_path, segment_duration_minutes=10, overlap_seconds=0.0,
+                                     skip_segments=None, on_segment_result=None):
+    """
+    Segmentera och transkribera samtidigt: varje segment skickas till Whisper
+    så fort ffmpeg har skrivit det, och raderas direkt när transkriberingen
+    kommit tillbaka. Kön är begränsad och nästa segment hämtas först när en
+    plats hos schemaläggaren är ledig, så avkodningen väntar in uppladdningarna
+    och högst ungefär två gånger TRANSCRIPTION_MAX_CONCURRENCY segment ligger
+    på disk samtidigt. Källfilen avkodas en gång och segmenten kodas ett i
+    taget medan planen byggs.
+    Med pausmedveten segmentering (standard) läggs gränserna i pauser, och med
+    overlap_seconds överlappar segmenten så att de kan sammanfogas.
+    skip_segments hoppar över redan klara segment och on_segment_result(
+    segment_number, transcription, segment_info, stat) anropas per segment.
+    Returnerar lista av tupler: [(segment_number, transcription, segment_info), ...]
+    """
+    from utils.transcription_scheduler import TranscriptionScheduler
+    from utils.audio_segmentation import is_silence_aware_segmentation_enabled
+    from utils.telemetry import record_call
+
+    scheduler = TranscriptionScheduler()
+    # Ett segment i kön per upptagen plats - producenten väntar när kön är full
+    segment_queue = asyncio.Queue(maxsize=scheduler.max_concurrency)
+    slots = asyncio.Semaphore(scheduler.max_concurrency)
+    producer = asyncio.create_task(
+        produce_planned_segments(audio_file_path, segment_queue, segment_duration_minutes,
+                                 silence_aware=is_silence_aware_segmentation_enabled(),
+                                 overlap_seconds=overlap_seconds, skip_segments=skip_segments)
+    )
+
+    async def transcribe_and_cleanup(segment_number, segment_path, segment_info):
+        try:
+            _, transcription = await transcribe_audio_openai_async(segment_path, segment_number=segment_number, scheduler=scheduler)
+            stat = scheduler.stats.get(segment_number, {})
+            record_call('openai-whisper', 'whisper_segment', stat.get('latency_seconds'),
+                        success=bool(transcription), audio_file_path=audio_file_path, model="whisper-1",
+                        audio_seconds=segment_info['end'] - segment_info['start'],
+                        retries=max(0, stat.get('attempts', 1) - 1), error=stat.get('error'))
+            if transcription:
+                _notify('success', f"✅ Segment {segment_number} transkriberat ({stat.get('attempts', 1)} försök, {stat.get('latency_seconds', 0):.1f} s)")
+            else:
+                _notify('warning', f"⚠️ Segment {segment_number} misslyckades efter {stat.get('attempts', 1)} försök: {stat.get('error')}")
+            if on_segment_result:
+                on_segment_result(segment_number, transcription, segment_info, stat)
+            return (segment_number, transcription, segment_info)
+        finally:
+            slots.release()
+            try:
+                os.remove(segment_path)
+            except OSError:
+                pass
+
+    tasks = []
+    while True:
+        # Hämta nästa segment först när det finns plats att skicka det
+        await slots.acquire()
+        item = await segment_queue.get()
+        if item is None:
+            slots.release()
+            break
+        segment_number, segment_path, segment_info = item
+        _notify('info', f"📤 Segment {segment_number} klart - skickas till transkribering")
+        tasks.append(asyncio.create_task(transcribe_and_cleanup(segment_number, segment_path, segment_info)))
+
+    # Propagera eventuella fel från producenten (t.ex. saknad ffmpeg)
+    await producer
+
+    results = await asyncio.gather(*tasks)
+
+    if scheduler.stats:
+        if getattr(_progress, 'reporter', None) is not None:
+            _notify('info', scheduler.format_report())
+        else:
+            with st.expander("⏱️ Försök och latens per segment"):
+                st.text(scheduler.format_report())
+
+    return results
+
+def _transcription_job_key(audio_hash, segment_seconds, overlap_seconds, silence_aware):
+    """
+    Nyckel för ett återupptagbart transkriberingsjobb. Innehåller alla
+    inställningar som påverkar segmentplanen, så att sparade segment bara
+    återanvänds om segmenten blir exakt likadana.
+    """
+    import hashlib
+    from utils.audio_segmentation import (
+        get_segment_format, get_silence_threshold_db, get_min_pause_seconds, get_drop_silence_seconds
+    )
+
+    settings = [
+        audio_hash, 'openai', 'whisper-1', get_segment_format()["extension"],
+        f"{segment_seconds:.1f}", f"{overlap_seconds:.1f}", str(silence_aware)
+    ]
+    if silence_aware:
+        settings += [str(get_silence_threshold_db()), str(get_min_pause_seconds()), str(get_drop_silence_seconds())]
+    return hashlib.sha256("|".join(settings).encode('utf-8')).hexdigest()
+
+def _assemble_segment_transcripts(results, overlap_seconds):
+    """
+    Bygg den slutliga transkriberingen av segmentresultat.
+    Returnerar tuple: (full_transcription eller None, failed_segments)
+    """
+    from utils.audio_segmentation import format_timestamp
+    from utils.transcript_stitching import stitch_transcripts
+
+    transcriptions = []
+    failed_segments = []
+
+    # Grupper av på varandra följande lyckade segment (för sammanfogning vid överlapp)
+    groups = []
+    previous_num = None
+
+    for segment_num, transcription, segment_info in sorted(results, key=lambda x: x[0] if x[0] else 0):
+        if not transcription:
+            failed_segments.append(segment_num)
+            continue
+        if overlap_seconds > 0 and groups and previous_num is not None and segment_num == previous_num + 1:
+            groups[-1].append((segment_num, transcription, segment_info))
+        else:
+            groups.append([(segment_num, transcription, segment_info)])
+        previous_num = segment_num
+
+    for group in groups:
+        first_num, _, first_info = group[0]
+        if overlap_seconds > 0:
+            # Överlappande segment sammanfogas till löpande text utan dubbletter
+            text = stitch_transcripts([t for _, t, _ in group], overlap_seconds)
+            if len(groups) == 1:
+                transcriptions.append(text)
+                continue
+            label = f"Segment {first_num}" if len(group) == 1 else f"Segment {first_num}–{group[-1][0]}"
+        else:
+            text = group[0][1]
+            label = f"Segment {first_num}"
+        # Starttid i originalinspelningen så att texten går att hitta i ljudet
+        transcriptions.append(f"[{label} · {format_timestamp(first_info['start'])}]\n{text}")
+
+    full_transcription = "\n\n".join(transcriptions) if transcriptions else None
+    return full_transcription, failed_segments
+
+def transcribe_large_audio_file(audio_file_path, backend=None, model_size=None):
+    """
+    Transkribera en stor ljudfil (över 5 MB).
+    Med OpenAI delas filen i segment som transkriberas parallellt, KB-Whisper
+    hanterar långa filer lokalt. Utan backend väljer routern backend, och med
+    TRANSCRIPTION_BACKEND=auto flyttas jobbet till den andra backenden om det
+    misslyckas - på samma sätt som i transcribe_audio_file.
+    Returnerar transkribering eller None vid fel.
+    """
+    if backend is not None:
+        if backend == 'kb-whisper':
+            return transcribe_audio_file(audio_file_path, backend=backend, model_size=model_size)
+        try:
+            return _transcribe_large_audio_file_openai(audio_file_path)
+        finally:
+            _remove_decoded_audio(audio_file_path)
+
+    from utils.transcription_router import route_transcription, get_failover_backend, log_failover
+    from utils.transcription_worker import get_queue_depth
+
+    route = route_transcription(audio_file_path, local_queue_depth=get_queue_depth('kb-whisper'))
+    transcription = transcribe_large_audio_file(audio_file_path, route["backend"], route["model_size"])
+
+    if not transcription and get_transcription_backend() == 'auto':
+        next_backend = get_failover_backend(route["backend"])
+        if next_backend:
+            log_failover(audio_file_path, route["backend"], next_backend)
+            _notify('info', "🔄 Försöker igen med den andra transkriberingstjänsten...")
+            transcription = transcribe_large_audio_file(audio_file_path, next_backend)
+    return transcription
+
+def _transcribe_large_audio_file_openai(audio_file_path):
+    """
+    Transkribera en stor ljudfil med OpenAI genom att dela upp den i segment och
     bearbeta dem parallellt för maximal hastighet.
-    Använder asyncio för parallell bearbetning - 6x snabbare än sekventiell.
+    Segmentering och transkribering överlappar: varje segment skickas till
+    Whisper så fort det är skrivet och raderas när svaret kommit.
+    Varje segment sparas i databasen (transcription_jobs), så ett avbrutet
+    jobb återupptas med endast de segment som saknas.
     Returnerar sammanslagen transkribering.
     """
     try:
         import asyncio
+        from utils.openai_clients import run_async
+        from utils.database import (
+            get_or_create_transcription_job, update_transcription_job,
+            save_transcription_segment, get_completed_transcription_segments
+        )
 
-        # Dela upp filen i 10-minuters segment för maximal säkerhet
-        st.info("🔄 Delar upp ljudfilen i 10-minuters segment för optimal transkribering...")
-        segment_paths = split_audio_file(audio_file_path, segment_duration_minutes=10)
+        cached, audio_hash = get_cached_transcription(audio_file_path, 'openai')
+        if cached:
+            _notify('success', "⚡ Samma ljudfil har redan transkriberats - hämtar sparad transkribering")
+            return cached
 
-        if not segment_paths:
-            st.error("Kunde inte dela upp ljudfilen")
+        try:
+            total_duration_seconds = _probe_audio_duration(audio_file_path)
+            _notify('info', f"⏱️ Ljudfilens längd: {int(total_duration_seconds / 60)} minuter ({total_duration_seconds:.0f} sekunder)")
+        except RuntimeError as e:
+            _notify('error', f"Kunde inte analysera ljudfil: {e}")
             return None
 
-        st.info(f"📂 Skapade {len(segment_paths)} segment för parallell transkribering")
-        st.info(f"⚡ Transkriberar alla segment samtidigt (parallell bearbetning)...")
+        from utils.audio_segmentation import (
+            get_segment_overlap_seconds, choose_segment_seconds, is_silence_aware_segmentation_enabled
+        )
+
+        # Segmentlängden väljs utifrån bytebudget och segmentkodning
+        segment_duration_minutes = choose_segment_seconds() / 60
+        overlap_seconds = get_segment_overlap_seconds()
+
+        # Återuppta tidigare jobb med samma ljud och segmentinställningar
+        job = get_or_create_transcription_job(
+            _transcription_job_key(audio_hash or audio_file_path, segment_duration_minutes * 60,
+                                   overlap_seconds, is_silence_aware_segmentation_enabled()),
+            audio_file_path, audio_hash, 'openai'
+        )
+        if job['status'] == 'completed' and job['transcript']:
+            _notify('success', "⚡ Transkriberingen är redan klar - hämtar sparat resultat")
+            return job['transcript']
+
+        completed = get_completed_transcription_segments(job['id'])
+        if completed:
+            _notify('info', f"♻️ Återupptar avbruten transkribering - {len(completed)} segment är redan klara")
+        update_transcription_job(job['id'], 'running')
+
+        def save_segment_result(segment_number, transcription, segment_info, stat):
+            save_transcription_segment(
+                job['id'], segment_number,
+                'completed' if transcription else 'failed',
+                transcript=transcription,
+                start_seconds=segment_info['start'],
+                end_seconds=segment_info['end'],
+                attempts=stat.get('attempts'),
+                latency_seconds=stat.get('latency_seconds'),
+                error=stat.get('error')
+            )
+
+        _notify('info', f"🔄 Delar upp ljudfilen i upp till {segment_duration_minutes:.1f}-minuters segment och transkriberar dem medan de skapas...")
 
-        # Kör parallell transkribering med asyncio
+        # Kör pipelinen (segmentering + parallell transkribering) med asyncio
+        pipeline_kwargs = {
+            "segment_duration_minutes": segment_duration_minutes,
+            "overlap_seconds": overlap_seconds,
+            "skip_segments": set(completed),
+            "on_segment_result": save_segment_result
+        }
         try:
-            results = asyncio.run(transcribe_segments_parallel(segment_paths))
+            results = run_async(transcribe_audio_pipelined(audio_file_path, **pipeline_kwargs))
         except RuntimeError:
             # Om event loop redan körs
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            results = loop.run_until_complete(transcribe_segments_parallel(segment_paths))
+            results = loop.run_until_complete(transcribe_audio_pipelined(audio_file_path, **pipeline_kwargs))
             loop.close()
 
-        # Sortera resultat efter segment_number och bygg transcription
-        transcriptions = []
-        failed_segments = []
+        # Lägg till segment som transkriberades i en tidigare körning
+        for segment_number, segment in completed.items():
+            segment_info = {
+                "number": segment_number,
+                "start": segment['start_seconds'],
+                "end": segment['end_seconds'],
+                "spans": [(segment['start_seconds'], segment['end_seconds'])]
+            }
+            results.append((segment_number, segment['transcript'], segment_info))
 
-        for segment_num, transcription in sorted(results, key=lambda x: x[0] if x[0] else 0):
-            if transcription:
-                transcriptions.append(f"[Segment {segment_num}]\n{transcription}")
-            else:
-                failed_segments.append(segment_num)
+        if not results:
+            update_transcription_job(job['id'], 'failed')
+            _notify('error', "Kunde inte dela upp ljudfilen")
+            return None
 
-        # Rensa alla segment-filer efter transkribering
-        for segment_path in segment_paths:
-            try:
-                os.remove(segment_path)
-            except:
-                pass
+        full_transcription, failed_segments = _assemble_segment_transcripts(results, overlap_seconds)
 
         # Visa resultat
         if failed_segments:
-            st.warning(f"⚠️ Segment {', '.join(map(str, failed_segments))} kunde inte transkriberas")
+            _notify('warning', f"⚠️ Segment {', '.join(map(str, failed_segments))} kunde inte transkriberas - kör igen för att försöka med bara dessa")
 
-        if transcriptions:
-            # Slå ihop alla transkribering
-            full_transcription = "\n\n".join(transcriptions)
-            st.success(f"✅ Parallell transkribering klar för {len(transcriptions)} av {len(segment_paths)} segment!")
+        if full_transcription:
+            _notify('success', f"✅ Parallell transkribering klar för {len(results) - len(failed_segments)} av {len(results)} segment!")
+            # Cacha bara kompletta transkriberingar så att saknade segment kan göras om
+            if not failed_segments:
+                update_transcription_job(job['id'], 'completed', total_segments=len(results), transcript=full_transcription)
+                cache_transcription(audio_hash, 'openai', full_transcription)
+            else:
+                update_transcription_job(job['id'], 'partial', total_segments=len(results))
             return full_transcription
         else:
-            st.error("❌ Ingen transkribering lyckades")
+            update_transcription_job(job['id'], 'failed', total_segments=len(results))
+            _notify('error', "❌ Ingen transkribering lyckades")
             return None
 
+    except FileNotFoundError:
+        _notify('error', "❌ ffmpeg är inte installerat. Installera ffmpeg för att hantera stora ljudfiler.")
+        _notify('info', "På Mac: brew install ffmpeg\nPå Linux: apt-get install ffmpeg")
+        return None
     except Exception as e:
-        st.error(f"Fel vid parallell transkribering: {e}")
+        _notify('error', f"Fel vid parallell transkribering: {e}")
         return None
 
 def get_audio_duration(audio_file_path):
     """
-    Hämta ljudfilens längd (sekunder). Kräver pydub.
+    Hämta ljudfilens längd (sekunder) ur metadataindexet, som läser
+    headern med ffprobe en gång per fil. Om det inte går används den
+    delade PCM-filen och sist pydub.
     """
+    from utils.audio_metadata import get_audio_metadata
+    from utils.pcm_cache import is_pcm_cache_enabled, get_pcm_duration
+
+    metadata = get_audio_metadata(audio_file_path)
+    if metadata and metadata.get("duration_seconds"):
+        return round(metadata["duration_seconds"])
+
+    if is_pcm_cache_enabled():
+        try:
+            return round(get_pcm_duration(audio_file_path))
+        except Exception:
+            pass
+
     try:
         from pydub import AudioSegment
         audio = AudioSegment.from_file(audio_file_path)
@@ -371,31 +912,110 @@ def validate_audio_file(uploaded_file, max_duration_seconds=7200):
         return False, f"Filen är för stor. Max: {max_size_mb} MB."
     return True, "OK"
 
+@st.fragment(run_every=2)
+def render_playback_pending(audio_file_path):
+    """
+    Visa att uppspelningskopian förbereds. Körs om varannan sekund utan att
+    resten av sidan körs om; när kopian är klar (eller misslyckats) körs hela sidan om.
+    """
+    from utils.transcription_worker import get_playback_copy_status
+
+    if get_playback_copy_status(audio_file_path) != "pending":
+        st.rerun()
+    st.info("⏳ Förbereder uppspelning...")
+
 def display_audio_player(audio_file_path):
     """
-    Visa en Streamlit-spelare för den sparade ljudfilen.
+    Visa en spelare för den sparade ljudfilen med st.audio och sökvägen.
+    Filer över 50 MB spelas upp från en komprimerad kopia som skapas i
+    bakgrunden - tills den är klar visas "Förbereder uppspelning".
     """
+    from utils.audio_metadata import get_audio_metadata, get_audio_mime_type, needs_playback_copy, get_playback_path
+    from utils.transcription_worker import get_playback_copy_status
+
     if audio_file_path and os.path.exists(audio_file_path):
-        with open(audio_file_path, 'rb') as f:
-            audio_bytes = f.read()
-            st.audio(audio_bytes, format='audio/wav')
-        dur = get_audio_duration(audio_file_path)
+        metadata = get_audio_metadata(audio_file_path)
+        if not needs_playback_copy(audio_file_path):
+            st.audio(audio_file_path, format=get_audio_mime_type(audio_file_path))
+        else:
+            status = get_playback_copy_status(audio_file_path)
+            if status == "ready":
+                st.audio(get_playback_path(audio_file_path), format="audio/mpeg")
+            elif status == "pending":
+                render_playback_pending(audio_file_path)
+            else:
+                # Kopian kunde inte skapas - spela originalet
+                st.audio(audio_file_path, format=get_audio_mime_type(audio_file_path))
+
+        dur = round(metadata["duration_seconds"]) if metadata and metadata.get("duration_seconds") else get_audio_duration(audio_file_path)
         if dur:
             st.caption(f"Längd: {format_duration(dur)}")
 
+def _get_capture_holder(component_key, session_id, step_number):
+    """
+    Behållare i session_state för inspelningens CaptureWriter (och
+    LiveTranscriber om löpande transkribering är på). Frame-callbacken fångar
+    behållaren i stället för att läsa session_state från WebRTC-tråden, och
+    nya objekt läggs i den så fort de förra har avslutats - redo för nästa START.
+    """
+    from utils.capture_writer import CaptureWriter
+    from utils.live_transcription import LiveTranscriber, is_live_transcription_enabled
+
+    holder = st.session_state.setdefault(f"capture_{component_key}", {})
+    if holder.get("writer") is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"session_{session_id}_steg_{step_number}_recorded_{timestamp}.wav"
+        holder["writer"] = CaptureWriter(os.path.join('data/audio', filename))
+        holder["transcriber"] = LiveTranscriber() if is_live_transcription_enabled() else None
+    return holder
+
+def _make_capture_callback(holder):
+    """Frame-callback som skriver ljudet till disk och matar löpande transkribering"""
+    def audio_frame_callback(frame):
+        writer = holder.get("writer")
+        if writer is not None:
+            samples = writer.write_frame(frame)
+            transcriber = holder.get("transcriber")
+            if transcriber is not None:
+                transcriber.add_samples(samples)
+        return frame
+    return audio_frame_callback
+
+@st.fragment(run_every=3)
+def render_live_transcript(transcriber):
+    """Visa transkriberingen hittills medan inspelningen pågår"""
+    pending = transcriber.pending_windows
+    st.caption(
+        f"📝 {format_duration(int(transcriber.recorded_seconds))} inspelat"
+        + (f" · {pending} del(ar) transkriberas" if pending else "")
+    )
+    text = transcriber.get_transcript()
+    if text:
+        with st.container(height=200):
+            st.write(text)
+
+def _finish_live_transcription(transcriber):
+    """Vänta in sista fönstret efter STOP. Returnerar transkriberingen eller None."""
+    if transcriber is None or transcriber.total_samples == 0:
+        return None
+    with st.spinner("Slutför transkribering av sista delen..."):
+        transcription = transcriber.finish()
+    if transcription:
+        st.success("⚡ Transkriberingen gjordes under inspelningen")
+    else:
+        st.warning("⚠️ Löpande transkribering ofullständig - transkriberar hela inspelningen")
+    return transcription
+
 def record_audio_streamlit(session_id, step_number, key_prefix=""):
     """
     Spela in ljud med streamlit-webrtc komponenten.
-    Returnerar inspelade ljudet som bytes, annars None.
+    Returnerar sökvägen till den inspelade filen, annars None.
     """
     st.write("🎤 **Ljudinspelning:**")
     
     try:
         from streamlit_webrtc import webrtc_streamer, WebRtcMode, RTCConfiguration
         import av
-        import numpy as np
-        import io
-        import wave
         
         # WebRTC konfiguration
         rtc_configuration = RTCConfiguration({
@@ -404,21 +1024,14 @@ def record_audio_streamlit(session_id, step_number, key_prefix=""):
         
         component_key = f"{key_prefix}_webrtc_{session_id}_{step_number}"
         
-        # Skapa en container för ljuddata
-        if f"audio_frames_{component_key}" not in st.session_state:
-            st.session_state[f"audio_frames_{component_key}"] = []
-        
-        def audio_frame_callback(frame):
-            """Callback för att samla ljudframes"""
-            audio_array = frame.to_ndarray()
-            st.session_state[f"audio_frames_{component_key}"].append(audio_array)
-            return frame
+        # Ljudet skrivs direkt till disk i 16 kHz - minnet är konstant under inspelningen
+        capture = _get_capture_holder(component_key, session_id, step_number)
         
         # WebRTC streamer för ljudinspelning
         webrtc_ctx = webrtc_streamer(
             key=component_key,
             mode=WebRtcMode.SENDONLY,
-            audio_frame_callback=audio_frame_callback,
+            audio_frame_callback=_make_capture_callback(capture),
             rtc_configuration=rtc_configuration,
             media_stream_constraints={"video": False, "audio": True},
             async_processing=True,
@@ -426,35 +1039,24 @@ def record_audio_streamlit(session_id, step_number, key_prefix=""):
         
         if webrtc_ctx.state.playing:
             st.info("🔴 Spelar in... Klicka 'STOP' när du är klar")
-        elif not webrtc_ctx.state.playing and len(st.session_state[f"audio_frames_{component_key}"]) > 0:
-            # Konvertera frames till WAV-bytes
-            audio_frames = st.session_state[f"audio_frames_{component_key}"]
-            if audio_frames:
-                # Kombinera alla frames
-                audio_data = np.concatenate(audio_frames, axis=0)
-                
-                # Konvertera till WAV-format
-                sample_rate = 48000  # WebRTC standard
-                audio_bytes_io = io.BytesIO()
-                
-                with wave.open(audio_bytes_io, 'wb') as wav_file:
-                    wav_file.setnchannels(1)  # Mono
-                    wav_file.setsampwidth(2)  # 16-bit
-                    wav_file.setframerate(sample_rate)
-                    
-                    # Konvertera float till int16
-                    audio_int16 = (audio_data * 32767).astype(np.int16)
-                    wav_file.writeframes(audio_int16.tobytes())
-                
-                audio_bytes = audio_bytes_io.getvalue()
-                
-                st.success("✅ Ljudinspelning klar!")
-                st.audio(audio_bytes, format="audio/wav")
-                
-                # Rensa frames för nästa inspelning
-                st.session_state[f"audio_frames_{component_key}"] = []
-                
-                return audio_bytes
+            if capture["transcriber"] is not None:
+                render_live_transcript(capture["transcriber"])
+        elif not webrtc_ctx.state.playing and capture["writer"].total_samples > 0:
+            # Filen är redan skriven - bara headern stängs
+            audio_file_path = capture.pop("writer").close()
+            live_transcriber = capture.pop("transcriber", None)
+            
+            st.success("✅ Ljudinspelning klar!")
+            display_audio_player(audio_file_path)
+            
+            # Transkriberingen från inspelningen sparas för sidan som visar den
+            live_transcription = _finish_live_transcription(live_transcriber)
+            if live_transcription:
+                st.session_state[f"live_transcript_{component_key}"] = live_transcription
+                st.markdown("### 📝 Transkribering:")
+                st.write(live_transcription)
+            
+            return audio_file_path
         else:
             st.info("Klicka på 'START' för att börja spela in ljud")
             
@@ -480,11 +1082,65 @@ def record_audio_streamlit(session_id, step_number, key_prefix=""):
         """)
         return None
 
+@st.fragment(run_every=2)
+def render_transcription_job_progress(job_id):
+    """
+    Visa status för ett bakgrundsjobb. Körs om varannan sekund utan att
+    resten av sidan körs om; när jobbet är klart körs hela sidan om.
+    """
+    import time
+    from utils.transcription_worker import get_transcription_job
+
+    job = get_transcription_job(job_id)
+    if job is None or job["status"] in ("completed", "failed"):
+        st.rerun()
+
+    started_at = job["started_at"] or job["submitted_at"]
+    elapsed = int(time.time() - started_at)
+    status_text = "väntar i kö" if job["status"] == "queued" else "pågår"
+    st.info(f"⏳ Transkribering {status_text} i bakgrunden ({elapsed} s). Du kan fortsätta arbeta på sidan under tiden.")
+    for _, message in job["messages"][-5:]:
+        st.caption(message)
+
+def _follow_recording_transcription(saved, retry_key):
+    """
+    Följ bakgrundsjobbet för en sparad inspelning. saved är inspelningens
+    post i session_state med "path", "job_id", "transcription" och "error".
+    Ett misslyckat jobb kan startas om med en knapp.
+    Returnerar transkriberingen när jobbet är klart, annars None.
+    """
+    from utils.transcription_worker import submit_transcription_job, get_transcription_job
+
+    if saved["transcription"]:
+        return saved["transcription"]
+
+    job = get_transcription_job(saved["job_id"]) if saved["job_id"] else None
+    if job is not None and job["status"] == "completed":
+        saved["transcription"] = job["transcript"]
+        return saved["transcription"]
+    if job is not None and job["status"] in ("queued", "running"):
+        render_transcription_job_progress(saved["job_id"])
+        return None
+
+    if saved["job_id"]:
+        # Misslyckat jobb, eller jobb som försvann vid omstart av servern
+        saved["error"] = job["error"] if job else "Transkriberingen avbröts"
+        saved["job_id"] = None
+    st.error(f"❌ Transkribering misslyckades: {saved['error']}")
+    if st.button("🔊 Transkribera igen", key=retry_key):
+        saved["job_id"] = submit_transcription_job(saved["path"])
+        st.rerun()
+    return None
+
 def record_and_transcribe_audio(session_id, step_number, key_prefix=""):
     """
     Ljudinspelning med Streamlits inbyggda st.audio_input.
-    Returnerar tuple: (audio_file_path, transcription_text)
+    Inspelningen transkriberas i bakgrundskön medan sidan visar förloppet.
+    Returnerar tuple: (audio_file_path, transcription_text), där texten är
+    None tills transkriberingen är klar.
     """
+    from utils.transcription_worker import submit_transcription_job
+
     st.write("🎤 **Ljudinspelning:**")
     
     # Information om segmentering
@@ -498,38 +1154,39 @@ def record_and_transcribe_audio(session_id, step_number, key_prefix=""):
         audio_bytes = st.audio_input("Spela in ljud", key=component_key)
         
         if audio_bytes is not None:
+            # Varje ny inspelning sparas och transkriberas en gång - omkörningar
+            # av sidan återanvänder filen och resultatet via file_id
+            saved_key = f"saved_{component_key}"
+            file_id = getattr(audio_bytes, "file_id", None) or f"{audio_bytes.name}_{audio_bytes.size}"
+            saved = st.session_state.get(saved_key)
+
+            if saved is None or saved["file_id"] != file_id:
+                with st.spinner("Sparar ljudfil..."):
+                    audio_file_path, file_size = save_recorded_upload(audio_bytes, session_id, step_number)
+                # Transkriberingen körs i bakgrundskön - sidan pollar status
+                saved = {"file_id": file_id, "path": audio_file_path, "size": file_size, "transcription": None,
+                         "job_id": submit_transcription_job(audio_file_path), "error": None}
+                st.session_state[saved_key] = saved
+
+            audio_file_path = saved["path"]
             st.success("✅ Ljudinspelning mottagen!")
-            st.audio(audio_bytes, format="audio/wav")
-            
-            # Kontrollera filstorlek och längd
-            file_size_mb = len(audio_bytes.getvalue()) / (1024 * 1024)
+            # Uppspelning från den sparade filen i stället för från bufferten i minnet
+            display_audio_player(audio_file_path)
+
+            file_size_mb = saved["size"] / (1024 * 1024)
             st.info(f"📊 Filstorlek: {file_size_mb:.1f} MB")
-            
-            # Spara ljudfilen automatiskt
-            with st.spinner("Sparar ljudfil..."):
-                audio_file_path = save_recorded_audio(audio_bytes.getvalue(), session_id, step_number)
-            
+
             if audio_file_path:
                 st.success(f"💾 Ljudfil sparad: {os.path.basename(audio_file_path)}")
-                
-                # Kontrollera om filen behöver segmenteras för transkribering
-                if file_size_mb > 5:  # Sänkt från 20 MB till 5 MB för extra säkerhet
-                    st.info("🔄 Använder segmenterad transkribering för optimal säkerhet och resultat...")
-                    transcription = transcribe_large_audio_file(audio_file_path)
-                else:
-                    # Transkribera normalt endast för mycket små filer
-                    with st.spinner("Transkriberar ljud..."):
-                        transcription = transcribe_audio_file(audio_file_path)
-                
+
+                transcription = _follow_recording_transcription(saved, f"retry_{component_key}")
                 if transcription:
                     st.success("✅ Transkribering klar!")
                     st.markdown("### 📝 Transkribering:")
                     st.write(transcription)
-                    
+
                     return audio_file_path, transcription
-                else:
-                    st.error("❌ Transkribering misslyckades")
-                    return audio_file_path, None
+                return audio_file_path, None
             else:
                 st.error("❌ Kunde inte spara ljudfil")
                 return None, None
@@ -544,9 +1201,6 @@ def record_and_transcribe_audio(session_id, step_number, key_prefix=""):
         try:
             from streamlit_webrtc import webrtc_streamer, WebRtcMode, RTCConfiguration
             import av
-            import numpy as np
-            import io
-            import wave
             
             # WebRTC konfiguration
             rtc_configuration = RTCConfiguration({
@@ -555,103 +1209,64 @@ def record_and_transcribe_audio(session_id, step_number, key_prefix=""):
             
             component_key = f"{key_prefix}_webrtc_{session_id}_{step_number}"
             
-            # Skapa en container för ljuddata
-            if f"audio_frames_{component_key}" not in st.session_state:
-                st.session_state[f"audio_frames_{component_key}"] = []
-            
-            # Skapa state för att hålla koll på om vi redan har processat denna inspelning
-            processed_key = f"processed_{component_key}"
-            if processed_key not in st.session_state:
-                st.session_state[processed_key] = False
-            
-            def audio_frame_callback(frame):
-                """Callback för att samla ljudframes"""
-                audio_array = frame.to_ndarray()
-                st.session_state[f"audio_frames_{component_key}"].append(audio_array)
-                return frame
+            # Ljudet skrivs direkt till disk i 16 kHz - minnet är konstant under inspelningen
+            capture = _get_capture_holder(component_key, session_id, step_number)
             
             # WebRTC streamer för ljudinspelning
             webrtc_ctx = webrtc_streamer(
                 key=component_key,
                 mode=WebRtcMode.SENDONLY,
-                audio_frame_callback=audio_frame_callback,
+                audio_frame_callback=_make_capture_callback(capture),
                 rtc_configuration=rtc_configuration,
                 media_stream_constraints={"video": False, "audio": True},
                 async_processing=True,
             )
             
+            saved_key = f"saved_{component_key}"
             if webrtc_ctx.state.playing:
+                # En ny inspelning ersätter den förra
+                st.session_state.pop(saved_key, None)
                 st.info("🔴 Spelar in... Klicka 'STOP' när du är klar")
-                # Reset processed state när vi börjar en ny inspelning
-                st.session_state[processed_key] = False
-                
-            elif not webrtc_ctx.state.playing and len(st.session_state[f"audio_frames_{component_key}"]) > 0 and not st.session_state[processed_key]:
-                # Konvertera frames till WAV-bytes
-                audio_frames = st.session_state[f"audio_frames_{component_key}"]
-                if audio_frames:
-                    with st.spinner("Bearbetar ljudinspelning..."):
-                        # Kombinera alla frames
-                        audio_data = np.concatenate(audio_frames, axis=0)
-                        
-                        # Konvertera till WAV-format
-                        sample_rate = 48000  # WebRTC standard
-                        audio_bytes_io = io.BytesIO()
-                        
-                        with wave.open(audio_bytes_io, 'wb') as wav_file:
-                            wav_file.setnchannels(1)  # Mono
-                            wav_file.setsampwidth(2)  # 16-bit
-                            wav_file.setframerate(sample_rate)
-                            
-                            # Konvertera float till int16
-                            audio_int16 = (audio_data * 32767).astype(np.int16)
-                            wav_file.writeframes(audio_int16.tobytes())
-                        
-                        audio_bytes = audio_bytes_io.getvalue()
-                    
-                    st.success("✅ Ljudinspelning klar!")
-                    st.audio(audio_bytes, format="audio/wav")
-                    
-                    # Spara ljudfilen automatiskt
-                    with st.spinner("Sparar ljudfil..."):
-                        audio_file_path = save_recorded_audio(audio_bytes, session_id, step_number)
-                    
-                    if audio_file_path:
-                        st.success(f"💾 Ljudfil sparad: {os.path.basename(audio_file_path)}")
-                        
-                        # Kontrollera filstorlek för segmentering
-                        file_size_mb = len(audio_bytes) / (1024 * 1024)
-                        st.info(f"📊 Filstorlek: {file_size_mb:.1f} MB")
-                        
-                        # Transkribera automatiskt med segmentering för säkerhet
-                        if file_size_mb > 5:  # Sänkt från 20 MB till 5 MB för extra säkerhet
-                            st.info("🔄 Använder segmenterad transkribering för optimal säkerhet och resultat...")
-                            transcription = transcribe_large_audio_file(audio_file_path)
-                        else:
-                            with st.spinner("Transkriberar ljud..."):
-                                transcription = transcribe_audio_file(audio_file_path)
-                        
-                        if transcription:
-                            st.success("✅ Transkribering klar!")
-                            st.markdown("### 📝 Transkribering:")
-                            st.write(transcription)
-                            
-                            # Markera som processat
-                            st.session_state[processed_key] = True
-                            
-                            # Rensa frames för nästa inspelning
-                            st.session_state[f"audio_frames_{component_key}"] = []
-                            
-                            return audio_file_path, transcription
-                        else:
-                            st.error("❌ Transkribering misslyckades")
-                            return audio_file_path, None
-                    else:
-                        st.error("❌ Kunde inte spara ljudfil")
-                        return None, None
-            else:
+                # Visa transkriberingen medan mötet pågår
+                if capture["transcriber"] is not None:
+                    render_live_transcript(capture["transcriber"])
+                return None, None
+
+            if capture["writer"].total_samples > 0:
+                # Filen är redan skriven - bara headern stängs. Behållaren får
+                # en ny writer vid nästa körning, så inspelningen bearbetas en gång.
+                audio_file_path = capture.pop("writer").close()
+                live_transcriber = capture.pop("transcriber", None)
+
+                # Det mesta är redan transkriberat under inspelningen - annars
+                # transkriberas hela inspelningen i bakgrundskön
+                transcription = _finish_live_transcription(live_transcriber)
+                st.session_state[saved_key] = {
+                    "path": audio_file_path, "transcription": transcription, "error": None,
+                    "job_id": None if transcription else submit_transcription_job(audio_file_path)
+                }
+
+            saved = st.session_state.get(saved_key)
+            if saved is None:
                 st.info("Klicka på 'START' för att börja spela in ljud")
-                
-            return None, None
+                return None, None
+
+            audio_file_path = saved["path"]
+            st.success("✅ Ljudinspelning klar!")
+            display_audio_player(audio_file_path)
+            st.success(f"💾 Ljudfil sparad: {os.path.basename(audio_file_path)}")
+
+            file_size_mb = os.path.getsize(audio_file_path) / (1024 * 1024)
+            st.info(f"📊 Filstorlek: {file_size_mb:.1f} MB")
+
+            transcription = _follow_recording_transcription(saved, f"retry_{component_key}")
+            if transcription:
+                st.success("✅ Transkribering klar!")
+                st.markdown("### 📝 Transkribering:")
+                st.write(transcription)
+
+                return audio_file_path, transcription
+            return audio_file_path, None
                 
         except Exception as e2:
             # Sista fallback
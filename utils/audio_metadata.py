@@ -0,0 +1,225 @@
+"""
+Metadata för sparade ljudfiler och uppspelningskopior
+Längd, codec, samplingsfrekvens och hash läses en gång med ffprobe (bara
+headern) och sparas i SQLite per fil, nyckel sökväg + ändringstid + storlek.
+Stora filer spelas upp från en komprimerad kopia bredvid originalet, som
+skapas i bakgrunden (utils/transcription_worker.py).
+"""
+
+import os
+import json
+import subprocess
+from typing import Optional
+
+from utils.database import get_connection
+
+# Inspelningar serverades tidigare härifrån - kvarvarande filer rensas bort
+STATIC_AUDIO_DIR = os.path.join('static', 'audio')
+
+# Filer större än så här spelas upp från en komprimerad kopia (mono MP3)
+PLAYBACK_COPY_MIN_BYTES = 50 * 1024 * 1024
+PLAYBACK_BITRATE = '64k'
+
+AUDIO_MIME_TYPES = {
+    'wav': 'audio/wav',
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+}
+
+_table_ready = False
+_static_audio_removed = False
+
+
+def create_audio_metadata_table():
+    """Skapa metadatatabellen om den inte finns (en gång per process)"""
+    global _table_ready
+    if _table_ready:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audio_metadata (
+            path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            audio_hash TEXT,
+            duration_seconds REAL,
+            codec TEXT,
+            sample_rate INTEGER,
+            channels INTEGER,
+            bit_rate INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+    _table_ready = True
+
+def probe_audio_metadata(audio_file_path) -> dict:
+    """
+    Läs längd, codec, samplingsfrekvens, kanaler och bitrate ur filens
+    header med ffprobe. Kastar RuntimeError om ffprobe misslyckas.
+    """
+    probe_cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate:stream=codec_name,sample_rate,channels',
+        '-of', 'json',
+        audio_file_path
+    ]
+
+    result = subprocess.run(probe_cmd, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+
+    probe_data = json.loads(result.stdout)
+    format_data = probe_data.get('format', {})
+    stream = (probe_data.get('streams') or [{}])[0]
+
+    def _number(value, cast):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "duration_seconds": _number(format_data.get('duration'), float),
+        "codec": stream.get('codec_name'),
+        "sample_rate": _number(stream.get('sample_rate'), int),
+        "channels": _number(stream.get('channels'), int),
+        "bit_rate": _number(format_data.get('bit_rate'), int),
+    }
+
+def get_audio_metadata(audio_file_path) -> Optional[dict]:
+    """
+    Metadata för en ljudfil (dict med path, size_bytes, audio_hash,
+    duration_seconds, codec, sample_rate, channels, bit_rate).
+    Läses ur SQLite om filen inte ändrats sedan sist, annars med ffprobe.
+    Returnerar None om filen saknas eller inte kan läsas.
+    """
+    from utils.transcript_cache import get_audio_hash
+
+    path = os.path.abspath(audio_file_path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    create_audio_metadata_table()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT * FROM audio_metadata WHERE path = ? AND mtime = ? AND size_bytes = ?
+    ''', (path, stat.st_mtime, stat.st_size))
+    row = cursor.fetchone()
+
+    if row:
+        columns = [description[0] for description in cursor.description]
+        conn.close()
+        return dict(zip(columns, row))
+
+    conn.close()
+
+    try:
+        metadata = probe_audio_metadata(path)
+        metadata["audio_hash"] = get_audio_hash(path)
+    except (RuntimeError, OSError, ValueError):
+        return None
+
+    metadata.update({"path": path, "mtime": stat.st_mtime, "size_bytes": stat.st_size})
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR REPLACE INTO audio_metadata
+            (path, mtime, size_bytes, audio_hash, duration_seconds, codec, sample_rate, channels, bit_rate)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (path, stat.st_mtime, stat.st_size, metadata["audio_hash"], metadata["duration_seconds"],
+          metadata["codec"], metadata["sample_rate"], metadata["channels"], metadata["bit_rate"]))
+    conn.commit()
+    conn.close()
+
+    return metadata
+
+def get_audio_mime_type(audio_file_path) -> str:
+    """MIME-typ utifrån filändelsen (audio/wav som standard)"""
+    return AUDIO_MIME_TYPES.get(audio_file_path.rsplit('.', 1)[-1].lower(), 'audio/wav')
+
+def get_playback_path(audio_file_path) -> str:
+    """Sökväg till uppspelningskopian bredvid originalet, t.ex. samtal.wav.playback.mp3"""
+    return f"{audio_file_path}.playback.mp3"
+
+def needs_playback_copy(audio_file_path) -> bool:
+    """Filer över PLAYBACK_COPY_MIN_BYTES spelas upp från en komprimerad kopia"""
+    try:
+        return os.path.getsize(audio_file_path) > PLAYBACK_COPY_MIN_BYTES
+    except OSError:
+        return False
+
+def get_existing_playback_copy(audio_file_path) -> Optional[str]:
+    """Uppspelningskopians sökväg om den finns och är nyare än originalet, annars None"""
+    playback_path = get_playback_path(audio_file_path)
+    try:
+        if os.path.getmtime(playback_path) >= os.path.getmtime(audio_file_path):
+            return playback_path
+    except OSError:
+        pass
+    return None
+
+def create_playback_copy(audio_file_path) -> str:
+    """
+    Komprimerad mono-MP3 bredvid originalet för uppspelning av stora filer.
+    Skrivs först till en temporär fil så att en avbruten kodning aldrig används.
+    Returnerar sökvägen, kastar RuntimeError om ffmpeg misslyckas.
+    """
+    output_path = get_playback_path(audio_file_path)
+    temp_path = f"{output_path}.tmp.mp3"
+    result = subprocess.run([
+        'ffmpeg',
+        '-i', audio_file_path,
+        '-vn',
+        '-ac', '1',
+        '-b:a', PLAYBACK_BITRATE,
+        '-y', '-loglevel', 'error',
+        temp_path
+    ], capture_output=True, text=True)
+
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(result.stderr)
+
+    os.replace(temp_path, output_path)
+    return output_path
+
+def remove_static_audio_links() -> int:
+    """
+    Ta bort länkar och kopior som blivit kvar i static/audio från när
+    inspelningar serverades statiskt. Körs vid uppstart och bara en gång
+    per process. Returnerar antal borttagna filer.
+    """
+    global _static_audio_removed
+    if _static_audio_removed:
+        return 0
+    _static_audio_removed = True
+
+    removed = 0
+    try:
+        names = os.listdir(STATIC_AUDIO_DIR)
+    except OSError:
+        return 0
+
+    for name in names:
+        try:
+            os.remove(os.path.join(STATIC_AUDIO_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
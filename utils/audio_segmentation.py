@@ -0,0 +1,343 @@
+"""
+Pausmedveten segmentering av långa inspelningar
+Lägger segmentgränser i pauser i stället för mitt i ord och hoppar över
+långa tysta partier (kaffepauser, uppstart). Planen byggs medan ljudet
+avkodas, så första segmentet kan skickas innan hela filen är analyserad.
+Varje segment har en tidskarta tillbaka till originalinspelningen.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+# Kodningar för segment som skickas till Whisper (alla 16 kHz mono).
+# bytes_per_second är en försiktig uppskattning som används för att välja segmentlängd.
+SEGMENT_FORMATS = {
+    "opus": {   # Talcodec - ca 10x mindre än WAV
+        "extension": "ogg",
+        "codec_args": ['-acodec', 'libopus', '-b:a', '24k', '-application', 'voip'],
+        "bytes_per_second": 3300
+    },
+    "flac": {   # Förlustfri - ca halva WAV-storleken för tal
+        "extension": "flac",
+        "codec_args": ['-acodec', 'flac', '-compression_level', '8'],
+        "bytes_per_second": 22000
+    },
+    "wav": {    # Okomprimerad PCM (tidigare standard)
+        "extension": "wav",
+        "codec_args": ['-acodec', 'pcm_s16le'],
+        "bytes_per_second": 32000
+    }
+}
+
+# Whisper-API:ts maxgräns för uppladdade filer
+WHISPER_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Hur mycket längre än målet ett tal-spann får vara innan det delas
+SPLIT_TOLERANCE = 0.1
+
+
+def is_silence_aware_segmentation_enabled() -> bool:
+    """Pausmedveten segmentering är på som standard (SILENCE_AWARE_SEGMENTATION)"""
+    return os.getenv('SILENCE_AWARE_SEGMENTATION', 'true').lower() in ('1', 'true', 'yes')
+
+def get_silence_threshold_db() -> float:
+    """Ljudnivå (dB) under vilken ljudet räknas som tyst"""
+    return float(os.getenv('SILENCE_THRESHOLD_DB', '-35'))
+
+def get_min_pause_seconds() -> float:
+    """Kortaste paus som räknas som möjlig segmentgräns"""
+    return float(os.getenv('SILENCE_MIN_PAUSE_SECONDS', '0.5'))
+
+def get_drop_silence_seconds() -> float:
+    """Tystnader längre än detta skickas inte till transkribering (0 = behåll allt)"""
+    return float(os.getenv('SILENCE_DROP_SECONDS', '30'))
+
+def get_segment_overlap_seconds() -> float:
+    """Sekunder som varje segment överlappar nästa (0 = inga överlapp)"""
+    return max(0.0, float(os.getenv('SEGMENT_OVERLAP_SECONDS', '0')))
+
+def get_segment_format() -> dict:
+    """Vald segmentkodning (SEGMENT_AUDIO_FORMAT: opus, flac eller wav)"""
+    name = os.getenv('SEGMENT_AUDIO_FORMAT', 'opus').lower()
+    return SEGMENT_FORMATS.get(name, SEGMENT_FORMATS['opus'])
+
+def get_segment_target_bytes() -> int:
+    """Målstorlek per segment i byte (SEGMENT_TARGET_MB)"""
+    target = int(float(os.getenv('SEGMENT_TARGET_MB', '8')) * 1024 * 1024)
+    return min(target, WHISPER_MAX_UPLOAD_BYTES)
+
+def get_segment_max_seconds() -> float:
+    """Längsta tillåtna segment (SEGMENT_MAX_MINUTES) - kortare segment ger mer parallellism"""
+    return float(os.getenv('SEGMENT_MAX_MINUTES', '10')) * 60
+
+def choose_segment_seconds(segment_format=None, target_bytes=None, max_seconds=None) -> float:
+    """
+    Välj segmentlängd utifrån bytebudgeten och kodningens bitrate, med 10 %
+    marginal för variationer och utrymme för överlapp. Begränsas uppåt av
+    max_seconds.
+    """
+    segment_format = segment_format or get_segment_format()
+    target_bytes = get_segment_target_bytes() if target_bytes is None else target_bytes
+    max_seconds = get_segment_max_seconds() if max_seconds is None else max_seconds
+
+    budget_seconds = target_bytes * 0.9 / segment_format["bytes_per_second"]
+    return max(30.0, min(max_seconds, budget_seconds))
+
+def _speech_spans(total_duration, silences, drop_silence_seconds, padding):
+    """Dela tidslinjen i tal-spann genom att ta bort tystnader längre än drop_silence_seconds"""
+    spans = []
+    cursor = 0.0
+
+    if drop_silence_seconds and drop_silence_seconds > 0:
+        for silence_start, silence_end in silences:
+            if silence_end - silence_start < drop_silence_seconds:
+                continue
+            span_end = min(total_duration, silence_start + padding)
+            if span_end > cursor:
+                spans.append((cursor, span_end))
+            # En tystnad som går till filens slut lämnar ingen utfyllnad efter sig
+            cursor = max(cursor, silence_end - padding if silence_end < total_duration else total_duration)
+
+    if total_duration > cursor:
+        spans.append((cursor, total_duration))
+
+    return spans
+
+def _best_cut_point(window_start, window_end, silences):
+    """Mittpunkten i den längsta pausen inom fönstret, eller None"""
+    best = None
+    best_length = 0.0
+    for silence_start, silence_end in silences:
+        overlap_start = max(silence_start, window_start)
+        overlap_end = min(silence_end, window_end)
+        if overlap_end - overlap_start > best_length:
+            best_length = overlap_end - overlap_start
+            best = (overlap_start + overlap_end) / 2
+    return best
+
+def _split_long_span(span, target_seconds, silences, search_seconds, tolerance=SPLIT_TOLERANCE):
+    """
+    Dela ett tal-spann längre än target_seconds i pauser nära target-gränserna.
+    En kort rest (inom tolerance) lämnas kvar i sista biten i stället för
+    att bli ett eget minisegment.
+    """
+    span_start, span_end = span
+    pieces = []
+    cursor = span_start
+
+    while span_end - cursor > target_seconds * (1 + tolerance):
+        window_end = cursor + target_seconds
+        window_start = max(cursor + 1.0, window_end - search_seconds)
+        cut = _best_cut_point(window_start, window_end, silences) or window_end
+        pieces.append((cursor, cut))
+        cursor = cut
+
+    pieces.append((cursor, span_end))
+    return pieces
+
+def plan_segments(total_duration: float, silences: List[Tuple[float, float]], target_seconds: float,
+                  drop_silence_seconds: Optional[float] = None, search_seconds: Optional[float] = None,
+                  padding: float = 0.5) -> List[dict]:
+    """
+    Planera segment utifrån tystnader.
+
+    - Tystnader längre än drop_silence_seconds tas bort helt.
+    - Tal-spann längre än target_seconds delas i längsta pausen inom
+      search_seconds före gränsen (hård gräns om ingen paus finns).
+    - Korta spann packas ihop tills segmentet innehåller target_seconds ljud.
+
+    Returnerar lista av dicts: {"number", "start", "end", "spans", "audio_seconds"}
+    där spans är (start, slut) i originalinspelningens tid.
+    """
+    drop_silence_seconds = get_drop_silence_seconds() if drop_silence_seconds is None else drop_silence_seconds
+    search_seconds = search_seconds if search_seconds is not None else min(60.0, target_seconds / 4)
+
+    pieces = []
+    for span in _speech_spans(total_duration, silences, drop_silence_seconds, padding):
+        pieces.extend(_split_long_span(span, target_seconds, silences, search_seconds))
+
+    segments = []
+    current = []
+    current_seconds = 0.0
+
+    for piece_start, piece_end in pieces:
+        piece_seconds = piece_end - piece_start
+        if piece_seconds < 1e-6:
+            continue
+        if current and current_seconds + piece_seconds > target_seconds:
+            segments.append(current)
+            current = []
+            current_seconds = 0.0
+        current.append((piece_start, piece_end))
+        current_seconds += piece_seconds
+
+    if current:
+        segments.append(current)
+
+    return [
+        {
+            "number": i + 1,
+            "start": spans[0][0],
+            "end": spans[-1][1],
+            "spans": spans,
+            "audio_seconds": sum(end - start for start, end in spans)
+        }
+        for i, spans in enumerate(segments)
+    ]
+
+def plan_fixed_segments(total_duration: float, segment_seconds: float) -> List[dict]:
+    """Plan med fasta gränser var segment_seconds"""
+    segments = []
+    start = 0.0
+    while start < total_duration:
+        end = min(total_duration, start + segment_seconds)
+        segments.append({
+            "number": len(segments) + 1,
+            "start": start,
+            "end": end,
+            "spans": [(start, end)],
+            "audio_seconds": end - start
+        })
+        start = end
+    return segments
+
+def add_segment_overlap(plan: List[dict], overlap_seconds: float) -> List[dict]:
+    """
+    Förläng varje segment (utom det sista) med de första overlap_seconds
+    ljud från nästa segment. Överlappet räknas i behållet ljud, så det
+    hamnar på tal även om en lång tystnad ligger mellan segmenten.
+    """
+    if overlap_seconds <= 0:
+        return plan
+
+    overlapped = []
+    for i, segment in enumerate(plan):
+        spans = list(segment["spans"])
+        added_seconds = 0.0
+
+        if i + 1 < len(plan):
+            remaining = overlap_seconds
+            for span_start, span_end in plan[i + 1]["spans"]:
+                if remaining < 1e-6:
+                    break
+                extra_end = min(span_end, span_start + remaining)
+                if spans and abs(spans[-1][1] - span_start) < 1e-6:
+                    spans[-1] = (spans[-1][0], extra_end)
+                else:
+                    spans.append((span_start, extra_end))
+                remaining -= extra_end - span_start
+                added_seconds += extra_end - span_start
+
+        overlapped.append(dict(
+            segment,
+            end=spans[-1][1],
+            spans=spans,
+            audio_seconds=segment["audio_seconds"] + added_seconds,
+            overlap_seconds=added_seconds
+        ))
+
+    return overlapped
+
+def merge_silences(silences: List[Tuple[float, float]], new_silences: List[Tuple[float, float]]):
+    """
+    Lägg till tystnaderna från nästa avkodade block. En tystnad som fortsätter
+    över blockgränsen slås ihop med den föregående. Ändrar och returnerar silences.
+    """
+    for start, end in new_silences:
+        if silences and abs(silences[-1][1] - start) < 1e-6:
+            silences[-1] = (silences[-1][0], end)
+        else:
+            silences.append((start, end))
+    return silences
+
+def plan_next_segment(cursor: float, decoded_seconds: float, silences: List[Tuple[float, float]],
+                      target_seconds: float, finished: bool, silence_aware: bool = True,
+                      overlap_seconds: float = 0.0, drop_silence_seconds: Optional[float] = None,
+                      padding: float = 0.5) -> Tuple[Optional[dict], float]:
+    """
+    Nästa segment i en plan som byggs medan ljudet avkodas.
+
+    cursor är var förra segmentet slutade, decoded_seconds hur långt ljudet
+    är avkodat och silences alla tystnader som hittats hittills (originalets
+    tid, en pågående tystnad slutar vid decoded_seconds). Segmentet lämnas
+    ut först när ljudet efter det inte längre kan flytta dess gränser eller
+    överlapp, så planen blir densamma som plan_segments och
+    add_segment_overlap över hela filen. Med finished är allt ljud avkodat.
+
+    Returnerar (segment, ny cursor). segment är None när mer ljud behövs
+    eller inget tal återstår; producenten numrerar segmenten.
+    """
+    drop_silence_seconds = get_drop_silence_seconds() if drop_silence_seconds is None else drop_silence_seconds
+    length = decoded_seconds - cursor
+    if length < 1e-6:
+        return None, cursor
+
+    if silence_aware:
+        shifted = [(start - cursor, end - cursor) for start, end in silences if end > cursor]
+        plan = plan_segments(length, shifted, target_seconds, drop_silence_seconds, padding=padding)
+        # En pågående tystnad kan bli lång nog att tas bort och korta av ett
+        # tal-spann som annars hade delats vid target_seconds * (1 + SPLIT_TOLERANCE)
+        lookahead = target_seconds * (1 + SPLIT_TOLERANCE) + drop_silence_seconds + 2 * padding + overlap_seconds + 1.0
+    else:
+        plan = plan_fixed_segments(length, target_seconds)
+        lookahead = overlap_seconds
+
+    if not plan:
+        # Allt kvarvarande ljud ligger i en tystnad som redan är lång nog att hoppas över
+        return None, (cursor if finished else max(cursor, decoded_seconds - padding))
+
+    # Segmentet packas utifrån nästa segments första bit, så den måste också vara
+    # slutgiltig. Överlappet lånas ur nästa segment, som då måste vara helt klart.
+    settled = 2 if overlap_seconds > 0 else 1
+    if not finished and (len(plan) <= settled or length - plan[settled]["start"] < lookahead):
+        return None, cursor
+
+    segment = add_segment_overlap(plan[:2], overlap_seconds)[0]
+    spans = [(cursor + start, cursor + end) for start, end in segment["spans"]]
+    return dict(segment, start=spans[0][0], end=spans[-1][1], spans=spans), cursor + plan[0]["end"]
+
+def build_stream_decode_command(audio_file_path, input_args=None):
+    """
+    ffmpeg-kommando som avkodar källfilen EN gång och skriver 16 kHz mono
+    s16le-PCM till stdout. input_args beskriver indata som saknar header, t.ex. rå-PCM.
+    """
+    return [
+        'ffmpeg',
+        *(input_args or []),
+        '-i', audio_file_path,
+        '-vn',
+        '-ar', '16000',
+        '-ac', '1',
+        '-f', 's16le',
+        '-loglevel', 'error',
+        'pipe:1'
+    ]
+
+def build_encode_command(output_path, codec_args=None):
+    """ffmpeg-kommando som kodar ett segment från 16 kHz mono s16le-PCM på stdin"""
+    codec_args = codec_args or get_segment_format()["codec_args"]
+    return [
+        'ffmpeg',
+        '-f', 's16le',
+        '-ar', '16000',
+        '-ac', '1',
+        '-i', 'pipe:0',
+        *codec_args,
+        '-y', '-loglevel', 'error',
+        output_path
+    ]
+
+def segment_time_to_original(segment, seconds: float) -> float:
+    """Översätt en tidpunkt i segmentets ljud till tid i originalinspelningen"""
+    elapsed = 0.0
+    for span_start, span_end in segment["spans"]:
+        span_length = span_end - span_start
+        if seconds <= elapsed + span_length:
+            return span_start + (seconds - elapsed)
+        elapsed += span_length
+    return segment["end"]
+
+def format_timestamp(seconds: float) -> str:
+    """Formatera sekunder som HH:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
@@ -1,12 +1,12 @@
 import streamlit as st
 from utils.audio_handler import (
-    transcribe_audio_file,
     validate_audio_file,
     record_and_transcribe_audio,
     save_uploaded_audio,
-    save_recorded_audio,
-    display_audio_player
+    display_audio_player,
+    render_transcription_job_progress
 )
+from utils.transcription_worker import submit_transcription_job, get_transcription_job
 
 def audio_text_input(step_number, session_id, key_prefix=""):
     """
@@ -34,21 +34,44 @@ def audio_text_input(step_number, session_id, key_prefix=""):
         if not ok:
             st.error(msg)
         else:
-            audio_path = save_uploaded_audio(uploaded_file, session_id, step_number)
+            # Spara bara en gång per uppladdning - omkörningar återanvänder filen,
+            # så att metadata, uppspelningslänk och jobbkö känner igen den
+            saved_key = f"{key_prefix}_saved_upload_{step_number}"
+            saved = st.session_state.get(saved_key)
+            if saved is None or saved[0] != uploaded_file.file_id:
+                saved = (uploaded_file.file_id, save_uploaded_audio(uploaded_file, session_id, step_number))
+                st.session_state[saved_key] = saved
+            audio_path = saved[1]
             st.success(f"Ljudfil uppladdad: `{audio_path}`")
             display_audio_player(audio_path)
 
+            job_key = f"{key_prefix}_trans_job_{step_number}"
             if st.button("🔊 Transkribera uppladdad fil", key=f"{key_prefix}_trans_up_{step_number}"):
-                with st.spinner("Transkriberar..."):
-                    transcript = transcribe_audio_file(audio_path)
-                if transcript:
+                st.session_state[job_key] = submit_transcription_job(audio_path)
+
+            # Transkriberingen körs i bakgrundskön - sidan pollar status
+            job_id = st.session_state.get(job_key)
+            if job_id:
+                job = get_transcription_job(job_id)
+                if job is None:
+                    # Jobbet försvann (t.ex. omstart av servern) - användaren får starta om
+                    del st.session_state[job_key]
+                    st.warning("Transkriberingen avbröts. Klicka på knappen igen för att fortsätta.")
+                elif job["status"] == "completed":
+                    del st.session_state[job_key]
+                    transcript = job["transcript"]
                     st.text_area(
                         "Transkribering:",
                         value=transcript,
                         height=200,
                         key=f"{key_prefix}_auto_trans_{step_number}"
                     )
-                    return transcript, audio_path
+                    return transcript, job["audio_path"]
+                elif job["status"] == "failed":
+                    del st.session_state[job_key]
+                    st.error(f"Transkribering misslyckades: {job['error']}")
+                else:
+                    render_transcription_job_progress(job_id)
 
     st.markdown("— eller —")
 
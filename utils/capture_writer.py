@@ -0,0 +1,95 @@
+"""
+Inspelningsbuffert som skriver direkt till disk
+WebRTC-frames (48 kHz) omsamplas i farten till 16 kHz mono int16 och skrivs
+i bitar om ungefär en sekund till en WAV-fil. Minnet per inspelning är
+konstant oavsett mötets längd, och när inspelningen stoppas är filen redan
+klar - bara WAV-headern behöver stängas.
+"""
+
+import os
+import wave
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Samplen samlas till ungefär en sekund innan de skrivs till filen
+FLUSH_SAMPLES = SAMPLE_RATE
+
+
+def resample_frame(resampler, frame) -> np.ndarray:
+    """Konvertera en WebRTC-frame till 16 kHz mono int16 med en av.AudioResampler"""
+    resampled = resampler.resample(frame)
+    # Nyare PyAV returnerar en lista, äldre en enskild frame
+    frames = resampled if isinstance(resampled, list) else [resampled]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate([f.to_ndarray().reshape(-1) for f in frames])
+
+
+class CaptureWriter:
+    """
+    Tar emot frames från WebRTC-tråden och skriver dem till en WAV-fil.
+    Filen öppnas först när första framen kommer, så en inspelning som
+    aldrig startas lämnar ingen tom fil efter sig.
+    """
+
+    def __init__(self, path: str):
+        import av
+
+        self.path = path
+        self.total_samples = 0
+        self.closed = False
+
+        self._resampler = av.AudioResampler(format='s16', layout='mono', rate=SAMPLE_RATE)
+        self._wav = None
+        self._pending = []
+        self._pending_samples = 0
+        self._lock = threading.Lock()
+
+    def write_frame(self, frame) -> np.ndarray:
+        """
+        Omsampla och buffra en frame. Returnerar framens samplen i 16 kHz
+        int16 så att de kan skickas vidare till löpande transkribering.
+        """
+        samples = resample_frame(self._resampler, frame)
+        with self._lock:
+            if self.closed or len(samples) == 0:
+                return samples
+            self._pending.append(samples)
+            self._pending_samples += len(samples)
+            self.total_samples += len(samples)
+            if self._pending_samples >= FLUSH_SAMPLES:
+                self._flush()
+        return samples
+
+    def _flush(self):
+        """Skriv buffrade samplen till filen (anropas med låset)"""
+        if not self._pending:
+            return
+        if self._wav is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._wav = wave.open(self.path, 'wb')
+            self._wav.setnchannels(1)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(SAMPLE_RATE)
+        # wave uppdaterar headern efter varje skrivning, så filen är giltig även om processen dör
+        self._wav.writeframes(np.concatenate(self._pending).tobytes())
+        self._pending = []
+        self._pending_samples = 0
+
+    @property
+    def duration_seconds(self) -> float:
+        return self.total_samples / SAMPLE_RATE
+
+    def close(self):
+        """Skriv det som är kvar och stäng filen. Returnerar sökvägen, eller None om inget spelats in."""
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self._flush()
+                if self._wav is not None:
+                    self._wav.close()
+            return self.path if self._wav is not None else None
@@ -60,6 +60,40 @@ def create_tables():
         )
     ''')
     
+    # Transkriberingsjobb - gör det möjligt att återuppta långa transkriberingar
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcription_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_key TEXT UNIQUE NOT NULL,
+            audio_path TEXT,
+            audio_hash TEXT,
+            backend TEXT,
+            status TEXT DEFAULT 'running',
+            total_segments INTEGER,
+            transcript TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcription_segments (
+            job_id INTEGER NOT NULL,
+            segment_number INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            start_seconds REAL,
+            end_seconds REAL,
+            transcript TEXT,
+            attempts INTEGER,
+            latency_seconds REAL,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, segment_number),
+            FOREIGN KEY (job_id) REFERENCES transcription_jobs (id) ON DELETE CASCADE
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -189,11 +223,129 @@ def get_all_sessions():
     columns = ['id', 'session_name', 'rektor_name', 'participants', 'created_at', 'current_step', 'completed']
     return [dict(zip(columns, row)) for row in rows]
 
+def get_session_audio_paths(session_id):
+    """Ljudfilerna som sparats i sessionen (steg 2 och steg 3)"""
+    session = get_session(session_id)
+    if not session:
+        return []
+    return [path for path in (session.get('steg2_audio_path'), session.get('steg3_audio_path')) if path]
+
+def _delete_transcription_jobs(cursor, audio_paths, audio_hashes):
+    """Ta bort transkriberingsjobb (med segmentens text) för givna ljudfiler"""
+    paths = sorted({p for path in audio_paths for p in (path, os.path.abspath(path))})
+    hashes = sorted(audio_hashes)
+    conditions = []
+    if paths:
+        conditions.append(f"audio_path IN ({','.join('?' * len(paths))})")
+    if hashes:
+        conditions.append(f"audio_hash IN ({','.join('?' * len(hashes))})")
+    if not conditions:
+        return
+
+    condition = " OR ".join(conditions)
+    cursor.execute(
+        f'DELETE FROM transcription_segments WHERE job_id IN (SELECT id FROM transcription_jobs WHERE {condition})',
+        paths + hashes
+    )
+    cursor.execute(f'DELETE FROM transcription_jobs WHERE {condition}', paths + hashes)
+
 def delete_session(session_id):
-    """Ta bort session"""
+    """
+    Ta bort session tillsammans med transkriberingsjobben (inklusive
+    segmentens text) och de cachade transkriberingarna av dess ljud.
+    Ljudfilerna på disk lämnas kvar.
+    """
+    from utils.transcript_cache import get_audio_hash, invalidate_transcripts
+
+    create_tables()
+    audio_paths = get_session_audio_paths(session_id)
+
+    audio_hashes = set()
+    for path in audio_paths:
+        try:
+            audio_hashes.add(get_audio_hash(path))
+        except OSError:
+            pass
+
     conn = get_connection()
     cursor = conn.cursor()
-    
+
+    _delete_transcription_jobs(cursor, audio_paths, audio_hashes)
     cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
     conn.commit()
-    conn.close()
\ No newline at end of file
+    conn.close()
+
+    for audio_hash in audio_hashes:
+        invalidate_transcripts(audio_hash)
+
+def get_or_create_transcription_job(job_key, audio_path, audio_hash, backend):
+    """Hämta transkriberingsjobb med given nyckel, eller skapa ett nytt"""
+    create_tables()
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR IGNORE INTO transcription_jobs (job_key, audio_path, audio_hash, backend)
+        VALUES (?, ?, ?, ?)
+    ''', (job_key, audio_path, audio_hash, backend))
+    conn.commit()
+    
+    cursor.execute('SELECT * FROM transcription_jobs WHERE job_key = ?', (job_key,))
+    row = cursor.fetchone()
+    columns = [description[0] for description in cursor.description]
+    conn.close()
+    
+    return dict(zip(columns, row))
+
+def update_transcription_job(job_id, status, total_segments=None, transcript=None):
+    """Uppdatera status (running/partial/completed/failed) för ett transkriberingsjobb"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    completed_at = datetime.now() if status == 'completed' else None
+    
+    cursor.execute('''
+        UPDATE transcription_jobs
+        SET status = ?, total_segments = COALESCE(?, total_segments),
+            transcript = COALESCE(?, transcript), completed_at = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (status, total_segments, transcript, completed_at, job_id))
+    
+    conn.commit()
+    conn.close()
+
+def save_transcription_segment(job_id, segment_number, status, transcript=None, start_seconds=None,
+                               end_seconds=None, attempts=None, latency_seconds=None, error=None):
+    """Spara resultatet för ett segment så att det inte behöver göras om"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO transcription_segments
+            (job_id, segment_number, status, start_seconds, end_seconds, transcript,
+             attempts, latency_seconds, error, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (job_id, segment_number, status, start_seconds, end_seconds, transcript,
+          attempts, latency_seconds, error))
+    
+    conn.commit()
+    conn.close()
+
+def get_completed_transcription_segments(job_id):
+    """Hämta klara segment för ett jobb: {segment_number: dict}"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT segment_number, transcript, start_seconds, end_seconds, attempts, latency_seconds
+        FROM transcription_segments
+        WHERE job_id = ? AND status = 'completed'
+        ORDER BY segment_number
+    ''', (job_id,))
+    
+    rows = cursor.fetchall()
+    conn.close()
+    
+    columns = ['segment_number', 'transcript', 'start_seconds', 'end_seconds', 'attempts', 'latency_seconds']
+    return {row[0]: dict(zip(columns, row)) for row in rows}
@@ -5,14 +5,29 @@ Ger 47% bättre resultat än OpenAI Whisper för svenska
 """
 
 import os
-import streamlit as st
-import torch
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Optional, Literal
 
-# Global cache för modellen
-_kb_whisper_model = None
-_kb_whisper_processor = None
-_kb_whisper_pipe = None
+# Statusmeddelanden går via audio_handler: till sidan, bakgrundsjobbet eller
+# (i en arbetsprocess) till listan som skickas tillbaka med resultatet
+from utils.audio_handler import _notify
+
+logger = logging.getLogger(__name__)
+
+# Register över laddade modeller: (storlek, stil, motor) -> post med
+# model, processor, pipe, size_bytes, last_used och in_use (pågående
+# inferenser). Ordningen är LRU.
+_model_registry = OrderedDict()
+_registry_lock = threading.RLock()
+_janitor_thread = None
+
+# Antal processer som delar minnesbudgeten (sätts i transkriberingens processpool)
+_budget_processes = 1
 
 # Tillgängliga modeller från KBLab
 KB_WHISPER_MODELS = {
@@ -23,6 +38,15 @@ KB_WHISPER_MODELS = {
     "tiny": "KBLab/kb-whisper-tiny"         # 57M parametrar - Snabbast
 }
 
+# Ungefärligt minnesbehov i fp32 (MB), används innan en modell är laddad
+KB_WHISPER_MEMORY_MB = {
+    "large": 6200,
+    "medium": 3100,
+    "small": 1000,
+    "base": 300,
+    "tiny": 160
+}
+
 def get_kb_whisper_model_size():
     """Hämta vald modellstorlek från environment eller använd default"""
     return os.getenv('KB_WHISPER_MODEL', 'medium')
@@ -32,6 +56,73 @@ def get_kb_whisper_model_id():
     size = get_kb_whisper_model_size()
     return KB_WHISPER_MODELS.get(size, KB_WHISPER_MODELS['medium'])
 
+# Inferensmotorer: transformers (full precision), int8 (dynamisk kvantisering
+# av Linear-lager, endast CPU) och onnx (exporterad ONNX Runtime-graf via optimum)
+KB_WHISPER_ENGINES = ["transformers", "int8", "onnx"]
+
+def get_inference_engine():
+    """Hämta vald inferensmotor från environment (KB_WHISPER_ENGINE)"""
+    engine = os.getenv('KB_WHISPER_ENGINE', 'transformers').lower()
+    return engine if engine in KB_WHISPER_ENGINES else 'transformers'
+
+def get_batch_size():
+    """
+    Antal 30-sekunders fönster som avkodas samtidigt (KB_WHISPER_BATCH_SIZE).
+    Default 8 på GPU och 4 på CPU.
+    """
+    import torch
+
+    default = '8' if torch.cuda.is_available() else '4'
+    return max(1, int(os.getenv('KB_WHISPER_BATCH_SIZE', default)))
+
+def get_shard_count():
+    """Antal processer som långa filer delas upp på (KB_WHISPER_SHARDS, 1 = av)"""
+    return max(1, int(os.getenv('KB_WHISPER_SHARDS', '1')))
+
+# Filer kortare än detta delas aldrig upp på flera processer
+SHARD_MIN_DURATION_SECONDS = 600
+
+_threads_configured = False
+
+def configure_torch_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Sätt torch trådantal explicit så att alla CPU-kärnor används
+    (KB_WHISPER_THREADS, KB_WHISPER_INTEROP_THREADS). Inter-op kan bara
+    sättas en gång per process, innan något parallellt arbete har startat.
+    """
+    import torch
+
+    global _threads_configured
+
+    intra_op_threads = intra_op_threads or int(os.getenv('KB_WHISPER_THREADS', str(os.cpu_count() or 1)))
+    torch.set_num_threads(max(1, intra_op_threads))
+
+    if not _threads_configured:
+        inter_op_threads = inter_op_threads or int(os.getenv('KB_WHISPER_INTEROP_THREADS', '1'))
+        try:
+            torch.set_num_interop_threads(max(1, inter_op_threads))
+        except RuntimeError:
+            # Redan satt eller parallellt arbete har startat - behåll nuvarande värde
+            pass
+        _threads_configured = True
+
+def get_memory_budget_bytes():
+    """
+    Max minne för laddade modeller i den här processen: KB_WHISPER_MEMORY_BUDGET_MB
+    delat lika mellan processerna som laddar modeller (se set_budget_processes)
+    """
+    total = float(os.getenv('KB_WHISPER_MEMORY_BUDGET_MB', '4096')) * 1024 * 1024
+    return int(total / _budget_processes)
+
+def set_budget_processes(processes):
+    """Anropas när en arbetsprocess startar: budgeten delas mellan så många processer"""
+    global _budget_processes
+    _budget_processes = max(1, int(processes))
+
+def get_idle_timeout_seconds():
+    """Modeller som inte använts på så här länge frigörs (KB_WHISPER_IDLE_TIMEOUT_MINUTES, 0 = aldrig)"""
+    return float(os.getenv('KB_WHISPER_IDLE_TIMEOUT_MINUTES', '30')) * 60
+
 def get_transcription_style():
     """
     Hämta transkriberingsstil från environment
@@ -41,158 +132,496 @@ def get_transcription_style():
     """
     return os.getenv('KB_WHISPER_STYLE', 'default')
 
-def load_kb_whisper_model():
+def _estimate_model_bytes(size, engine):
+    """Uppskattat minnesbehov innan modellen laddats"""
+    mb = KB_WHISPER_MEMORY_MB.get(size, KB_WHISPER_MEMORY_MB['medium'])
+    if engine == "int8":
+        mb = mb * 0.4
+    return int(mb * 1024 * 1024)
+
+def _measure_model_bytes(model, size, engine):
+    """Faktiskt minnesbehov för laddade vikter, eller uppskattning om det inte går att mäta"""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        # Kvantiserade Linear-lager syns inte som parametrar
+        if engine == "int8" or total == 0:
+            return max(total, _estimate_model_bytes(size, engine))
+        return total
+    except Exception:
+        return _estimate_model_bytes(size, engine)
+
+def _free_memory():
+    import torch
+
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _evict_for(needed_bytes):
+    """
+    Frigör minst nyligen använda modeller tills needed_bytes ryms i budgeten
+    (anropas med låset). Modeller som används av en pågående inferens hoppas över.
+    """
+    budget = get_memory_budget_bytes()
+    total = sum(e["size_bytes"] for e in _model_registry.values())
+    evicted = False
+    for key in [key for key, entry in _model_registry.items() if not entry["in_use"]]:
+        if total + needed_bytes <= budget:
+            break
+        total -= _model_registry.pop(key)["size_bytes"]
+        evicted = True
+        logger.info("KB-Whisper model %s (%s, %s) evicted from memory", *key)
+    if evicted:
+        _free_memory()
+    if total + needed_bytes > budget:
+        logger.warning("KB-Whisper memory budget exceeded: %.0f MB in use", (total + needed_bytes) / (1024 * 1024))
+
+def evict_idle_models(idle_seconds=None):
+    """Frigör modeller som inte använts på idle_seconds sekunder. Returnerar antal borttagna."""
+    idle_seconds = get_idle_timeout_seconds() if idle_seconds is None else idle_seconds
+    now = time.monotonic()
+    with _registry_lock:
+        idle_keys = [
+            key for key, entry in _model_registry.items()
+            if not entry["in_use"] and now - entry["last_used"] > idle_seconds
+        ]
+        for key in idle_keys:
+            del _model_registry[key]
+    if idle_keys:
+        _free_memory()
+    return len(idle_keys)
+
+def _janitor_loop():
+    while True:
+        timeout = get_idle_timeout_seconds()
+        time.sleep(max(10.0, min(60.0, timeout / 2)))
+        evict_idle_models(timeout)
+
+def _start_janitor():
+    """Starta bakgrundstråden som frigör oanvända modeller (en gång per process)"""
+    global _janitor_thread
+    if get_idle_timeout_seconds() <= 0 or _janitor_thread is not None:
+        return
+    _janitor_thread = threading.Thread(target=_janitor_loop, name="kb-whisper-janitor", daemon=True)
+    _janitor_thread.start()
+
+def get_loaded_models() -> list:
+    """Laddade modeller som (storlek, stil, motor, MB, sekunder sedan senaste användning)"""
+    now = time.monotonic()
+    with _registry_lock:
+        return [
+            (key[0], key[1], key[2], entry["size_bytes"] / (1024 * 1024), now - entry["last_used"])
+            for key, entry in _model_registry.items()
+        ]
+
+def load_kb_whisper_model(size=None, style=None):
     """
-    Ladda KB-Whisper modellen i minnet (caching)
-    Returnerar (model, processor, pipeline) eller None vid fel
+    Hämta KB-Whisper modellen ur registret eller ladda den i minnet.
+    Flera varianter (storlek, stil, motor) kan vara laddade samtidigt inom
+    minnesbudgeten - minst nyligen använda frigörs först.
+    Returnerar (model, processor, pipeline) eller (None, None, None) vid fel
     """
-    global _kb_whisper_model, _kb_whisper_processor, _kb_whisper_pipe
+    size = size or get_kb_whisper_model_size()
+    style = style or get_transcription_style()
+    engine = get_inference_engine()
+
+    import torch
+
+    # Välj device (GPU om tillgängligt, annars CPU)
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+
+    # Kvantiserade motorer är till för CPU - på GPU används fp16 i stället
+    if device != "cpu" and engine != "transformers":
+        _notify('warning', f"⚠️ Motorn '{engine}' stöds bara på CPU - använder transformers")
+        engine = "transformers"
+
+    key = (size, style, engine)
+
+    with _registry_lock:
+        # Om modellen redan är laddad, returnera den
+        entry = _model_registry.get(key)
+        if entry is not None:
+            entry["last_used"] = time.monotonic()
+            _model_registry.move_to_end(key)
+            return entry["model"], entry["processor"], entry["pipe"]
+
+        try:
+            from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+            if device == "cpu":
+                configure_torch_threads()
+
+            _evict_for(_estimate_model_bytes(size, engine))
+
+            model_id = KB_WHISPER_MODELS.get(size, KB_WHISPER_MODELS['medium'])
+
+            _notify('info', f"🔄 Laddar KB-Whisper modell: {model_id} (stil: {style}, motor: {engine})")
+            _notify('info', f"📊 Använder: {device.upper()}")
+
+            # Ladda modellen med rätt revision om subtitle eller strict
+            model_kwargs = {
+                "torch_dtype": torch_dtype,
+                "use_safetensors": True,
+                "cache_dir": "cache"
+            }
+
+            if style in ["subtitle", "strict"]:
+                model_kwargs["revision"] = style
+
+            model = None
+            if engine == "onnx":
+                model = _load_onnx_model(model_id, model_kwargs)
+
+            if model is None:
+                model = AutoModelForSpeechSeq2Seq.from_pretrained(
+                    model_id,
+                    **model_kwargs
+                )
+                model.to(device)
+
+                if engine == "int8":
+                    # Vikterna i Linear-lagren lagras som int8, aktiveringar kvantiseras i farten
+                    model = torch.quantization.quantize_dynamic(
+                        model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+
+            # Ladda processor
+            processor = AutoProcessor.from_pretrained(model_id)
+
+            # Skapa pipeline
+            pipe = pipeline(
+                "automatic-speech-recognition",
+                model=model,
+                tokenizer=processor.tokenizer,
+                feature_extractor=processor.feature_extractor,
+                torch_dtype=torch_dtype,
+                device=device,
+            )
+
+            _model_registry[key] = {
+                "model": model,
+                "processor": processor,
+                "pipe": pipe,
+                "size_bytes": _measure_model_bytes(model, size, engine),
+                "last_used": time.monotonic(),
+                "in_use": 0
+            }
+            _start_janitor()
+
+            _notify('success', f"✅ KB-Whisper modell laddad: {model_id}")
 
-    # Om modellen redan är laddad, returnera den
-    if _kb_whisper_pipe is not None:
-        return _kb_whisper_model, _kb_whisper_processor, _kb_whisper_pipe
+            return model, processor, pipe
 
+        except Exception as e:
+            _notify('error', f"❌ Kunde inte ladda KB-Whisper modell: {e}")
+            _notify('warning', "💡 Kontrollera att transformers och torch är installerade.")
+            return None, None, None
+
+@contextmanager
+def use_kb_whisper_model(size=None, style=None):
+    """
+    Låna en modell ur registret under en inferens: ger (model, processor, pipe).
+    Modellen räknas som använd tills blocket är klart, så varken
+    tomgångsrensningen eller minnesbudgeten frigör den mitt i en körning.
+    """
+    with _registry_lock:
+        model, processor, pipe = load_kb_whisper_model(size=size, style=style)
+        entry = next((e for e in _model_registry.values() if pipe is not None and e["pipe"] is pipe), None)
+        if entry is not None:
+            entry["in_use"] += 1
+    try:
+        yield model, processor, pipe
+    finally:
+        if entry is not None:
+            with _registry_lock:
+                entry["in_use"] -= 1
+                entry["last_used"] = time.monotonic()
+
+def _load_onnx_model(model_id, model_kwargs):
+    """
+    Exportera modellen till ONNX Runtime (optimum) och returnera den.
+    Exporten cachas under cache/onnx/ så att den bara görs en gång.
+    Returnerar None om optimum inte är installerat.
+    """
     try:
-        from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    except ImportError:
+        _notify('warning', "⚠️ optimum[onnxruntime] saknas - använder transformers. Installera med: pip install optimum[onnxruntime]")
+        return None
 
-        # Välj device (GPU om tillgängligt, annars CPU)
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    revision = model_kwargs.get("revision", "main")
+    export_dir = os.path.join("cache", "onnx", model_id.replace("/", "--"), revision)
 
-        model_id = get_kb_whisper_model_id()
-        style = get_transcription_style()
+    if os.path.exists(os.path.join(export_dir, "config.json")):
+        return ORTModelForSpeechSeq2Seq.from_pretrained(export_dir)
 
-        st.info(f"🔄 Laddar KB-Whisper modell: {model_id} (stil: {style})")
-        st.info(f"📊 Använder: {device.upper()}")
+    model = ORTModelForSpeechSeq2Seq.from_pretrained(
+        model_id,
+        export=True,
+        revision=revision,
+        cache_dir=model_kwargs.get("cache_dir")
+    )
+    model.save_pretrained(export_dir)
+    return model
 
-        # Ladda modellen med rätt revision om subtitle eller strict
-        model_kwargs = {
-            "torch_dtype": torch_dtype,
-            "use_safetensors": True,
-            "cache_dir": "cache"
-        }
+def _pipeline_input(audio_file_path, use_pcm_cache=True):
+    """
+    Indata till pipelinen: den delade, minnesmappade PCM-arrayen om
+    PCM-cachen är på (ingen ny avkodning), annars sökvägen.
+    """
+    from utils.pcm_cache import is_pcm_cache_enabled, load_pcm, as_float32, SAMPLE_RATE
 
-        if style in ["subtitle", "strict"]:
-            model_kwargs["revision"] = style
+    if use_pcm_cache and is_pcm_cache_enabled():
+        try:
+            return {"raw": as_float32(load_pcm(audio_file_path)), "sampling_rate": SAMPLE_RATE}
+        except RuntimeError:
+            pass
+    return audio_file_path
 
-        _kb_whisper_model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            model_id,
-            **model_kwargs
-        )
-        _kb_whisper_model.to(device)
-
-        # Ladda processor
-        _kb_whisper_processor = AutoProcessor.from_pretrained(model_id)
-
-        # Skapa pipeline
-        _kb_whisper_pipe = pipeline(
-            "automatic-speech-recognition",
-            model=_kb_whisper_model,
-            tokenizer=_kb_whisper_processor.tokenizer,
-            feature_extractor=_kb_whisper_processor.feature_extractor,
-            torch_dtype=torch_dtype,
-            device=device,
-        )
+def _run_kb_whisper_pipeline(pipe, audio):
+    """
+    Kör pipelinen med batchade 30-sekunders fönster och returnerar texten.
+    audio är en sökväg eller {"raw": array, "sampling_rate": 16000}.
+    """
+    generate_kwargs = {
+        "task": "transcribe",
+        "language": "sv"
+    }
 
-        st.success(f"✅ KB-Whisper modell laddad: {model_id}")
+    # chunk_length_s=30 för att hantera långa filer effektivt,
+    # batch_size avkodar flera fönster samtidigt i stället för ett i taget
+    result = pipe(
+        audio,
+        chunk_length_s=30,
+        batch_size=get_batch_size(),
+        generate_kwargs=generate_kwargs
+    )
 
-        return _kb_whisper_model, _kb_whisper_processor, _kb_whisper_pipe
+    # Resultat är en dict med "text" key
+    return result.get("text", "")
 
-    except Exception as e:
-        st.error(f"❌ Kunde inte ladda KB-Whisper modell: {e}")
-        st.warning("💡 Kontrollera att transformers och torch är installerade.")
-        return None, None, None
+def _transcribe_shard(pcm_path, dtype, start_sample, end_sample, threads, model_size=None):
+    """
+    Körs i en arbetsprocess: transkribera en del av en lång fil. Delen läses
+    direkt ur den delade PCM-filen, så inga temporära ljudfiler behövs.
+    """
+    import numpy as np
+    from utils.pcm_cache import as_float32, SAMPLE_RATE
+
+    configure_torch_threads(intra_op_threads=threads)
+    with use_kb_whisper_model(size=model_size) as (model, processor, pipe):
+        if pipe is None:
+            return None
+
+        samples = np.memmap(pcm_path, dtype=dtype, mode='r')[start_sample:end_sample]
+        return _run_kb_whisper_pipeline(pipe, {"raw": as_float32(samples), "sampling_rate": SAMPLE_RATE})
 
-def transcribe_with_kb_whisper(audio_file_path: str) -> Optional[str]:
+def plan_kb_whisper_shards(audio_file_path: str, max_shards: int) -> list:
     """
-    Transkribera en ljudfil med KB-Whisper
+    Dela en lång fil vid pauser i upp till KB_WHISPER_SHARDS (högst
+    max_shards) delar som transkriberas i parallella processer. Alla delar
+    läser samma avkodade PCM-fil.
+    Returnerar [(pcm_path, dtype, start_sample, end_sample), ...] eller en
+    tom lista om filen ska transkriberas i en enda process.
+    """
+    import torch
+
+    shards = min(get_shard_count(), max_shards)
+    if shards <= 1 or torch.cuda.is_available():
+        return []
+
+    from utils.audio_segmentation import plan_segments, get_silence_threshold_db, get_min_pause_seconds
+    from utils.pcm_cache import ensure_pcm, load_pcm, detect_silences_pcm, get_pcm_duration, get_pcm_format, SAMPLE_RATE
+
+    duration_seconds = get_pcm_duration(audio_file_path)
+    if duration_seconds < SHARD_MIN_DURATION_SECONDS:
+        return []
+
+    pcm_path = ensure_pcm(audio_file_path)
+    silences = detect_silences_pcm(load_pcm(audio_file_path), get_silence_threshold_db(), get_min_pause_seconds())
+    plan = plan_segments(duration_seconds, silences, duration_seconds / shards, drop_silence_seconds=0)
+
+    dtype = get_pcm_format()['dtype']
+    return [
+        (pcm_path, dtype, int(segment["start"] * SAMPLE_RATE), int(segment["end"] * SAMPLE_RATE))
+        for segment in plan
+    ]
+
+def transcribe_with_kb_whisper(audio_file_path: str, model_size: Optional[str] = None,
+                               use_pcm_cache: bool = True) -> Optional[str]:
+    """
+    Transkribera en ljudfil med KB-Whisper.
+    30-sekunders fönster avkodas i batchar. Uppdelning av långa filer på
+    flera processer sköts av processpoolen (se plan_kb_whisper_shards).
 
     Args:
         audio_file_path: Sökväg till ljudfil
+        model_size: Modellstorlek (default KB_WHISPER_MODEL)
+        use_pcm_cache: Läs den delade PCM-filen (False för temporära filer)
 
     Returns:
-        Transkribering som sträng eller None vid fel
+        Transkribering som sträng, "" om inget tal hittades, eller None vid fel
     """
     try:
         # Ladda modellen (cachas automatiskt)
-        model, processor, pipe = load_kb_whisper_model()
+        with use_kb_whisper_model(size=model_size) as (model, processor, pipe):
+            if pipe is None:
+                return None
 
-        if pipe is None:
-            return None
-
-        # Transkribera med KB-Whisper
-        # chunk_length_s=30 för att hantera långa filer effektivt
-        generate_kwargs = {
-            "task": "transcribe",
-            "language": "sv"
-        }
-
-        with st.spinner(f"🎤 Transkriberar med KB-Whisper..."):
-            result = pipe(
-                audio_file_path,
-                chunk_length_s=30,
-                generate_kwargs=generate_kwargs
-            )
-
-        # Resultat är en dict med "text" key
-        transcription = result.get("text", "")
+            _notify('info', "🎤 Transkriberar med KB-Whisper...")
+            transcription = _run_kb_whisper_pipeline(pipe, _pipeline_input(audio_file_path, use_pcm_cache))
 
         if transcription:
-            st.success("✅ KB-Whisper transkribering klar!")
+            _notify('success', "✅ KB-Whisper transkribering klar!")
             return transcription
         else:
-            st.error("❌ Ingen transkribering genererades")
-            return None
+            _notify('warning', "⚠️ Inget tal hittades i ljudet")
+            return ""
 
     except Exception as e:
-        st.error(f"❌ Fel vid KB-Whisper transkribering: {e}")
+        _notify('error', f"❌ Fel vid KB-Whisper transkribering: {e}")
         return None
 
 def unload_kb_whisper_model():
     """
-    Frigör minne genom att ta bort modellen från RAM/VRAM
-    Använd detta om du vill spara minne när modellen inte används
+    Frigör minne genom att ta bort alla laddade modeller från RAM/VRAM
     """
-    global _kb_whisper_model, _kb_whisper_processor, _kb_whisper_pipe
+    with _registry_lock:
+        unloaded = len(_model_registry)
+        _model_registry.clear()
 
-    if _kb_whisper_model is not None:
-        del _kb_whisper_model
-        del _kb_whisper_processor
-        del _kb_whisper_pipe
+    if unloaded:
+        # Rensa CUDA cache om GPU används
+        _free_memory()
+        _notify('info', "🗑️ KB-Whisper modell borttagen från minnet")
+
+_warmup_state = {
+    "status": "cold",  # cold, warming, warm eller error
+    "started_at": None,
+    "finished_at": None,
+    "seconds": None,
+    "error": None
+}
+_warmup_lock = threading.Lock()
 
-        _kb_whisper_model = None
-        _kb_whisper_processor = None
-        _kb_whisper_pipe = None
+def warm_up_kb_whisper_model() -> float:
+    """
+    Ladda modellen och kör en kort inferens på en sekund tystnad så att
+    vikter och kärnor är initierade innan första riktiga transkribering.
+    Returnerar hur många sekunder uppvärmningen tog.
+    """
+    import numpy as np
 
-        # Rensa CUDA cache om GPU används
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+    started_at = time.perf_counter()
+    with use_kb_whisper_model() as (model, processor, pipe):
+        if pipe is None:
+            raise RuntimeError("Kunde inte ladda KB-Whisper modell")
+
+        pipe(
+            {"raw": np.zeros(16000, dtype=np.float32), "sampling_rate": 16000},
+            generate_kwargs={"task": "transcribe", "language": "sv"}
+        )
+    return time.perf_counter() - started_at
+
+def _run_warmup(runner):
+    try:
+        seconds = runner()
+        with _warmup_lock:
+            _warmup_state.update(status="warm", finished_at=time.time(), seconds=seconds)
+    except Exception as e:
+        with _warmup_lock:
+            _warmup_state.update(status="error", finished_at=time.time(), error=str(e))
 
-        st.info("🗑️ KB-Whisper modell borttagen från minnet")
+def start_kb_whisper_warmup(runner=None) -> bool:
+    """
+    Starta uppvärmning i en bakgrundstråd (högst en gång per process).
+    runner gör själva uppvärmningen - default warm_up_kb_whisper_model i
+    den här processen. Returnerar True om en ny uppvärmning startades.
+    """
+    with _warmup_lock:
+        if _warmup_state["status"] in ("warming", "warm"):
+            return False
+        _warmup_state.update(status="warming", started_at=time.time(), finished_at=None, seconds=None, error=None)
+
+    threading.Thread(
+        target=_run_warmup,
+        args=(runner or warm_up_kb_whisper_model,),
+        name="kb-whisper-warmup",
+        daemon=True
+    ).start()
+    return True
+
+def get_warmup_state() -> dict:
+    """Kopia av uppvärmningens status"""
+    with _warmup_lock:
+        return dict(_warmup_state)
+
+def _get_all_loaded_models() -> list:
+    """Laddade modeller i den här processen och i transkriberingens processpool"""
+    from utils.transcription_worker import get_kb_whisper_worker_models
+    return get_loaded_models() + get_kb_whisper_worker_models()
+
+def _is_default_model_loaded(loaded_models) -> bool:
+    default = (get_kb_whisper_model_size(), get_transcription_style(), get_inference_engine())
+    return any(tuple(model[:3]) == default for model in loaded_models)
+
+def get_kb_whisper_health() -> dict:
+    """
+    Hälsokontroll för KB-Whisper: ok när modellen är uppvärmd och
+    fortfarande laddad i någon process, warming under uppvärmning, cold om
+    den laddas vid första anrop, error om uppvärmningen misslyckades och
+    missing om paketen saknas. Importerar inte torch.
+    """
+    if not is_kb_whisper_available():
+        return {"status": "missing"}
+
+    warmup = get_warmup_state()
+    loaded = _is_default_model_loaded(_get_all_loaded_models())
+    status = {"warm": "ok", "warming": "warming", "error": "error"}.get(warmup["status"], "cold")
+    if status == "ok" and not loaded:
+        # Uppvärmd men frigjord sedan dess (tomgång eller ny process)
+        status = "cold"
+    return {
+        "status": status,
+        "model_id": get_kb_whisper_model_id(),
+        "engine": get_inference_engine(),
+        "loaded": loaded,
+        "warmup_seconds": warmup["seconds"],
+        "error": warmup["error"]
+    }
 
 def is_kb_whisper_available() -> bool:
     """
-    Kontrollera om KB-Whisper dependencies är installerade
+    Kontrollera om KB-Whisper dependencies är installerade. Paketen letas
+    upp utan att importeras så att torch inte laddas i Streamlit-servern.
     """
-    try:
-        import transformers
-        import torch
-        import accelerate
-        import librosa
-        import soundfile
-        return True
-    except ImportError:
-        return False
+    from importlib.util import find_spec
+
+    return all(
+        find_spec(name) is not None
+        for name in ("transformers", "torch", "accelerate", "librosa", "soundfile")
+    )
 
 def get_kb_whisper_info() -> dict:
     """
     Hämta information om KB-Whisper konfigurationen
     """
+    import torch
+
+    loaded_models = _get_all_loaded_models()
     return {
         "available": is_kb_whisper_available(),
         "model_size": get_kb_whisper_model_size(),
         "model_id": get_kb_whisper_model_id(),
         "style": get_transcription_style(),
+        "engine": get_inference_engine(),
         "cuda_available": torch.cuda.is_available() if is_kb_whisper_available() else False,
-        "loaded": _kb_whisper_pipe is not None
+        "loaded": _is_default_model_loaded(loaded_models),
+        "loaded_models": loaded_models,
+        "warm": get_warmup_state()["status"] == "warm",
+        "batch_size": get_batch_size(),
+        "threads": torch.get_num_threads(),
+        "shards": get_shard_count()
     }
@@ -0,0 +1,178 @@
+"""
+Löpande transkribering medan WebRTC-inspelningen pågår
+Ljudet samlas i fönster om några sekunder. Varje fullt fönster klipps i en
+paus, skrivs till en temporär WAV-fil och transkriberas i bakgrunden med
+aktiv backend. När mötet avslutas återstår bara det sista fönstret, så
+transkriberingen är klar några sekunder efter STOP.
+"""
+
+import os
+import time
+import uuid
+import wave
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# Fönstrets slutpunkt flyttas till den tystaste punkten inom de sista sekunderna
+CUT_SEARCH_SECONDS = 2.0
+CUT_FRAME_SECONDS = 0.02
+
+# Kortare rester än så här vid STOP skickas inte till transkribering
+MIN_TAIL_SECONDS = 0.5
+
+
+def is_live_transcription_enabled() -> bool:
+    """Transkribera under inspelning (LIVE_TRANSCRIPTION)"""
+    return os.getenv('LIVE_TRANSCRIPTION', 'true').lower() in ('1', 'true', 'yes')
+
+def get_window_seconds() -> float:
+    """Sekunder nytt ljud per transkriberingsfönster (LIVE_TRANSCRIPTION_WINDOW_SECONDS)"""
+    return max(5.0, float(os.getenv('LIVE_TRANSCRIPTION_WINDOW_SECONDS', '30')))
+
+def _find_cut(samples: np.ndarray) -> int:
+    """Index för den tystaste 20 ms-ramen i slutet av fönstret"""
+    frame_length = int(SAMPLE_RATE * CUT_FRAME_SECONDS)
+    search_start = max(0, len(samples) - int(SAMPLE_RATE * CUT_SEARCH_SECONDS))
+    frame_count = (len(samples) - search_start) // frame_length
+    if frame_count == 0:
+        return len(samples)
+
+    frames = samples[search_start:search_start + frame_count * frame_length].reshape(frame_count, frame_length)
+    peaks = np.maximum(frames.max(axis=1).astype(np.int32), -frames.min(axis=1).astype(np.int32))
+    return search_start + int(np.argmin(peaks)) * frame_length + frame_length // 2
+
+
+class LiveTranscriber:
+    """
+    Tar emot 16 kHz-ljud från inspelningen (se utils/capture_writer.py) och
+    transkriberar det i rullande fönster. Lagras i st.session_state och
+    fångas i frame-callbacken, så att callbacken inte behöver läsa
+    session_state från en annan tråd.
+    """
+
+    def __init__(self, output_dir: str = 'data/audio', window_seconds: Optional[float] = None,
+                 max_workers: int = 2):
+        self.window_seconds = window_seconds or get_window_seconds()
+        self.output_dir = output_dir
+        self.finished = False
+        self.started_at = time.time()
+        self.total_samples = 0
+
+        self._id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_samples = 0
+        self._window_number = 0
+        self._texts = {}
+        self._failed = set()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="live-transcription")
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def add_samples(self, samples: np.ndarray):
+        """Ta emot 16 kHz mono int16 (från WebRTC-tråden) och skicka iväg ett fönster när det är fullt"""
+        with self._lock:
+            if self.finished or len(samples) == 0:
+                return
+            self._pending.append(samples)
+            self._pending_samples += len(samples)
+            self.total_samples += len(samples)
+
+            if self._pending_samples < self.window_seconds * SAMPLE_RATE:
+                return
+
+            window = np.concatenate(self._pending)
+            cut = _find_cut(window)
+            self._pending = [window[cut:]]
+            self._pending_samples = len(window) - cut
+            self._submit(window[:cut])
+
+    def _submit(self, samples):
+        """Lägg ett fönster i transkriberingskön (anropas med låset)"""
+        self._window_number += 1
+        self._futures.append(self._executor.submit(self._transcribe_window, self._window_number, samples))
+
+    def _transcribe_window(self, number, samples):
+        from utils.audio_handler import set_progress_reporter, _transcribe_with_backend
+        from utils.transcription_router import route_transcription
+
+        window_path = os.path.join(self.output_dir, f"live_{self._id}_window_{number}.wav")
+        text = None
+        try:
+            with wave.open(window_path, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(SAMPLE_RATE)
+                wav_file.writeframes(samples.tobytes())
+
+            # Statusmeddelanden från transkriberingen hör inte hemma i sidan här
+            set_progress_reporter(lambda level, message: logger.debug("live window %d: %s", number, message))
+            duration_seconds = len(samples) / SAMPLE_RATE
+            route = route_transcription(window_path, duration_seconds=duration_seconds)
+            # Fönstret är temporärt - ingen PCM-cache eller metadata, och tystnad ger "" (inte fel)
+            text, _ = _transcribe_with_backend(
+                window_path, route["backend"], route["model_size"],
+                temporary=True, duration_seconds=duration_seconds
+            )
+        except Exception:
+            logger.exception("live transcription window %d failed", number)
+        finally:
+            set_progress_reporter(None)
+            if os.path.exists(window_path):
+                os.remove(window_path)
+
+        with self._lock:
+            if text is None:
+                self._failed.add(number)
+            else:
+                self._texts[number] = text.strip()
+
+    def _joined_text(self) -> str:
+        return " ".join(self._texts[n] for n in sorted(self._texts) if self._texts[n])
+
+    def get_transcript(self) -> str:
+        """Transkriberingen hittills"""
+        with self._lock:
+            return self._joined_text()
+
+    @property
+    def recorded_seconds(self) -> float:
+        return self.total_samples / SAMPLE_RATE
+
+    @property
+    def pending_windows(self) -> int:
+        """Antal fönster som väntar på eller håller på med transkribering"""
+        with self._lock:
+            return sum(1 for future in self._futures if not future.done())
+
+    def finish(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Skicka det sista fönstret och vänta in alla transkriberingar.
+        Returnerar hela transkriberingen, eller None om något fönster
+        misslyckades eller inte blev klart inom timeout.
+        """
+        with self._lock:
+            if not self.finished:
+                self.finished = True
+                if self._pending_samples >= MIN_TAIL_SECONDS * SAMPLE_RATE:
+                    self._submit(np.concatenate(self._pending))
+                self._pending = []
+                self._pending_samples = 0
+            futures = list(self._futures)
+
+        done, not_done = wait(futures, timeout=timeout)
+        self._executor.shutdown(wait=False)
+
+        with self._lock:
+            if self._failed or not_done:
+                return None
+            return self._joined_text() or None
@@ -0,0 +1,167 @@
+"""
+Beständig cache för GPT-svar
+Nyckeln är SHA-256 av modell, parametrar (max_tokens, temperature),
+systemprompt och prompt, så samma analys av samma transkribering aldrig
+kostar ett nytt API-anrop. Lagras i SQLite under data/ (överlever omstarter
+och delas mellan processer) och rensas (LRU) när den blir för stor.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Optional
+
+from utils.database import get_connection
+
+_table_ready = False
+
+# Träffar och missar i den här processen
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def is_llm_cache_enabled() -> bool:
+    """Cacha GPT-svar (LLM_CACHE)"""
+    return os.getenv('LLM_CACHE', 'true').lower() in ('1', 'true', 'yes')
+
+def get_llm_cache_max_bytes() -> int:
+    """Max total storlek på cachade svar (LLM_CACHE_MAX_MB)"""
+    return int(float(os.getenv('LLM_CACHE_MAX_MB', '20')) * 1024 * 1024)
+
+def create_llm_cache_table():
+    """Skapa cachetabellen om den inte finns (en gång per process)"""
+    global _table_ready
+    if _table_ready:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT,
+            params TEXT,
+            response TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.commit()
+    conn.close()
+    _table_ready = True
+
+def make_llm_cache_key(model, messages, **params) -> str:
+    """Kombinera modell, meddelanden och parametrar till en cachenyckel"""
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+def get_cached_response(cache_key) -> Optional[str]:
+    """Hämta cachat svar eller None (räknas som träff eller miss)"""
+    if not is_llm_cache_enabled():
+        return None
+
+    create_llm_cache_table()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT response FROM llm_cache WHERE cache_key = ?', (cache_key,))
+    row = cursor.fetchone()
+
+    if row:
+        cursor.execute(
+            'UPDATE llm_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?',
+            (cache_key,)
+        )
+        conn.commit()
+
+    conn.close()
+    _count("hits" if row else "misses")
+    return row[0] if row else None
+
+def store_response(cache_key, model, response, **params):
+    """Spara ett svar i cachen och rensa äldsta poster vid behov"""
+    if not response or not is_llm_cache_enabled():
+        return
+
+    create_llm_cache_table()
+    size_bytes = len(response.encode('utf-8'))
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO llm_cache (cache_key, model, params, response, size_bytes)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (cache_key, model, json.dumps(params, sort_keys=True), response, size_bytes))
+
+    conn.commit()
+    conn.close()
+
+    evict_responses()
+
+def evict_responses(max_bytes=None):
+    """Ta bort minst nyligen använda svar tills cachen ryms inom max_bytes"""
+    max_bytes = get_llm_cache_max_bytes() if max_bytes is None else max_bytes
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM llm_cache')
+    total_bytes = cursor.fetchone()[0]
+
+    if total_bytes > max_bytes:
+        cursor.execute('SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_used_at ASC, created_at ASC')
+        to_delete = []
+        for cache_key, size_bytes in cursor.fetchall():
+            if total_bytes <= max_bytes:
+                break
+            to_delete.append((cache_key,))
+            total_bytes -= size_bytes
+        cursor.executemany('DELETE FROM llm_cache WHERE cache_key = ?', to_delete)
+        conn.commit()
+
+    conn.close()
+
+def clear_llm_cache() -> int:
+    """Töm cachen. Returnerar antal borttagna svar."""
+    create_llm_cache_table()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM llm_cache')
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+def get_llm_cache_stats() -> dict:
+    """Träffar och missar i den här processen samt antal poster och storlek i cachen"""
+    create_llm_cache_table()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hits), 0) FROM llm_cache')
+    entries, size_bytes, total_hits = cursor.fetchone()
+    conn.close()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        "entries": entries,
+        "size_bytes": size_bytes,
+        "total_hits": total_hits,
+    })
+    return stats
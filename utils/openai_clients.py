@@ -0,0 +1,143 @@
+"""
+Gemensamma OpenAI-klienter för hela processen
+En synkron klient delas av alla trådar och en asynkron klient skapas per
+event loop (asyncio.run skapar en ny loop per anrop, och en httpx-anslutning
+kan inte användas i en annan loop). Klienterna håller anslutningar öppna
+(keep-alive), så Whisper-segment och GPT-anrop i samma session återanvänder
+samma TLS-anslutningar i stället för att öppna nya för varje anrop.
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+
+_sync_client = None
+_sync_client_key = None
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+# Stängning av asynkrona klienter som ersatts - referensen hindrar att uppgiften städas bort i förtid
+_closing_tasks = set()
+
+
+def get_max_connections() -> int:
+    """Max antal samtidiga anslutningar per klient (OPENAI_MAX_CONNECTIONS)"""
+    return max(1, int(os.getenv('OPENAI_MAX_CONNECTIONS', '20')))
+
+def get_max_keepalive_connections() -> int:
+    """Antal anslutningar som hålls öppna mellan anrop (OPENAI_MAX_KEEPALIVE)"""
+    return max(0, int(os.getenv('OPENAI_MAX_KEEPALIVE', '10')))
+
+def get_keepalive_expiry() -> float:
+    """Sekunder en oanvänd anslutning hålls öppen (OPENAI_KEEPALIVE_SECONDS)"""
+    return float(os.getenv('OPENAI_KEEPALIVE_SECONDS', '60'))
+
+def get_timeout_seconds() -> float:
+    """Max tid per anrop i sekunder (OPENAI_TIMEOUT_SECONDS) - långa Whisper-uppladdningar behöver gott om tid"""
+    return float(os.getenv('OPENAI_TIMEOUT_SECONDS', '600'))
+
+def get_connect_timeout_seconds() -> float:
+    """Max tid för att öppna en anslutning (OPENAI_CONNECT_TIMEOUT_SECONDS)"""
+    return float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', '10'))
+
+def get_client_max_retries() -> int:
+    """Klientens egna omförsök (OPENAI_MAX_RETRIES) - gäller inte Whisper-segment, som schemaläggaren gör om"""
+    return max(0, int(os.getenv('OPENAI_MAX_RETRIES', '2')))
+
+def _http_options():
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=get_max_connections(),
+        max_keepalive_connections=get_max_keepalive_connections(),
+        keepalive_expiry=get_keepalive_expiry()
+    )
+    timeout = httpx.Timeout(get_timeout_seconds(), connect=get_connect_timeout_seconds())
+    return limits, timeout
+
+def get_openai_client():
+    """
+    Den delade synkrona klienten (skapas vid första anropet, och igen om
+    API-nyckeln ändrats - då stängs den gamla klientens anslutningar)
+    """
+    global _sync_client, _sync_client_key
+    import httpx
+    from openai import OpenAI
+
+    api_key = os.getenv('OPENAI_API_KEY')
+    old_client = None
+    with _clients_lock:
+        if _sync_client is None or _sync_client_key != api_key:
+            limits, timeout = _http_options()
+            old_client = _sync_client
+            _sync_client = OpenAI(
+                api_key=api_key,
+                timeout=timeout,
+                max_retries=get_client_max_retries(),
+                http_client=httpx.Client(limits=limits, timeout=timeout)
+            )
+            _sync_client_key = api_key
+        client = _sync_client
+
+    if old_client is not None:
+        old_client.close()
+    return client
+
+def get_async_openai_client():
+    """
+    Den asynkrona klienten för den event loop som körs. Alla anrop inom
+    samma asyncio.run (t.ex. alla segment i en fil) delar anslutningspool.
+    Kör korutinen med run_async så stängs anslutningarna när loopen är klar.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    api_key = os.getenv('OPENAI_API_KEY')
+    old_entry = None
+    with _clients_lock:
+        entry = _async_clients.get(loop)
+        if entry is None or entry[1] != api_key:
+            limits, timeout = _http_options()
+            old_entry = entry
+            client = AsyncOpenAI(
+                api_key=api_key,
+                timeout=timeout,
+                max_retries=get_client_max_retries(),
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout)
+            )
+            entry = (client, api_key)
+            _async_clients[loop] = entry
+
+    if old_entry is not None:
+        # API-nyckeln har ändrats - stäng den gamla klientens anslutningar i loopen
+        task = loop.create_task(old_entry[0].close())
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+    return entry[0]
+
+def close_openai_client():
+    """Stäng den synkrona klientens anslutningar (t.ex. vid avslut eller i tester)"""
+    global _sync_client, _sync_client_key
+    with _clients_lock:
+        client, _sync_client, _sync_client_key = _sync_client, None, None
+    if client is not None:
+        client.close()
+
+async def close_async_openai_client():
+    """Stäng den asynkrona klienten för den event loop som körs"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        entry = _async_clients.pop(loop, None)
+    if entry is not None:
+        await entry[0].close()
+
+def run_async(coroutine):
+    """asyncio.run som stänger loopens OpenAI-klient när korutinen är klar"""
+    async def runner():
+        try:
+            return await coroutine
+        finally:
+            await close_async_openai_client()
+    return asyncio.run(runner())
@@ -0,0 +1,171 @@
+"""
+Avkodat ljud som delas mellan längdmätning, segmentering och KB-Whisper
+Varje uppladdning avkodas en gång till 16 kHz mono rå-PCM i en fil bredvid
+originalet. Filen läses som en minnesmappad NumPy-array, så tystnadsanalys,
+längd och lokal transkribering arbetar mot samma data utan ny avkodning och
+utan att hela ljudet kopieras in i minnet. Filen tas bort när
+transkriberingen är klar (remove_pcm).
+"""
+
+import os
+import subprocess
+import threading
+from typing import List, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Lagringsformat för PCM-filen: ffmpeg-format, NumPy-typ och fullskala
+PCM_FORMATS = {
+    "float32": {"ffmpeg": "f32le", "dtype": "<f4", "full_scale": 1.0},
+    "int16": {"ffmpeg": "s16le", "dtype": "<i2", "full_scale": 32768.0},
+}
+
+# Analysramens längd i tystnadsanalysen
+SILENCE_FRAME_SECONDS = 0.02
+
+# Antal analysramar som behandlas åt gången i tystnadsanalysen (60 s à 20 ms)
+SILENCE_BLOCK_FRAMES = 3000
+
+_decode_locks = {}
+_decode_locks_lock = threading.Lock()
+
+
+def is_pcm_cache_enabled() -> bool:
+    """Avkoda uppladdningar en gång till en delad PCM-fil (PCM_CACHE)"""
+    return os.getenv('PCM_CACHE', 'true').lower() in ('1', 'true', 'yes')
+
+def get_pcm_format() -> dict:
+    """Lagringsformat (PCM_CACHE_DTYPE): float32 (läses utan kopiering) eller int16 (halva diskutrymmet, kopieras till float32 vid varje läsning)"""
+    return PCM_FORMATS.get(os.getenv('PCM_CACHE_DTYPE', 'float32').lower(), PCM_FORMATS['float32'])
+
+def get_pcm_path(audio_file_path) -> str:
+    """Sökväg till PCM-filen bredvid originalet, t.ex. samtal.m4a.16k.f32le"""
+    return f"{audio_file_path}.16k.{get_pcm_format()['ffmpeg']}"
+
+def remove_pcm(audio_file_path):
+    """Ta bort PCM-filen (i alla lagringsformat) bredvid originalet när den inte behövs längre"""
+    for pcm_format in PCM_FORMATS.values():
+        pcm_path = f"{audio_file_path}.16k.{pcm_format['ffmpeg']}"
+        with _get_decode_lock(pcm_path):
+            for path in (pcm_path, f"{pcm_path}.tmp"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        with _decode_locks_lock:
+            _decode_locks.pop(pcm_path, None)
+
+def pcm_input_args() -> list:
+    """ffmpeg-flaggor som beskriver PCM-filen när den används som indata"""
+    return ['-f', get_pcm_format()['ffmpeg'], '-ar', str(SAMPLE_RATE), '-ac', '1']
+
+def build_decode_command(audio_file_path, output_path, pcm_format=None):
+    """ffmpeg-kommando som avkodar hela filen till 16 kHz mono rå-PCM"""
+    pcm_format = pcm_format or get_pcm_format()
+    return [
+        'ffmpeg',
+        '-i', audio_file_path,
+        '-vn',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        '-f', pcm_format['ffmpeg'],
+        '-y', '-loglevel', 'error',
+        output_path
+    ]
+
+def get_existing_pcm(audio_file_path):
+    """PCM-filens sökväg om den redan finns och är nyare än originalet, annars None"""
+    pcm_path = get_pcm_path(audio_file_path)
+    try:
+        if os.path.getmtime(pcm_path) >= os.path.getmtime(audio_file_path):
+            return pcm_path
+    except OSError:
+        pass
+    return None
+
+def _get_decode_lock(pcm_path):
+    with _decode_locks_lock:
+        return _decode_locks.setdefault(pcm_path, threading.Lock())
+
+def ensure_pcm(audio_file_path) -> str:
+    """
+    Avkoda filen till PCM om det inte redan är gjort och returnera sökvägen.
+    Samtidiga anrop för samma fil väntar på samma avkodning. Filen skrivs
+    först till en temporär fil så att en avbruten avkodning aldrig används.
+    Kastar RuntimeError om ffmpeg misslyckas.
+    """
+    pcm_path = get_pcm_path(audio_file_path)
+
+    with _get_decode_lock(pcm_path):
+        existing = get_existing_pcm(audio_file_path)
+        if existing:
+            return existing
+
+        temp_path = f"{pcm_path}.tmp"
+        result = subprocess.run(
+            build_decode_command(audio_file_path, temp_path),
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise RuntimeError(result.stderr)
+
+        os.replace(temp_path, pcm_path)
+        return pcm_path
+
+def load_pcm(audio_file_path) -> np.memmap:
+    """Ljudet som en skrivskyddad, minnesmappad array (avkodas vid behov)"""
+    return np.memmap(ensure_pcm(audio_file_path), dtype=get_pcm_format()['dtype'], mode='r')
+
+def as_float32(samples) -> np.ndarray:
+    """Samplen som float32 i [-1, 1] - utan kopiering om filen redan lagras som float32"""
+    if samples.dtype == np.float32:
+        return samples
+    return samples.astype(np.float32) / PCM_FORMATS['int16']['full_scale']
+
+def get_pcm_duration(audio_file_path) -> float:
+    """Ljudets längd i sekunder, räknad ur PCM-filens storlek"""
+    pcm_path = ensure_pcm(audio_file_path)
+    bytes_per_sample = np.dtype(get_pcm_format()['dtype']).itemsize
+    return os.path.getsize(pcm_path) / bytes_per_sample / SAMPLE_RATE
+
+def detect_silences_pcm(samples, noise_db: float, min_pause_seconds: float,
+                        frame_seconds: float = SILENCE_FRAME_SECONDS) -> List[Tuple[float, float]]:
+    """
+    Hitta tystnader direkt i PCM-arrayen (motsvarar ffmpeg silencedetect):
+    ramar där toppnivån ligger under noise_db och som tillsammans är minst
+    min_pause_seconds långa. Arrayen behandlas i block så att bara en liten
+    del av ljudet finns som temporär kopia åt gången.
+    Returnerar [(start, slut)] i sekunder.
+    """
+    frame_length = int(SAMPLE_RATE * frame_seconds)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return []
+
+    full_scale = PCM_FORMATS['int16']['full_scale'] if samples.dtype == np.int16 else 1.0
+    threshold = (10 ** (noise_db / 20)) * full_scale
+
+    quiet = np.empty(frame_count, dtype=bool)
+    for first in range(0, frame_count, SILENCE_BLOCK_FRAMES):
+        last = min(frame_count, first + SILENCE_BLOCK_FRAMES)
+        block = samples[first * frame_length:last * frame_length].reshape(-1, frame_length)
+        # max/min i stället för abs: ingen kopia av blocket och inget överspill för int16 -32768
+        peak = np.maximum(block.max(axis=1).astype(np.float32), -block.min(axis=1).astype(np.float32))
+        quiet[first:last] = peak <= threshold
+
+    # Kanter där tystnad börjar (+1) och slutar (-1)
+    edges = np.diff(np.concatenate(([0], quiet.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_frames = min_pause_seconds / frame_seconds
+    total_duration = len(samples) / SAMPLE_RATE
+    return [
+        (start * frame_seconds, min(total_duration, end * frame_seconds))
+        for start, end in zip(starts, ends)
+        if end - start >= min_frames
+    ]
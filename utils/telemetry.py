@@ -0,0 +1,193 @@
+"""
+Mätning av externa anrop (GPT, Whisper-API och KB-Whisper)
+Varje anrop loggas i tabellen call_metrics i SQLite med latens, tokens,
+ljudsekunder, omförsök, cacheträff och fel. Steget anropet gjordes i hämtas
+från sidan (set_telemetry_step) eller, för bakgrundsjobb, från ljudfilens
+namn. Sidan Prestanda visar p50/p95 och genomströmning per steg.
+Loggningen får aldrig stoppa själva anropet - fel här skrivs bara till loggen.
+"""
+
+import os
+import re
+import hmac
+import time
+import logging
+import sqlite3
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from utils.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+_current_step = contextvars.ContextVar('telemetry_step', default=None)
+
+# Sparade ljudfiler heter session_{id}_steg_{n}_...
+STEP_FROM_PATH = re.compile(r'_steg_(\d+)_')
+
+_table_ready = False
+
+
+def is_telemetry_enabled() -> bool:
+    """Logga externa anrop (TELEMETRY)"""
+    return os.getenv('TELEMETRY', 'true').lower() in ('1', 'true', 'yes')
+
+def get_admin_password() -> str:
+    """Lösenord till sidan Prestanda (ADMIN_PASSWORD) - tomt betyder att sidan är avstängd"""
+    return os.getenv('ADMIN_PASSWORD', '')
+
+def is_admin_password(candidate: str) -> bool:
+    """Jämför med ADMIN_PASSWORD i konstant tid"""
+    password = get_admin_password()
+    return bool(password) and hmac.compare_digest(candidate.encode(), password.encode())
+
+def get_retention_days() -> int:
+    """Mätvärden äldre än så här rensas (TELEMETRY_RETENTION_DAYS)"""
+    return max(1, int(os.getenv('TELEMETRY_RETENTION_DAYS', '90')))
+
+def create_call_metrics_table():
+    """Skapa tabellen om den inte finns (en gång per process)"""
+    global _table_ready
+    if _table_ready:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS call_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            service TEXT NOT NULL,
+            operation TEXT NOT NULL,
+            step INTEGER,
+            model TEXT,
+            latency_seconds REAL,
+            first_token_seconds REAL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            audio_seconds REAL,
+            retries INTEGER DEFAULT 0,
+            cache_hit BOOLEAN DEFAULT FALSE,
+            success BOOLEAN DEFAULT TRUE,
+            error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_call_metrics_created ON call_metrics (created_at)')
+
+    # Rensa gamla mätvärden när tabellen öppnas första gången i processen
+    cursor.execute('DELETE FROM call_metrics WHERE created_at < ?',
+                   (time.time() - get_retention_days() * 86400,))
+
+    conn.commit()
+    conn.close()
+    _table_ready = True
+
+def set_telemetry_step(step: Optional[int]):
+    """Ange vilket steg (1-4) efterföljande anrop i den här körningen hör till, None för inget"""
+    _current_step.set(step)
+
+def get_telemetry_step(audio_file_path=None) -> Optional[int]:
+    """Aktuellt steg, annars steget i ljudfilens namn"""
+    step = _current_step.get()
+    if step is None and audio_file_path:
+        match = STEP_FROM_PATH.search(os.path.basename(str(audio_file_path)))
+        if match:
+            step = int(match.group(1))
+    return step
+
+def record_call(service: str, operation: str, latency_seconds: Optional[float] = None,
+                success: bool = True, audio_file_path=None, **fields):
+    """
+    Logga ett anrop. fields kan vara model, first_token_seconds,
+    prompt_tokens, completion_tokens, audio_seconds, retries, cache_hit,
+    error och step (annars aktuellt steg).
+    """
+    if not is_telemetry_enabled():
+        return
+
+    step = fields.pop('step', None) or get_telemetry_step(audio_file_path)
+    error = fields.get('error')
+    try:
+        create_call_metrics_table()
+        conn = get_connection()
+        conn.execute('''
+            INSERT INTO call_metrics
+                (created_at, service, operation, step, model, latency_seconds, first_token_seconds,
+                 prompt_tokens, completion_tokens, audio_seconds, retries, cache_hit, success, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            time.time(), service, operation, step, fields.get('model'), latency_seconds,
+            fields.get('first_token_seconds'), fields.get('prompt_tokens'), fields.get('completion_tokens'),
+            fields.get('audio_seconds'), fields.get('retries') or 0, bool(fields.get('cache_hit')),
+            bool(success), str(error)[:500] if error else None
+        ))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning("could not record call metrics for %s/%s: %s", service, operation, e)
+
+@contextmanager
+def track_call(service: str, operation: str, audio_file_path=None, **fields):
+    """
+    Mät ett anrop: with track_call('openai-chat', 'get_ai_response') as call:
+    Fyll i call (t.ex. call['prompt_tokens']) inne i blocket. Ett undantag
+    loggas som misslyckat anrop och kastas vidare; call['success'] = False
+    markerar ett misslyckande utan undantag.
+    """
+    call = dict(fields)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call['success'] = False
+        call.setdefault('error', e)
+        raise
+    finally:
+        success = call.pop('success', True)
+        record_call(service, operation, time.perf_counter() - started, success=success,
+                    audio_file_path=audio_file_path, **call)
+
+def load_call_metrics(since_seconds: float):
+    """Alla mätvärden från de senaste since_seconds sekunderna som en pandas DataFrame"""
+    import pandas as pd
+
+    create_call_metrics_table()
+    conn = get_connection()
+    try:
+        return pd.read_sql_query(
+            'SELECT * FROM call_metrics WHERE created_at >= ? ORDER BY created_at',
+            conn, params=(time.time() - since_seconds,)
+        )
+    finally:
+        conn.close()
+
+def summarize_call_metrics(metrics, by=("step", "service", "operation")):
+    """
+    Sammanställ mätvärden per grupp: antal anrop, felandel, cacheträffar,
+    p50/p95-latens, tokens, ljudminuter och genomströmning (anrop per timme
+    under perioden med anrop, samt ljudsekunder per sekund latens för Whisper).
+    """
+    if metrics.empty:
+        return metrics
+
+    grouped = metrics.assign(step=metrics["step"].fillna(0).astype(int)).groupby(list(by))
+    summary = grouped.agg(
+        anrop=("id", "count"),
+        fel=("success", lambda s: 1.0 - s.astype(bool).mean()),
+        cacheträffar=("cache_hit", lambda s: s.astype(bool).mean()),
+        p50_s=("latency_seconds", lambda s: s.quantile(0.5)),
+        p95_s=("latency_seconds", lambda s: s.quantile(0.95)),
+        första_token_p50_s=("first_token_seconds", lambda s: s.quantile(0.5)),
+        prompt_tokens=("prompt_tokens", "sum"),
+        svar_tokens=("completion_tokens", "sum"),
+        ljud_min=("audio_seconds", lambda s: s.sum() / 60),
+        latens_sum=("latency_seconds", "sum"),
+        första=("created_at", "min"),
+        sista=("created_at", "max"),
+    )
+    hours = ((summary["sista"] - summary["första"]) / 3600).clip(lower=1 / 60)
+    summary["anrop_per_timme"] = summary["anrop"] / hours
+    summary["ljud_s_per_s"] = (summary["ljud_min"] * 60 / summary["latens_sum"]).where(summary["ljud_min"] > 0)
+    return summary.drop(columns=["latens_sum", "första", "sista"]).reset_index()
@@ -0,0 +1,170 @@
+"""
+Uppdelning av långa transkriberingar i delar för GPT-analys
+Delarna mäts i modellens tokens (tiktoken om det finns installerat, annars
+en försiktig uppskattning ur antalet tecken) och byggs av hela segment
+([Segment N · HH:MM:SS]-block), stycken eller meningar - aldrig mitt i ett
+ord. Budgeten följer modellens kontextfönster, så en transkribering blir så
+få och så fulla anrop som möjligt.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+# Kontextfönster (tokens) för modellerna som används
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Utan tiktoken: svensk text ger fler tokens per tecken än engelska,
+# så uppskattningen räknar hellre för många tokens än för få
+CHARS_PER_TOKEN = 3
+
+# Marginal för systemprompt och meddelandeformat
+PROMPT_OVERHEAD_TOKENS = 100
+
+# Tokens som räknas för radbrytningen/mellanslaget mellan två bitar i en del
+SEPARATOR_TOKENS = 1
+
+SEGMENT_MARKER = re.compile(r'^\[Segment [^\]]*\]', re.MULTILINE)
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+_encoders = {}
+
+
+def get_chunk_max_tokens() -> Optional[int]:
+    """Övre gräns för tokens per del (CHUNK_MAX_TOKENS) - tomt betyder modellens budget"""
+    value = os.getenv('CHUNK_MAX_TOKENS', '').strip()
+    return int(value) if value else None
+
+def get_chunk_overlap_tokens() -> int:
+    """Tokens från slutet av föregående del som upprepas i nästa (CHUNK_OVERLAP_TOKENS)"""
+    return max(0, int(os.getenv('CHUNK_OVERLAP_TOKENS', '0')))
+
+def _get_encoder(model):
+    """tiktoken-kodare för modellen, eller None om tiktoken saknas"""
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoders[model] = None
+    return _encoders[model]
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Antal tokens i texten för given modell"""
+    if not text:
+        return 0
+    encoder = _get_encoder(model)
+    if encoder is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+def get_chunk_token_budget(model: str = "gpt-4", max_tokens: int = 4000, template: str = "") -> int:
+    """
+    Tokens som ryms för transkriberingstext i ett anrop: kontextfönstret
+    minus svarets max_tokens, prompt-mallen och en marginal.
+    CHUNK_MAX_TOKENS kan sänka gränsen ytterligare.
+    """
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    budget = context - max_tokens - count_tokens(template, model) - PROMPT_OVERHEAD_TOKENS
+    configured = get_chunk_max_tokens()
+    if configured:
+        budget = min(budget, configured)
+    return max(200, budget)
+
+def _split_units(text: str) -> List[str]:
+    """Dela texten i segmentblock om markörer finns, annars i stycken"""
+    starts = [match.start() for match in SEGMENT_MARKER.finditer(text)]
+    if starts:
+        if starts[0] > 0:
+            starts.insert(0, 0)
+        blocks = [text[start:end] for start, end in zip(starts, starts[1:] + [len(text)])]
+    else:
+        blocks = re.split(r'\n\s*\n', text)
+    return [block.strip() for block in blocks if block.strip()]
+
+def _split_oversized(unit: str, max_tokens: int, model: str) -> List[str]:
+    """Dela en för stor enhet i meningar, och meningar som ändå är för stora i ord"""
+    pieces = []
+    for sentence in SENTENCE_END.split(unit):
+        if count_tokens(sentence, model) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = []
+        for word in sentence.split():
+            if words and count_tokens(" ".join(words + [word]), model) > max_tokens:
+                pieces.append(" ".join(words))
+                words = []
+            words.append(word)
+        if words:
+            pieces.append(" ".join(words))
+    return pieces
+
+def chunk_text(text: str, max_tokens: int, model: str = "gpt-4", overlap_tokens: int = 0) -> List[str]:
+    """
+    Packa texten i så få delar som möjligt om högst max_tokens vardera.
+    Hela segment/stycken läggs ihop i första hand; bara enheter som inte
+    ryms själva delas i meningar. Med overlap_tokens börjar varje del med
+    de sista meningarna från föregående del, så att sammanhang vid
+    skarvarna inte går förlorat.
+    """
+    if not text or not text.strip():
+        return []
+
+    # (text, tokens, skiljetecken före) - meningar ur samma enhet fortsätter på samma rad
+    pieces = []
+    for unit in _split_units(text):
+        unit_tokens = count_tokens(unit, model)
+        if unit_tokens <= max_tokens:
+            pieces.append((unit, unit_tokens, "\n\n"))
+            continue
+        for index, part in enumerate(_split_oversized(unit, max_tokens - SEPARATOR_TOKENS, model)):
+            pieces.append((part, count_tokens(part, model), "\n\n" if index == 0 else " "))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = piece[1] + SEPARATOR_TOKENS
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(current)
+            current = _overlap_tail(current, overlap_tokens, max_tokens - piece_tokens, model)
+            current_tokens = sum(p[1] + SEPARATOR_TOKENS for p in current)
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(current)
+
+    return [_join(chunk) for chunk in chunks]
+
+def _join(pieces) -> str:
+    return "".join(piece if index == 0 else separator + piece
+                   for index, (piece, _, separator) in enumerate(pieces))
+
+def _overlap_tail(previous, overlap_tokens: int, room: int, model: str):
+    """Sista meningarna i föregående del, högst overlap_tokens (och inom room)"""
+    limit = min(overlap_tokens, room) - SEPARATOR_TOKENS
+    if limit <= 0:
+        return []
+
+    tail = []
+    tokens = 0
+    for sentence in reversed(SENTENCE_END.split(previous[-1][0])):
+        sentence_tokens = count_tokens(sentence, model) + SEPARATOR_TOKENS
+        if tokens + sentence_tokens > limit:
+            break
+        tail.insert(0, sentence)
+        tokens += sentence_tokens
+    if not tail:
+        return []
+    tail_text = " ".join(tail)
+    return [(tail_text, count_tokens(tail_text, model), "\n\n")]
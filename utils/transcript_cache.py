@@ -0,0 +1,191 @@
+"""
+Innehållsadresserad cache för transkriberingar
+Nyckeln är SHA-256 av ljudfilen plus backend, modell och stil, så samma
+inspelning transkriberas bara en gång oavsett filnamn eller steg.
+Lagras i SQLite under data/ och rensas (LRU) när den blir för stor.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from utils.database import get_connection
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+# Hashar som räknats ut när filen sparades, så att de inte behöver räknas om.
+# Nyckeln är (sökväg, ändringstid, storlek) - en överskriven fil räknas om.
+# Minst nyligen använda hashar glöms när fler än MAX_REMEMBERED_HASHES sparats.
+MAX_REMEMBERED_HASHES = 512
+_audio_hashes = OrderedDict()
+_audio_hashes_lock = threading.Lock()
+
+_table_ready = False
+
+def get_cache_max_bytes() -> int:
+    """Max total storlek på cachade transkriberingar (TRANSCRIPT_CACHE_MAX_MB)"""
+    return int(float(os.getenv('TRANSCRIPT_CACHE_MAX_MB', '50')) * 1024 * 1024)
+
+def create_transcript_cache_table():
+    """Skapa cachetabellen om den inte finns (en gång per process)"""
+    global _table_ready
+    if _table_ready:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcript_cache (
+            cache_key TEXT PRIMARY KEY,
+            audio_hash TEXT NOT NULL,
+            backend TEXT,
+            model_id TEXT,
+            style TEXT,
+            transcript TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transcript_cache_audio ON transcript_cache (audio_hash)')
+
+    conn.commit()
+    conn.close()
+    _table_ready = True
+
+def _hash_key(audio_file_path):
+    """(sökväg, ändringstid, storlek) för filen, eller None om den saknas"""
+    path = os.path.abspath(audio_file_path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat.st_mtime_ns, stat.st_size
+
+def register_audio_hash(audio_file_path, audio_hash):
+    """Kom ihåg hashen för en fil som just sparats"""
+    key = _hash_key(audio_file_path)
+    if key is None:
+        return
+    with _audio_hashes_lock:
+        _audio_hashes[key] = audio_hash
+        _audio_hashes.move_to_end(key)
+        while len(_audio_hashes) > MAX_REMEMBERED_HASHES:
+            _audio_hashes.popitem(last=False)
+
+def compute_audio_hash(audio_file_path) -> str:
+    """Strömmande SHA-256 av en fil i 1 MB-bitar"""
+    sha256 = hashlib.sha256()
+    with open(audio_file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def get_audio_hash(audio_file_path) -> str:
+    """Hämta filens hash, från sparningen om filen inte ändrats sedan dess, annars räknas den ut"""
+    key = _hash_key(audio_file_path)
+    with _audio_hashes_lock:
+        audio_hash = _audio_hashes.get(key)
+        if audio_hash is not None:
+            _audio_hashes.move_to_end(key)
+    if audio_hash is None:
+        audio_hash = compute_audio_hash(audio_file_path)
+        register_audio_hash(audio_file_path, audio_hash)
+    return audio_hash
+
+def make_cache_key(audio_hash, backend, model_id, style) -> str:
+    """Kombinera ljudhash och transkriberingsinställningar till en cachenyckel"""
+    return hashlib.sha256(f"{audio_hash}|{backend}|{model_id}|{style}".encode('utf-8')).hexdigest()
+
+def get_cached_transcript(audio_hash, backend, model_id, style) -> Optional[str]:
+    """Hämta cachad transkribering eller None"""
+    create_transcript_cache_table()
+    cache_key = make_cache_key(audio_hash, backend, model_id, style)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT transcript FROM transcript_cache WHERE cache_key = ?', (cache_key,))
+    row = cursor.fetchone()
+
+    if row:
+        cursor.execute(
+            'UPDATE transcript_cache SET last_used_at = CURRENT_TIMESTAMP WHERE cache_key = ?',
+            (cache_key,)
+        )
+        conn.commit()
+
+    conn.close()
+    return row[0] if row else None
+
+def store_transcript(audio_hash, backend, model_id, style, transcript):
+    """Spara en transkribering i cachen och rensa äldsta poster vid behov"""
+    if not transcript:
+        return
+
+    create_transcript_cache_table()
+    cache_key = make_cache_key(audio_hash, backend, model_id, style)
+    size_bytes = len(transcript.encode('utf-8'))
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT OR REPLACE INTO transcript_cache
+            (cache_key, audio_hash, backend, model_id, style, transcript, size_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (cache_key, audio_hash, backend, model_id, style, transcript, size_bytes))
+
+    conn.commit()
+    conn.close()
+
+    evict_transcripts()
+
+def evict_transcripts(max_bytes=None):
+    """Ta bort minst nyligen använda poster tills cachen ryms inom max_bytes"""
+    max_bytes = get_cache_max_bytes() if max_bytes is None else max_bytes
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM transcript_cache')
+    total_bytes = cursor.fetchone()[0]
+
+    if total_bytes > max_bytes:
+        cursor.execute('SELECT cache_key, size_bytes FROM transcript_cache ORDER BY last_used_at ASC, created_at ASC')
+        to_delete = []
+        for cache_key, size_bytes in cursor.fetchall():
+            if total_bytes <= max_bytes:
+                break
+            to_delete.append((cache_key,))
+            total_bytes -= size_bytes
+        cursor.executemany('DELETE FROM transcript_cache WHERE cache_key = ?', to_delete)
+        conn.commit()
+
+    conn.close()
+
+def invalidate_transcripts(audio_hash=None):
+    """
+    Ta bort cachade transkriberingar för en ljudfil (audio_hash),
+    eller hela cachen om ingen hash anges. Returnerar antal borttagna poster.
+    """
+    create_transcript_cache_table()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    if audio_hash:
+        cursor.execute('DELETE FROM transcript_cache WHERE audio_hash = ?', (audio_hash,))
+    else:
+        cursor.execute('DELETE FROM transcript_cache')
+
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
@@ -0,0 +1,66 @@
+"""
+Sammanfogning av transkriberingar från överlappande segment
+När segmenten överlappar med några sekunder finns samma ord i slutet av ett
+segment och i början av nästa. Här hittas den gemensamma ordföljden och
+dubbletterna tas bort så att resultatet blir en sammanhängande text.
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import List
+
+# Ungefärligt taltempo i svenska samtal, används för att välja sökfönster
+WORDS_PER_SECOND = 3.0
+
+_NORMALIZE_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_word(word: str) -> str:
+    """Ordet i gemener utan skiljetecken - används när ord jämförs mellan transkriberingar"""
+    return _NORMALIZE_RE.sub("", word.lower())
+
+def _window_size(overlap_seconds: float) -> int:
+    """Antal ord i slutet/början som jämförs - dubbla överlappet för marginal"""
+    return max(20, int(overlap_seconds * WORDS_PER_SECOND * 2))
+
+def stitch_pair(previous_text: str, next_text: str, overlap_seconds: float, min_match_words: int = 3) -> str:
+    """
+    Slå ihop två överlappande transkriberingar.
+    Skarven läggs mitt i den längsta gemensamma ordföljden, eftersom Whisper
+    oftast gör fel i själva segmentkanterna. Hittas ingen gemensam ordföljd
+    slås texterna ihop oförändrade.
+    """
+    previous_words = previous_text.split()
+    next_words = next_text.split()
+    if not previous_words or not next_words:
+        return " ".join(previous_words + next_words)
+
+    window = _window_size(overlap_seconds)
+    tail = previous_words[-window:]
+    head = next_words[:window]
+    tail_offset = len(previous_words) - len(tail)
+
+    matcher = SequenceMatcher(
+        None,
+        [normalize_word(w) for w in tail],
+        [normalize_word(w) for w in head],
+        autojunk=False
+    )
+    match = matcher.find_longest_match(0, len(tail), 0, len(head))
+
+    if match.size < min_match_words:
+        return " ".join(previous_words + next_words)
+
+    half = match.size // 2
+    cut_previous = tail_offset + match.a + half
+    cut_next = match.b + half
+    return " ".join(previous_words[:cut_previous] + next_words[cut_next:])
+
+def stitch_transcripts(texts: List[str], overlap_seconds: float) -> str:
+    """Slå ihop transkriberingar från på varandra följande, överlappande segment"""
+    stitched = ""
+    for text in texts:
+        if not text:
+            continue
+        stitched = stitch_pair(stitched, text, overlap_seconds) if stitched else text.strip()
+    return stitched
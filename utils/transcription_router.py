@@ -0,0 +1,133 @@
+"""
+Val av transkriberings-backend per jobb
+Med TRANSCRIPTION_BACKEND=auto väljs backend utifrån ljudets längd, hur många
+lokala jobb som redan körs, CPU-belastningen och felfrekvensen mot Whisper-API:t.
+Korta klipp transkriberas lokalt med en liten KB-Whisper-modell, långa möten
+skickas till API:t, och när ena sidan är överbelastad används den andra.
+Varje beslut loggas så att gränserna kan justeras.
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ungefärlig bitrate för komprimerat tal (128 kbit/s) när längden inte kan läsas
+FALLBACK_BYTES_PER_SECOND = 16000
+
+
+def get_local_max_seconds() -> float:
+    """Klipp upp till så här långa transkriberas lokalt (ROUTER_LOCAL_MAX_SECONDS)"""
+    return float(os.getenv('ROUTER_LOCAL_MAX_SECONDS', '300'))
+
+def get_local_model_size() -> str:
+    """KB-Whisper-modell för korta klipp (ROUTER_LOCAL_MODEL)"""
+    return os.getenv('ROUTER_LOCAL_MODEL', 'base')
+
+def get_max_cpu_load() -> float:
+    """CPU-belastning per kärna (1 min) över vilken lokal transkribering undviks (ROUTER_MAX_CPU_LOAD)"""
+    return float(os.getenv('ROUTER_MAX_CPU_LOAD', '0.8'))
+
+def get_max_local_queue_depth() -> int:
+    """Max antal lokala jobb innan nya jobb skickas till API:t (ROUTER_MAX_LOCAL_QUEUE)"""
+    return int(os.getenv('ROUTER_MAX_LOCAL_QUEUE', '2'))
+
+def get_max_api_error_rate() -> float:
+    """Felfrekvens mot Whisper-API:t över vilken lokal transkribering föredras (ROUTER_MAX_API_ERROR_RATE)"""
+    return float(os.getenv('ROUTER_MAX_API_ERROR_RATE', '0.3'))
+
+def get_cpu_load() -> float:
+    """Genomsnittlig belastning senaste minuten per CPU-kärna (0.0 där det inte går att mäta)"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+def _estimate_duration(audio_file_path) -> float:
+    """Ljudets längd i sekunder ur metadataindexet (ffprobe), annars uppskattad från filstorleken"""
+    from utils.audio_metadata import get_audio_metadata
+
+    metadata = get_audio_metadata(audio_file_path)
+    if metadata and metadata.get("duration_seconds"):
+        return metadata["duration_seconds"]
+    return os.path.getsize(audio_file_path) / FALLBACK_BYTES_PER_SECOND
+
+def _is_local_available() -> bool:
+    try:
+        from utils.kb_whisper import is_kb_whisper_available
+        return is_kb_whisper_available()
+    except ImportError:
+        return False
+
+def is_auto_routing_enabled() -> bool:
+    """TRANSCRIPTION_BACKEND=auto"""
+    from utils.audio_handler import get_transcription_backend
+    return get_transcription_backend() == 'auto'
+
+def route_transcription(audio_file_path, local_queue_depth=0, duration_seconds=None) -> dict:
+    """
+    Välj backend för en ljudfil.
+    Returnerar dict med backend ('kb-whisper' eller 'openai'), model_size
+    (KB-Whisper-storlek eller None för standard) och reason.
+    Utan TRANSCRIPTION_BACKEND=auto används den konfigurerade backenden.
+    """
+    from utils.audio_handler import get_transcription_backend
+
+    configured = get_transcription_backend()
+    if configured != 'auto':
+        return {"backend": configured, "model_size": None, "reason": "TRANSCRIPTION_BACKEND", "duration_seconds": duration_seconds}
+
+    from utils.transcription_scheduler import get_api_error_rate
+
+    duration_seconds = _estimate_duration(audio_file_path) if duration_seconds is None else duration_seconds
+    cpu_load = get_cpu_load()
+    api_error_rate = get_api_error_rate()
+
+    local_available = _is_local_available()
+    api_available = bool(os.getenv('OPENAI_API_KEY'))
+    local_saturated = cpu_load > get_max_cpu_load() or local_queue_depth >= get_max_local_queue_depth()
+    api_unhealthy = api_error_rate > get_max_api_error_rate()
+    short_clip = duration_seconds <= get_local_max_seconds()
+
+    if not local_available or not api_available:
+        backend = 'openai' if api_available else 'kb-whisper'
+        reason = "endast en backend tillgänglig"
+    elif short_clip and not local_saturated:
+        backend = 'kb-whisper'
+        reason = "kort klipp"
+    elif short_clip:
+        backend = 'kb-whisper' if api_unhealthy else 'openai'
+        reason = "kort klipp, lokal kö/CPU full" + (" men API:t har fel" if api_unhealthy else "")
+    elif api_unhealthy and not local_saturated:
+        backend = 'kb-whisper'
+        reason = "långt ljud, API:t har hög felfrekvens"
+    else:
+        backend = 'openai'
+        reason = "långt ljud"
+
+    # Korta klipp får den lilla modellen, långa lokala jobb den konfigurerade
+    model_size = get_local_model_size() if backend == 'kb-whisper' and short_clip else None
+
+    logger.info(
+        "transcription route: backend=%s model=%s reason=%s duration=%.0fs local_queue=%d "
+        "cpu_load=%.2f api_error_rate=%.2f file=%s",
+        backend, model_size or 'default', reason, duration_seconds, local_queue_depth,
+        cpu_load, api_error_rate, os.path.basename(audio_file_path)
+    )
+
+    return {"backend": backend, "model_size": model_size, "reason": reason, "duration_seconds": duration_seconds}
+
+def get_failover_backend(backend):
+    """
+    Den andra backenden, dit ett misslyckat jobb flyttas när auto-routing är på.
+    None om den andra backenden inte är tillgänglig.
+    """
+    if backend == 'kb-whisper':
+        return 'openai' if os.getenv('OPENAI_API_KEY') else None
+    return 'kb-whisper' if _is_local_available() else None
+
+def log_failover(audio_file_path, failed_backend, next_backend):
+    logger.warning(
+        "transcription failover: %s failed, retrying with %s file=%s",
+        failed_backend, next_backend, os.path.basename(audio_file_path)
+    )
@@ -0,0 +1,198 @@
+"""
+Schemaläggare för parallell transkribering med Whisper-API
+Begränsar antal samtidiga anrop, sprider ut anropen med en token bucket
+och gör om anrop som misslyckas av tillfälliga orsaker (t.ex. 429)
+med exponentiell backoff och jitter
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+
+def get_max_concurrency() -> int:
+    """Max antal samtidiga Whisper-anrop per transkriberingsjobb"""
+    return max(1, int(os.getenv('TRANSCRIPTION_MAX_CONCURRENCY', '4')))
+
+def get_max_retries() -> int:
+    """Max antal omförsök per segment vid tillfälliga fel"""
+    return max(0, int(os.getenv('TRANSCRIPTION_MAX_RETRIES', '4')))
+
+def get_requests_per_minute() -> float:
+    """Tillåtna Whisper-anrop per minut för hela processen (delas av alla sessioner)"""
+    return max(1.0, float(os.getenv('WHISPER_REQUESTS_PER_MINUTE', '50')))
+
+
+class TokenBucket:
+    """
+    Trådsäker token bucket. Delas mellan alla event loops i processen så att
+    flera rektorer som laddar upp samtidigt tillsammans håller sig under gränsen.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reservera en token och returnera hur många sekunder anroparen ska vänta"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_second
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_whisper_bucket = None
+_whisper_bucket_lock = threading.Lock()
+
+def get_whisper_rate_limiter() -> TokenBucket:
+    """Hämta processens gemensamma token bucket för Whisper-anrop"""
+    global _whisper_bucket
+    with _whisper_bucket_lock:
+        if _whisper_bucket is None:
+            _whisper_bucket = TokenBucket(
+                rate_per_second=get_requests_per_minute() / 60,
+                capacity=get_max_concurrency()
+            )
+        return _whisper_bucket
+
+# Utfall för Whisper-anrop de senaste minuterna: (tidpunkt, lyckades)
+API_ERROR_WINDOW_SECONDS = 300
+_api_results = deque()
+_api_results_lock = threading.Lock()
+
+def record_api_result(success: bool):
+    """Registrera utfallet av ett Whisper-anrop (varje försök räknas)"""
+    now = time.monotonic()
+    with _api_results_lock:
+        _api_results.append((now, success))
+        while _api_results and now - _api_results[0][0] > API_ERROR_WINDOW_SECONDS:
+            _api_results.popleft()
+
+def get_api_error_rate(min_calls: int = 3) -> float:
+    """
+    Andel misslyckade Whisper-anrop under de senaste fem minuterna.
+    Returnerar 0.0 om det gjorts färre än min_calls anrop.
+    """
+    now = time.monotonic()
+    with _api_results_lock:
+        recent = [success for at, success in _api_results if now - at <= API_ERROR_WINDOW_SECONDS]
+    if len(recent) < min_calls:
+        return 0.0
+    return recent.count(False) / len(recent)
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Avgör om ett fel är tillfälligt: rate limit, timeout, nätverksfel
+    eller 5xx från API:t. Övriga fel (t.ex. ogiltig fil) görs inte om.
+    """
+    try:
+        import openai
+        if isinstance(error, (openai.RateLimitError, openai.APITimeoutError,
+                              openai.APIConnectionError, openai.InternalServerError)):
+            return True
+    except ImportError:
+        pass
+
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in (408, 409, 429) or status_code >= 500
+
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+def backoff_delay(attempt: int, error: Optional[Exception] = None, base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Väntetid före nästa försök: exponentiell backoff med full jitter.
+    Respekterar Retry-After från API:t om den finns.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('retry-after') if hasattr(headers, 'get') else None
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TranscriptionScheduler:
+    """
+    Kör transkriberingsanrop med begränsad samtidighet, rate limiting och
+    omförsök. Skapas inuti den event loop som ska köra anropen.
+    Sparar per segment i self.stats: antal försök, latency_seconds (själva
+    anropet, sista försöket), queue_seconds (väntan på en ledig plats) och
+    total_seconds (från kö till svar, inklusive rate limiting och omförsök).
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
+        self.max_concurrency = max_concurrency or get_max_concurrency()
+        self.max_retries = get_max_retries() if max_retries is None else max_retries
+        self.rate_limiter = rate_limiter or get_whisper_rate_limiter()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.stats = {}
+
+    async def run(self, segment_number, operation):
+        """
+        Kör operation() (en coroutine-fabrik) för ett segment.
+        Returnerar resultatet eller kastar sista felet när försöken är slut.
+        """
+        queued_at = time.monotonic()
+        attempt = 0
+
+        async with self._semaphore:
+            queue_seconds = time.monotonic() - queued_at
+            while True:
+                attempt += 1
+                await self.rate_limiter.acquire()
+                call_started_at = time.monotonic()
+                try:
+                    result = await operation()
+                    record_api_result(True)
+                    self._record(segment_number, attempt, queued_at, queue_seconds, call_started_at, None)
+                    return result
+                except Exception as e:
+                    record_api_result(False)
+                    if attempt > self.max_retries or not is_retryable_error(e):
+                        self._record(segment_number, attempt, queued_at, queue_seconds, call_started_at, e)
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt - 1, e))
+
+    def _record(self, segment_number, attempts, queued_at, queue_seconds, call_started_at, error):
+        now = time.monotonic()
+        self.stats[segment_number] = {
+            "attempts": attempts,
+            "latency_seconds": now - call_started_at,
+            "queue_seconds": queue_seconds,
+            "total_seconds": now - queued_at,
+            "error": str(error) if error else None
+        }
+
+    def format_report(self) -> str:
+        """Kort textrapport med försök och latens per segment"""
+        lines = []
+        for segment_number in sorted(self.stats, key=lambda n: n or 0):
+            stat = self.stats[segment_number]
+            status = "fel" if stat["error"] else "ok"
+            lines.append(
+                f"Segment {segment_number}: {stat['attempts']} försök, "
+                f"{stat['latency_seconds']:.1f} s ({status})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,396 @@
+"""
+Bakgrundskö för transkribering
+Transkriberingsjobb körs utanför Streamlits skriptkörning så att sidan
+förblir responsiv och omkörningar inte avbryter jobbet. OpenAI-jobb körs i
+en trådpool (asyncio inuti), KB-Whisper-jobb i en processpool så att den
+lokala modellen inte blockerar servertrådarna. Sidor pollar jobbstatus.
+All KB-Whisper-inferens går genom processpoolen (transcribe_with_kb_whisper_pool).
+"""
+
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Filer större än detta transkriberas segmenterat (samma gräns som i sidorna)
+SEGMENTATION_THRESHOLD_BYTES = 5 * 1024 * 1024
+
+# Hur länge färdiga jobb sparas i minnet för polling
+FINISHED_JOB_TTL_SECONDS = 3600
+
+MAX_JOB_MESSAGES = 50
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_thread_pool = None
+_process_pool = None
+_media_pool = None
+_pools_lock = threading.Lock()
+
+# Uppspelningskopior som skapas eller har skapats: sökväg -> future
+_playback_jobs = {}
+_playback_lock = threading.Lock()
+
+# Senast rapporterade status per KB-Whisper-process (pid -> laddade modeller),
+# skickas med varje resultat från processpoolen
+_worker_status = {}
+_worker_status_lock = threading.Lock()
+
+
+def get_worker_count() -> int:
+    """Antal samtidiga transkriberingsjobb (TRANSCRIPTION_WORKERS)"""
+    return max(1, int(os.getenv('TRANSCRIPTION_WORKERS', '2')))
+
+def get_kb_whisper_process_count() -> int:
+    """Antal processer för KB-Whisper (KB_WHISPER_WORKERS) - varje process laddar en modell"""
+    return max(1, int(os.getenv('KB_WHISPER_WORKERS', '1')))
+
+def _get_thread_pool():
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=get_worker_count(),
+                thread_name_prefix="transcription-worker"
+            )
+        return _thread_pool
+
+def _get_media_pool():
+    global _media_pool
+    with _pools_lock:
+        if _media_pool is None:
+            # En kodning åt gången - uppspelningskopior ska inte konkurrera med transkriberingen
+            _media_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-worker")
+        return _media_pool
+
+def submit_playback_copy(audio_file_path):
+    """
+    Skapa uppspelningskopian för en stor fil i bakgrunden. Samma fil köas
+    bara en gång; en färdig kopia som tagits bort görs om. Ett misslyckat
+    försök görs inte om förrän servern startats om.
+    Returnerar future med kopians sökväg.
+    """
+    from utils.audio_metadata import create_playback_copy, get_existing_playback_copy
+
+    with _playback_lock:
+        future = _playback_jobs.get(audio_file_path)
+        if future is None or (future.done() and future.exception() is None
+                              and not get_existing_playback_copy(audio_file_path)):
+            future = _get_media_pool().submit(create_playback_copy, audio_file_path)
+            _playback_jobs[audio_file_path] = future
+        return future
+
+def get_playback_copy_status(audio_file_path) -> str:
+    """Status för uppspelningskopian: ready, pending eller failed. Startar kodningen om kopian saknas."""
+    from utils.audio_metadata import get_existing_playback_copy
+
+    if get_existing_playback_copy(audio_file_path):
+        return "ready"
+
+    future = submit_playback_copy(audio_file_path)
+    if not future.done():
+        return "pending"
+    return "failed" if future.exception() is not None else "ready"
+
+def _init_kb_whisper_process(processes):
+    """Körs när en KB-Whisper-process startar: processerna delar på minnesbudgeten"""
+    from utils.kb_whisper import set_budget_processes
+    set_budget_processes(processes)
+
+def _get_process_pool():
+    global _process_pool
+    with _pools_lock:
+        if _process_pool is None:
+            # spawn i stället för fork - säkrare med torch och Streamlits trådar
+            _process_pool = ProcessPoolExecutor(
+                max_workers=get_kb_whisper_process_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_kb_whisper_process,
+                initargs=(get_kb_whisper_process_count(),)
+            )
+        return _process_pool
+
+def _reset_process_pool(pool):
+    """Släpp en trasig processpool (t.ex. om en process dött) så att nästa anrop startar en ny"""
+    global _process_pool
+    with _pools_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    with _worker_status_lock:
+        _worker_status.clear()
+    pool.shutdown(wait=False)
+
+def _run_with_messages(function, *args, **kwargs):
+    """
+    Körs i en KB-Whisper-arbetsprocess. Processen saknar Streamlits
+    skriptkontext, så statusmeddelanden samlas i en lista och skickas
+    tillbaka tillsammans med resultatet och processens laddade modeller:
+    (resultat, meddelanden, status).
+    """
+    from utils.audio_handler import set_progress_reporter
+    from utils.kb_whisper import get_loaded_models
+
+    messages = []
+    set_progress_reporter(lambda level, message: messages.append((level, message)))
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        set_progress_reporter(None)
+    status = {"pid": os.getpid(), "loaded_models": get_loaded_models(), "reported_at": time.time()}
+    return result, messages, status
+
+def _replay_messages(messages):
+    """Visa meddelanden från en arbetsprocess i sidan eller i bakgrundsjobbet"""
+    from utils.audio_handler import _notify
+
+    for level, message in messages:
+        _notify(level, message)
+
+def _collect(pool, future):
+    """Vänta på ett anrop i processpoolen, visa dess meddelanden, spara processens status"""
+    try:
+        result, messages, status = future.result()
+    except BrokenProcessPool:
+        _reset_process_pool(pool)
+        raise
+    _replay_messages(messages)
+    with _worker_status_lock:
+        _worker_status[status["pid"]] = status
+    return result
+
+def _run_in_process_pool(function, *args):
+    """Kör function i KB-Whisper-processpoolen och returnera resultatet"""
+    pool = _get_process_pool()
+    return _collect(pool, pool.submit(_run_with_messages, function, *args))
+
+def get_kb_whisper_worker_models() -> list:
+    """
+    Modeller som KB-Whisper-processerna rapporterat som laddade, som
+    (storlek, stil, motor, MB, sekunder sedan senaste användning). Modeller
+    som hunnit frigöras av processens tomgångsgräns sedan rapporten räknas bort.
+    """
+    from utils.kb_whisper import get_idle_timeout_seconds
+
+    idle_timeout = get_idle_timeout_seconds()
+    now = time.time()
+    with _worker_status_lock:
+        statuses = list(_worker_status.values())
+
+    models = []
+    for status in statuses:
+        for size, style, engine, mb, idle in status["loaded_models"]:
+            idle += now - status["reported_at"]
+            if idle_timeout <= 0 or idle <= idle_timeout:
+                models.append((size, style, engine, mb, idle))
+    return models
+
+def _transcribe_in_process(audio_file_path, model_size=None, use_pcm_cache=True):
+    """Körs i en KB-Whisper-arbetsprocess - modellen laddas en gång per process"""
+    from utils.kb_whisper import transcribe_with_kb_whisper, configure_torch_threads
+
+    # Återställ trådantalet om processen senast körde en del av en uppdelad fil
+    configure_torch_threads()
+    return transcribe_with_kb_whisper(audio_file_path, model_size=model_size, use_pcm_cache=use_pcm_cache)
+
+def _transcribe_sharded(shards, model_size=None):
+    """
+    Transkribera delarna av en lång fil parallellt i processpoolen.
+    CPU-kärnorna fördelas mellan de processer som kör samtidigt.
+    """
+    from utils.kb_whisper import _transcribe_shard
+
+    threads = max(1, (os.cpu_count() or 1) // min(len(shards), get_kb_whisper_process_count()))
+    pool = _get_process_pool()
+    futures = [
+        pool.submit(_run_with_messages, _transcribe_shard, pcm_path, dtype, start, end, threads, model_size)
+        for pcm_path, dtype, start, end in shards
+    ]
+
+    texts = [_collect(pool, future) for future in futures]
+
+    if any(text is None for text in texts):
+        return None
+    return " ".join(text.strip() for text in texts if text)
+
+def transcribe_with_kb_whisper_pool(audio_file_path, model_size=None, temporary=False):
+    """
+    Transkribera med KB-Whisper i processpoolen, där modellen hålls laddad
+    mellan anrop. Långa filer delas vid pauser och delarna körs parallellt i
+    poolens processer (KB_WHISPER_SHARDS, högst KB_WHISPER_WORKERS delar).
+    temporary=True (korta fönster under inspelning) läser filen direkt utan
+    PCM-cache och delas aldrig upp.
+    Returnerar transkriberingen ("" om inget tal hittades) eller None vid fel.
+    """
+    from utils.audio_handler import _notify
+    from utils.kb_whisper import plan_kb_whisper_shards
+
+    shards = []
+    if not temporary:
+        try:
+            shards = plan_kb_whisper_shards(audio_file_path, get_kb_whisper_process_count())
+        except Exception:
+            shards = []
+
+    if not shards:
+        return _run_in_process_pool(_transcribe_in_process, audio_file_path, model_size, not temporary)
+
+    _notify('info', f"🎤 Transkriberar med KB-Whisper i {len(shards)} parallella processer...")
+    transcription = _transcribe_sharded(shards, model_size)
+    if transcription:
+        _notify('success', "✅ KB-Whisper transkribering klar!")
+    elif transcription is None:
+        _notify('error', "❌ Fel vid KB-Whisper transkribering")
+    else:
+        _notify('warning', "⚠️ Inget tal hittades i ljudet")
+    return transcription
+
+def _warm_up_in_process():
+    """Körs i en KB-Whisper-arbetsprocess - laddar och värmer upp modellen"""
+    from utils.kb_whisper import warm_up_kb_whisper_model
+    return warm_up_kb_whisper_model()
+
+def is_kb_whisper_preload_enabled() -> bool:
+    """Värm upp KB-Whisper vid serverstart (KB_WHISPER_PRELOAD)"""
+    return os.getenv('KB_WHISPER_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+
+def warm_up_kb_whisper_workers() -> float:
+    """
+    Ladda och värm upp modellen i KB-Whisper-processerna, där uppladdade
+    filer transkriberas. Returnerar längsta uppvärmningstiden i sekunder.
+    """
+    pool = _get_process_pool()
+    futures = [pool.submit(_run_with_messages, _warm_up_in_process) for _ in range(get_kb_whisper_process_count())]
+    return max(_collect(pool, future) for future in futures)
+
+def preload_kb_whisper():
+    """Starta uppvärmning av KB-Whisper-processerna i bakgrunden (en gång per server)"""
+    from utils.kb_whisper import start_kb_whisper_warmup
+    return start_kb_whisper_warmup(runner=warm_up_kb_whisper_workers)
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+def _add_job_message(job_id, level, message):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job["messages"].append((level, message))
+            del job["messages"][:-MAX_JOB_MESSAGES]
+
+def _transcribe_with(job_id, audio_file_path, backend, model_size, segmented):
+    """Kör transkriberingen för ett jobb med given backend"""
+    from utils.audio_handler import transcribe_audio_file, transcribe_large_audio_file
+
+    if segmented is None:
+        segmented = backend == 'openai' and os.path.getsize(audio_file_path) > SEGMENTATION_THRESHOLD_BYTES
+
+    if segmented:
+        return transcribe_large_audio_file(audio_file_path, backend=backend, model_size=model_size)
+    return transcribe_audio_file(audio_file_path, backend=backend, model_size=model_size)
+
+def _run_job(job_id):
+    """Kör ett jobb i en arbetstråd och rapporterar status och meddelanden"""
+    from utils.audio_handler import set_progress_reporter, _remove_decoded_audio
+    from utils.transcription_router import (
+        route_transcription, is_auto_routing_enabled, get_failover_backend, log_failover
+    )
+
+    with _jobs_lock:
+        job = _jobs[job_id]
+        audio_file_path = job["audio_path"]
+        segmented = job["segmented"]
+
+    _update_job(job_id, status="running", started_at=time.time())
+    set_progress_reporter(lambda level, message: _add_job_message(job_id, level, message))
+
+    try:
+        # Backend väljs när jobbet startar, så att aktuell kö och belastning räknas
+        route = route_transcription(audio_file_path, local_queue_depth=get_queue_depth('kb-whisper'))
+        backend = route["backend"]
+        _update_job(job_id, backend=backend)
+        transcript = _transcribe_with(job_id, audio_file_path, backend, route["model_size"], segmented)
+
+        if not transcript and is_auto_routing_enabled():
+            next_backend = get_failover_backend(backend)
+            if next_backend:
+                log_failover(audio_file_path, backend, next_backend)
+                _add_job_message(job_id, 'info', "🔄 Försöker igen med den andra transkriberingstjänsten...")
+                _update_job(job_id, backend=next_backend)
+                transcript = _transcribe_with(job_id, audio_file_path, next_backend, None, None)
+
+        if transcript:
+            _update_job(job_id, status="completed", transcript=transcript, finished_at=time.time())
+        else:
+            _update_job(job_id, status="failed", error="Transkribering misslyckades", finished_at=time.time())
+    except Exception as e:
+        _update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        set_progress_reporter(None)
+        _remove_decoded_audio(audio_file_path)
+
+def _prune_finished_jobs():
+    now = time.time()
+    with _jobs_lock:
+        for job_id in [
+            job_id for job_id, job in _jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > FINISHED_JOB_TTL_SECONDS
+        ]:
+            del _jobs[job_id]
+
+def submit_transcription_job(audio_file_path, segmented=None):
+    """
+    Lägg ett transkriberingsjobb i bakgrundskön.
+    segmented=None väljer segmenterad transkribering (OpenAI) för filer över
+    5 MB, utom med KB-Whisper som hanterar långa filer lokalt. Backend
+    bestäms när jobbet startar (se utils/transcription_router.py).
+    Samma fil som redan ligger i kön eller körs ger samma jobb-id.
+    Returnerar jobb-id.
+    """
+    _prune_finished_jobs()
+
+    with _jobs_lock:
+        for job_id, job in _jobs.items():
+            if job["audio_path"] == audio_file_path and job["status"] in ("queued", "running"):
+                return job_id
+
+        job_id = uuid.uuid4().hex
+        _jobs[job_id] = {
+            "id": job_id,
+            "audio_path": audio_file_path,
+            "segmented": segmented,
+            "backend": None,
+            "status": "queued",
+            "messages": [],
+            "transcript": None,
+            "error": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+
+    _get_thread_pool().submit(_run_job, job_id)
+    return job_id
+
+def get_transcription_job(job_id):
+    """Ögonblicksbild av ett jobb (dict) eller None om det inte finns"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        snapshot["messages"] = list(job["messages"])
+        return snapshot
+
+def get_queue_depth(backend=None) -> int:
+    """Antal jobb som väntar eller körs, eventuellt bara de som körs med given backend"""
+    with _jobs_lock:
+        return sum(
+            1 for job in _jobs.values()
+            if job["status"] in ("queued", "running") and (backend is None or job["backend"] == backend)
+        )
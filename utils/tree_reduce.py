@@ -0,0 +1,111 @@
+"""
+Hierarkisk sammanslagning (tree-reduce) av delresultat
+Delanalyserna grupperas - högst fan_in per grupp och inom en tokenbudget -
+och alla grupper på en nivå sammanfattas samtidigt. Resultaten bildar nästa
+nivå tills ett enda resultat återstår. Djup och tid per nivå rapporteras,
+så att reduce-steget inte längre blir långsammare än map-steget.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Skydd mot oändlig loop om grupperna inte krymper
+MAX_REDUCE_DEPTH = 8
+
+
+def get_reduce_fan_in() -> int:
+    """Max antal delresultat som slås ihop per anrop (REDUCE_FAN_IN)"""
+    return max(2, int(os.getenv('REDUCE_FAN_IN', '4')))
+
+def plan_reduce_groups(items: List[str], fan_in: int, max_tokens: Optional[int] = None,
+                       count_tokens: Optional[Callable[[str], int]] = None) -> List[List[str]]:
+    """
+    Dela items i grupper i ordning: högst fan_in per grupp och, om
+    max_tokens anges, högst så många tokens sammanlagt. Ett item som
+    ensamt överskrider budgeten blir en egen grupp.
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        tokens = count_tokens(item) if max_tokens and count_tokens else 0
+        if current and (len(current) >= fan_in or (max_tokens and current_tokens + tokens > max_tokens)):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+async def tree_reduce(
+    items: List[str],
+    reduce_group: Callable[[List[str], int, bool], Awaitable[Optional[str]]],
+    fan_in: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    reduce_final: bool = True,
+) -> Tuple[Union[Optional[str], List[str]], List[dict]]:
+    """
+    Slå ihop items nivå för nivå tills ett resultat återstår.
+    reduce_group(grupp, nivå, final) anropas samtidigt för alla grupper på en
+    nivå; final är True för det sista anropet. Grupper som misslyckas (None
+    eller undantag) hoppas över.
+    Returnerar (resultat, nivåer) där varje nivå är en dict med level,
+    inputs, groups, failed och seconds. Resultatet är None om allt misslyckades.
+    Med reduce_final=False görs inte det sista anropet - resultatet är då
+    listan med delresultat som ska slås ihop sist (t.ex. för att strömmas).
+    """
+    fan_in = fan_in or get_reduce_fan_in()
+    levels = []
+    level = 0
+
+    # Minst en nivå - även ett enda delresultat sammanfattas till slutformat
+    while items and (len(items) > 1 or level == 0):
+        level += 1
+        groups = plan_reduce_groups(items, fan_in, max_tokens, count_tokens)
+        if (level > 1 and len(groups) == len(items) > 1) or level > MAX_REDUCE_DEPTH:
+            # Budgeten släpper inte igenom två resultat åt gången - para ihop ändå
+            groups = plan_reduce_groups(items, 2)
+
+        final = len(groups) == 1
+        if final and not reduce_final:
+            return groups[0], levels
+
+        async def run(group):
+            # Ett ensamt mellanresultat är redan sammanfattat - det följer med till nästa nivå
+            if len(group) == 1 and level > 1 and not final:
+                return group[0]
+            return await reduce_group(group, level, final)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(run(group) for group in groups), return_exceptions=True)
+        seconds = time.perf_counter() - started
+
+        next_items = []
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("reduce level %d group %d failed: %s", level, index + 1, result)
+            elif result:
+                next_items.append(result)
+
+        levels.append({
+            "level": level,
+            "inputs": len(items),
+            "groups": len(groups),
+            "failed": len(groups) - len(next_items),
+            "seconds": seconds,
+        })
+        logger.info("reduce level %d: %d inputs -> %d groups (%d failed) in %.1fs",
+                    level, len(items), len(groups), len(groups) - len(next_items), seconds)
+        items = next_items
+
+    if not reduce_final:
+        return items, levels
+    return (items[0] if items else None), levels